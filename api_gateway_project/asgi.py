@@ -3,6 +3,10 @@ ASGI config for api_gateway_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Served by an ASGI server such as ``uvicorn api_gateway_project.asgi:application``
+the gateway middleware proxies requests on the event loop with httpx (install
+the ``async`` extra), so slow upstreams don't tie up worker threads.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -68,6 +68,103 @@ MIDDLEWARE = [
     "django_htmx.middleware.HtmxMiddleware",
 ]
 
+# API Gateway settings
+# How often each worker checks whether another process changed the routing
+# configuration, in milliseconds
+GATEWAY_CONFIG_CHECK_INTERVAL_MS = 1000
+
+# API logs are written in batches by a background thread. A batch is written
+# once GATEWAY_LOG_BATCH_SIZE entries are queued or
+# GATEWAY_LOG_FLUSH_INTERVAL_MS after the first one. When the queue is full,
+# entries are dropped ("drop") or the request waits up to
+# GATEWAY_LOG_BLOCK_TIMEOUT_MS for room ("block").
+GATEWAY_LOG_ASYNC = True
+GATEWAY_LOG_QUEUE_SIZE = 10000
+GATEWAY_LOG_BATCH_SIZE = 100
+GATEWAY_LOG_FLUSH_INTERVAL_MS = 500
+GATEWAY_LOG_QUEUE_FULL = "drop"
+GATEWAY_LOG_BLOCK_TIMEOUT_MS = 100
+
+# Responses of endpoints with a cache_ttl are cached in a per-process LRU
+# ("local", bounded by GATEWAY_CACHE_MAX_ENTRIES and GATEWAY_CACHE_MAX_BYTES)
+# or in the Django cache named by GATEWAY_CACHE_ALIAS ("django").
+GATEWAY_CACHE_BACKEND = "local"
+GATEWAY_CACHE_ALIAS = "default"
+GATEWAY_CACHE_MAX_ENTRIES = 1000
+GATEWAY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Expired entries with an ETag or Last-Modified header are kept this many
+# seconds longer, so they can be revalidated instead of downloaded again
+GATEWAY_CACHE_REVALIDATE_FOR = 3600
+
+# JSON codec for bodies and logs: "auto" uses orjson when it is installed
+# (pip install .[json]) and the standard library otherwise, "orjson" or
+# "json" pick one explicitly
+GATEWAY_JSON_CODEC = "auto"
+
+# Requests over an endpoint's or domain's max_concurrent_requests wait at most
+# GATEWAY_ADMISSION_QUEUE_TIMEOUT_MS behind at most GATEWAY_ADMISSION_QUEUE_SIZE
+# others, then get a 503 with a Retry-After of GATEWAY_ADMISSION_RETRY_AFTER
+# seconds
+GATEWAY_ADMISSION_QUEUE_SIZE = 10
+GATEWAY_ADMISSION_QUEUE_TIMEOUT_MS = 100
+GATEWAY_ADMISSION_RETRY_AFTER = 1
+
+# Each upstream host has a circuit breaker. It opens when at least
+# GATEWAY_BREAKER_MIN_REQUESTS requests in the last GATEWAY_BREAKER_WINDOW
+# seconds were answered and GATEWAY_BREAKER_FAILURE_RATIO of them failed
+# (connection errors, timeouts, 500, 502, 503, 504). Requests then get an
+# immediate 503 until, after GATEWAY_BREAKER_OPEN_SECONDS, GATEWAY_BREAKER_PROBES
+# probe requests are let through to decide whether it closes again.
+GATEWAY_BREAKER_ENABLED = True
+GATEWAY_BREAKER_FAILURE_RATIO = 0.5
+GATEWAY_BREAKER_WINDOW = 30
+GATEWAY_BREAKER_MIN_REQUESTS = 10
+GATEWAY_BREAKER_OPEN_SECONDS = 30
+GATEWAY_BREAKER_PROBES = 1
+
+# Upstream pools with the "ewma" strategy weigh response times by their age,
+# a sample's weight halves roughly every 0.7 * GATEWAY_BALANCER_EWMA_DECAY
+# seconds
+GATEWAY_BALANCER_EWMA_DECAY = 10
+
+# Targets of upstream pools are taken out of rotation after
+# GATEWAY_HEALTH_MAX_FAILURES consecutive 5xx responses, timeouts or
+# connection errors (0 never ejects), for GATEWAY_HEALTH_EJECTION_SECONDS.
+# Pools with a health_check_path are also checked by a background thread
+# (GATEWAY_HEALTH_CHECKS); GATEWAY_HEALTH_UNHEALTHY_PROBES failed checks, each
+# given GATEWAY_HEALTH_CHECK_TIMEOUT seconds, take a target out until a check
+# passes. Targets back in rotation get their full weight over
+# GATEWAY_HEALTH_SLOW_START_SECONDS.
+GATEWAY_HEALTH_MAX_FAILURES = 5
+GATEWAY_HEALTH_EJECTION_SECONDS = 30
+GATEWAY_HEALTH_CHECKS = True
+GATEWAY_HEALTH_UNHEALTHY_PROBES = 2
+GATEWAY_HEALTH_CHECK_TIMEOUT = 2
+GATEWAY_HEALTH_SLOW_START_SECONDS = 30
+
+# Endpoints with retry_max_attempts above 1 retry failed upstream requests
+# after a randomized backoff of at most GATEWAY_RETRY_BACKOFF_MAX_MS. Over the
+# last GATEWAY_RETRY_BUDGET_WINDOW seconds, retries can't exceed
+# GATEWAY_RETRY_BUDGET_RATIO of the requests plus
+# GATEWAY_RETRY_BUDGET_MIN_RETRIES, so an outage isn't made worse by them.
+GATEWAY_RETRY_BACKOFF_MAX_MS = 2000
+GATEWAY_RETRY_BUDGET_RATIO = 0.1
+GATEWAY_RETRY_BUDGET_MIN_RETRIES = 10
+GATEWAY_RETRY_BUDGET_WINDOW = 10
+
+# Endpoints with hedge_requests and no hedge_delay_ms hedge requests slower
+# than the GATEWAY_HEDGE_PERCENTILE of their last GATEWAY_HEDGE_SAMPLES
+# response times, once GATEWAY_HEDGE_MIN_SAMPLES are known. Hedges are taken
+# from the retry budget.
+GATEWAY_HEDGE_PERCENTILE = 95
+GATEWAY_HEDGE_SAMPLES = 200
+GATEWAY_HEDGE_MIN_SAMPLES = 20
+
+# Header in which clients send how many milliseconds they will wait for an
+# answer. It shortens the endpoint's timeout, and each upstream attempt
+# forwards what is left in the same header. None to ignore it.
+GATEWAY_DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -0,0 +1,63 @@
+"""
+CPU cost of the JSON codecs on payloads the gateway handles.
+
+Parses and serializes representative payloads with the standard library
+and with orjson, the two backends GATEWAY_JSON_CODEC can pick: a small
+request body, a header dict as stored in ApiLog, a breed list and TheCatAPI
+image search results.
+
+Run with: python benchmarks/bench_json_codec.py
+"""
+
+import json
+
+from common import cat_images, cpu_time, report, setup_django
+
+setup_django()
+
+from gateway.codec import OrjsonCodec, StdlibCodec, orjson  # noqa: E402
+
+PAYLOADS = {
+    "request body": {"query": "cats", "limit": 10, "breed_ids": ["beng", "abys"]},
+    "log headers": {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "User-Agent": "python-requests/2.32.3",
+        "X-Request-Id": "0f8fad5b-d9cb-469f-a165-70867728950e",
+        "Cache-Control": "max-age=60",
+    },
+    "breed list": [image["breeds"][0] for image in cat_images(67)],
+    "100 images": cat_images(100),
+    "5000 images": cat_images(5000),
+}
+
+
+def main():
+    codecs = [StdlibCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    else:
+        print("orjson is not installed, only the standard library is measured\n")
+
+    rows = []
+    for name, payload in PAYLOADS.items():
+        encoded = json.dumps(payload).encode()
+        # Small payloads need more runs to be measurable
+        runs = max(1, 200000 // len(encoded))
+
+        results = []
+        for item in codecs:
+            loads = cpu_time(lambda: [item.loads(encoded) for _ in range(runs)])
+            dumps = cpu_time(lambda: [item.dumps(payload) for _ in range(runs)])
+            results.append(
+                f"{item.name:6s} loads {loads / runs * 1e6:9.2f} us  "
+                f"dumps {dumps / runs * 1e6:9.2f} us"
+            )
+
+        rows.append((f"{name} ({len(encoded) / 1024:.1f} KiB)", "  |  ".join(results)))
+
+    report("JSON codecs", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+CPU cost of forwarding JSON upstream responses.
+
+Compares the old behaviour, which parsed every JSON response and dumped it
+again, with the raw byte passthrough used for endpoints without response
+transformations.
+
+Run with: python benchmarks/bench_json_passthrough.py
+"""
+
+import json
+
+from common import cat_images, cpu_time, report, setup_django
+
+setup_django()
+
+import requests  # noqa: E402
+from gateway.middleware import ApiGatewayMiddleware  # noqa: E402
+
+
+def upstream_response(content):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def reserialize(response):
+    """What _read_response did before: parse and dump every JSON body"""
+    return json.dumps(response.json())
+
+
+def main():
+    middleware = ApiGatewayMiddleware(lambda request: None)
+    rows = []
+
+    for count in (100, 1000, 5000):
+        content = json.dumps(cat_images(count)).encode()
+        response = upstream_response(content)
+        megabytes = len(content) / (1024 * 1024)
+
+        before = cpu_time(lambda: reserialize(response))
+        after = cpu_time(lambda: middleware._read_response(response))
+        saved = (before - after) / megabytes * 1000
+
+        rows.append(
+            (
+                f"{len(content) / 1024:8.0f} KiB",
+                f"reserialize {before * 1000:8.3f} ms  "
+                f"passthrough {after * 1000:8.3f} ms  "
+                f"saved {saved:7.2f} ms CPU per MB",
+            )
+        )
+
+    report("JSON response passthrough", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+CPU cost of mapping a field across every element of a large list response.
+
+Compares one rule per element ("0.breeds.0.name" -> "0.breed", "1.breeds..."),
+the only way to do this before wildcard paths, with a single wildcard rule
+("*.breeds.0.name" -> "*.breed") walked over the whole list in one pass.
+
+Run with: python benchmarks/bench_wildcard_transformations.py
+"""
+
+from common import cat_images, cpu_time, report, setup_django
+
+setup_django()
+
+from gateway.models import ResponseTransformation  # noqa: E402
+from gateway.transformations import TransformationPlan  # noqa: E402
+
+
+def rule(source, target):
+    return ResponseTransformation(
+        source_field=source, target_field=target, transformation_type="direct"
+    )
+
+
+def main():
+    rows = []
+
+    for count in (100, 1000, 10000):
+        body = cat_images(count)
+        rules = [rule(f"{i}.breeds.0.name", f"{i}.breed") for i in range(count)]
+        per_index = TransformationPlan(rules)
+        wildcard = TransformationPlan([rule("*.breeds.0.name", "*.breed")])
+
+        # Compiling happens once per routing table load, applying per request
+        compile_time = cpu_time(lambda: TransformationPlan(rules), repeat=5)
+        before = cpu_time(lambda: per_index.apply_to_response(body), repeat=5)
+        after = cpu_time(lambda: wildcard.apply_to_response(body), repeat=5)
+
+        rows.append(
+            (
+                f"{count:6d} items",
+                f"per-index rules {before * 1000:9.3f} ms "
+                f"(+{compile_time * 1000:8.3f} ms to compile)  "
+                f"wildcard rule {after * 1000:8.3f} ms  "
+                f"speedup {before / after:6.1f}x",
+            )
+        )
+
+    report("Transformation across a list response", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Shared helpers for the gateway benchmarks."""
+
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    """Configure Django so gateway modules can be imported"""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api_gateway_project.settings")
+
+    import django
+
+    django.setup()
+
+
+def cat_images(count):
+    """Build a list shaped like a TheCatAPI /images/search response"""
+    return [
+        {
+            "id": f"img{i:06d}",
+            "url": f"https://cdn2.thecatapi.com/images/img{i:06d}.jpg",
+            "width": 500 + i % 300,
+            "height": 300 + i % 200,
+            "breeds": [
+                {
+                    "id": "beng",
+                    "name": "Bengal",
+                    "temperament": "Alert, Agile, Energetic, Demanding, Intelligent",
+                    "origin": "United States",
+                    "life_span": "12 - 15",
+                    "weight": {"imperial": "6 - 12", "metric": "3 - 7"},
+                }
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def cpu_time(func, repeat=20):
+    """Return the best CPU time of several runs of func, in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        func()
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(title, rows):
+    """Print benchmark results as an aligned table"""
+    print(title)
+    width = max(len(name) for name, _ in rows)
+    for name, value in rows:
+        print(f"  {name.ljust(width)}  {value}")
+    print()
@@ -5,6 +5,8 @@ from .models import (
     RequestTransformation,
     ResponseTransformation,
     ApiLog,
+    UpstreamPool,
+    UpstreamTarget,
 )
 
 
@@ -18,9 +20,31 @@ class ResponseTransformationInline(admin.TabularInline):
     extra = 1
 
 
+class UpstreamTargetInline(admin.TabularInline):
+    model = UpstreamTarget
+    extra = 1
+
+
+@admin.register(UpstreamPool)
+class UpstreamPoolAdmin(admin.ModelAdmin):
+    list_display = ("name", "strategy", "health_check_path", "created_at", "updated_at")
+    list_filter = ("strategy",)
+    search_fields = ("name", "description")
+    readonly_fields = ("created_at", "updated_at")
+    inlines = [UpstreamTargetInline]
+
+
 @admin.register(Domain)
 class DomainAdmin(admin.ModelAdmin):
-    list_display = ("name", "base_url", "is_active", "created_at", "updated_at")
+    list_display = (
+        "name",
+        "base_url",
+        "is_active",
+        "pool_maxsize",
+        "max_concurrent_requests",
+        "created_at",
+        "updated_at",
+    )
     list_filter = ("is_active",)
     search_fields = ("name", "base_url", "description")
     readonly_fields = ("created_at", "updated_at")
@@ -102,6 +126,8 @@ class ApiLogAdmin(admin.ModelAdmin):
         "response_headers",
         "response_body",
         "execution_time",
+        "queue_time",
+        "retries",
         "created_at",
     )
 
@@ -0,0 +1,242 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from django.conf import settings
+
+
+class _Waiter:
+    """A request waiting for a slot, woken by release()"""
+
+    __slots__ = ("granted", "event", "loop", "future")
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+            self.future = None
+        else:
+            self.event = None
+            self.future = loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class ConcurrencyLimit:
+    """
+    Caps the requests in flight to one endpoint or domain.
+
+    Requests over the limit wait in a FIFO queue of at most queue_size
+    entries, for at most the time they are given; a freed slot is handed to
+    the oldest waiter. Requests that find the queue full or time out are
+    rejected. Threads and event loops can share one limit.
+    """
+
+    def __init__(self, limit):
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self.limit = limit
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.queue_time = 0.0
+
+    def _try_acquire(self, queue_size, loop=None):
+        """Take a free slot, or queue a waiter and return it, or return False"""
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if len(self._waiters) >= queue_size:
+                self.rejected += 1
+                return False
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            self.queued += 1
+        # A slot may have been freed, or the limit raised, meanwhile
+        self._hand_over()
+        return waiter
+
+    def acquire(self, timeout, queue_size):
+        """Wait up to timeout seconds for a slot, returns whether one was taken"""
+        waiter = self._try_acquire(queue_size)
+        if isinstance(waiter, bool):
+            return waiter
+
+        start = time.monotonic()
+        waiter.event.wait(timeout)
+        return self._finish_wait(waiter, start)
+
+    async def aacquire(self, timeout, queue_size):
+        """Async version of acquire"""
+        waiter = self._try_acquire(queue_size, asyncio.get_running_loop())
+        if isinstance(waiter, bool):
+            return waiter
+
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # Cancelled, give back a slot that was handed over meanwhile
+            if self._finish_wait(waiter, start):
+                self.release()
+            raise
+        return self._finish_wait(waiter, start)
+
+    def _finish_wait(self, waiter, start):
+        with self._lock:
+            self.queue_time += time.monotonic() - start
+            if waiter.granted:
+                self.admitted += 1
+                return True
+            self._waiters.remove(waiter)
+            self.rejected += 1
+            return False
+
+    def _hand_over(self):
+        """Give free slots to the oldest waiters"""
+        with self._lock:
+            woken = []
+            while self._waiters and self.in_flight < self.limit:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self.in_flight += 1
+                woken.append(waiter)
+        for waiter in woken:
+            waiter.wake()
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._hand_over()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "queue_time": self.queue_time,
+        }
+
+
+class Admission:
+    """The slots one request holds, released once when it is done"""
+
+    def __init__(self, limits, queue_time):
+        self.limits = limits
+        # Seconds the request waited for its slots, None without limits
+        self.queue_time = queue_time
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            for limit in self.limits:
+                limit.release()
+
+
+class AdmissionControl:
+    """
+    Per-endpoint and per-domain concurrency limits.
+
+    An endpoint's max_concurrent_requests caps its own requests in flight,
+    a domain's caps those of all its endpoints together; 0 means unlimited.
+    A request over a limit waits at most GATEWAY_ADMISSION_QUEUE_TIMEOUT_MS
+    in total, behind at most GATEWAY_ADMISSION_QUEUE_SIZE other requests,
+    and is rejected otherwise. Each domain has its own limits, so a slow
+    upstream only holds the slots of its own endpoints.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits = {}
+
+    def _limit(self, key, limit):
+        entry = self._limits.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._limits.setdefault(key, ConcurrencyLimit(limit))
+        # Limit changes apply without dropping the counts in flight
+        entry.limit = limit
+        return entry
+
+    def limits_for(self, endpoint):
+        """Return the limits a request to the endpoint must pass, narrowest first"""
+        limits = []
+        if endpoint.max_concurrent_requests:
+            limits.append(
+                self._limit(("endpoint", endpoint.pk), endpoint.max_concurrent_requests)
+            )
+        domain = endpoint.domain
+        if domain is not None and domain.max_concurrent_requests:
+            limits.append(
+                self._limit(("domain", domain.pk), domain.max_concurrent_requests)
+            )
+        return limits
+
+    def _queue_settings(self):
+        timeout = getattr(settings, "GATEWAY_ADMISSION_QUEUE_TIMEOUT_MS", 100) / 1000
+        queue_size = getattr(settings, "GATEWAY_ADMISSION_QUEUE_SIZE", 10)
+        return timeout, queue_size
+
+    def admit(self, endpoint):
+        """Take a slot of every limit of the endpoint, or return None"""
+        timeout, queue_size = self._queue_settings()
+        start = time.monotonic()
+        acquired = []
+        for limit in self.limits_for(endpoint):
+            remaining = max(timeout - (time.monotonic() - start), 0)
+            if not limit.acquire(remaining, queue_size):
+                Admission(acquired, 0).release()
+                return None
+            acquired.append(limit)
+        return Admission(acquired, time.monotonic() - start if acquired else None)
+
+    async def aadmit(self, endpoint):
+        """Async version of admit"""
+        timeout, queue_size = self._queue_settings()
+        start = time.monotonic()
+        acquired = []
+        try:
+            for limit in self.limits_for(endpoint):
+                remaining = max(timeout - (time.monotonic() - start), 0)
+                if not await limit.aacquire(remaining, queue_size):
+                    Admission(acquired, 0).release()
+                    return None
+                acquired.append(limit)
+        except BaseException:
+            Admission(acquired, 0).release()
+            raise
+        return Admission(acquired, time.monotonic() - start if acquired else None)
+
+    def stats(self, kind, obj):
+        """Return the counters of the limit of an endpoint or domain"""
+        entry = self._limits.get((kind, obj.pk))
+        if entry is None:
+            # No request has been limited yet
+            entry = ConcurrencyLimit(obj.max_concurrent_requests)
+        return entry.stats()
+
+    def clear(self):
+        with self._lock:
+            self._limits.clear()
+
+
+admission_control = AdmissionControl()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GatewayConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "gateway"
+
+    def ready(self):
+        # Register the signal handlers that keep the routing table current
+        from . import signals  # noqa: F401
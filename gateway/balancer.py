@@ -0,0 +1,324 @@
+import math
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+from django.conf import settings
+
+
+def endpoint_pool(endpoint):
+    """Return the upstream pool of an endpoint, its own or its domain's"""
+    if endpoint.upstream_pool_id is not None:
+        return endpoint.upstream_pool
+    domain = endpoint.domain
+    if domain is not None and domain.upstream_pool_id is not None:
+        return domain.upstream_pool
+    return None
+
+
+def pool_targets(pool):
+    """Return the active targets of a pool, preloaded by the routing table"""
+    targets = getattr(pool, "active_targets", None)
+    if targets is None:
+        targets = list(pool.targets.filter(is_active=True).order_by("id"))
+    return targets
+
+
+class TargetState:
+    """One replica of a pool and what the balancer knows about it"""
+
+    __slots__ = (
+        "url",
+        "weight",
+        "scheme",
+        "netloc",
+        "path",
+        "outstanding",
+        "requests",
+        "ewma",
+        "ewma_at",
+        "current_weight",
+        "probe_healthy",
+        "failures",
+        "probe_failures",
+        "ejected_until",
+        "ejections",
+        "recovered_at",
+        "last_probe",
+    )
+
+    def __init__(self, url, weight):
+        self.url = url
+        self.weight = weight
+        base = urlsplit(url)
+        self.scheme = base.scheme
+        self.netloc = base.netloc
+        self.path = base.path.rstrip("/")
+        # Requests sent and not answered yet
+        self.outstanding = 0
+        self.requests = 0
+        # Decaying average of the response time in seconds, None until the
+        # first response
+        self.ewma = None
+        self.ewma_at = 0.0
+        # Smooth weighted round robin counter
+        self.current_weight = 0
+        # Whether the last active health checks passed
+        self.probe_healthy = True
+        # Consecutive failed responses and failed probes
+        self.failures = 0
+        self.probe_failures = 0
+        # Passive ejection ends at this time, None when not ejected
+        self.ejected_until = None
+        self.ejections = 0
+        # When the target got back into rotation, for slow-start
+        self.recovered_at = None
+        # Status code or error of the last active health check
+        self.last_probe = None
+
+    def resolve(self, url):
+        """Point an endpoint's target URL to this replica"""
+        parts = urlsplit(url)
+        return urlunsplit(
+            (
+                self.scheme,
+                self.netloc,
+                self.path + parts.path,
+                parts.query,
+                parts.fragment,
+            )
+        )
+
+    def observe(self, latency, now, decay):
+        """Fold a response time into the EWMA, old samples fade over decay seconds"""
+        if self.ewma is None:
+            self.ewma = latency
+        else:
+            alpha = 1 - math.exp(-(now - self.ewma_at) / decay) if decay else 1
+            # At least a small weight so bursts within one instant still count
+            alpha = max(alpha, 0.1)
+            self.ewma += alpha * (latency - self.ewma)
+        self.ewma_at = now
+
+    def is_available(self, now):
+        """Whether the target is in rotation, ends a passive ejection that is over"""
+        if self.ejected_until is not None and now >= self.ejected_until:
+            self.ejected_until = None
+            self.recovered_at = now
+        return self.probe_healthy and self.ejected_until is None
+
+    def effective_weight(self, now, slow_start):
+        """The weight, ramped up from a tenth while the target slow-starts"""
+        if self.recovered_at is None or not slow_start:
+            return self.weight
+        ramp = (now - self.recovered_at) / slow_start
+        if ramp >= 1:
+            self.recovered_at = None
+            return self.weight
+        return self.weight * max(ramp, 0.1)
+
+    def health(self, now, slow_start):
+        """healthy, slow_start, ejected or unhealthy"""
+        if not self.probe_healthy:
+            return "unhealthy"
+        if self.ejected_until is not None and now < self.ejected_until:
+            return "ejected"
+        if self.recovered_at is not None and now - self.recovered_at < slow_start:
+            return "slow_start"
+        return "healthy"
+
+    def stats(self, now, slow_start):
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "latency_ewma": self.ewma,
+            "health": self.health(now, slow_start),
+            "consecutive_failures": self.failures,
+            "ejections": self.ejections,
+            "last_probe": self.last_probe,
+        }
+
+
+class LoadBalancer:
+    """
+    Picks the target of each request among the replicas of one pool.
+
+    round_robin spreads requests in proportion to the weights, interleaved
+    (nginx's smooth weighted round robin). least_outstanding picks the
+    target with the fewest requests in flight per unit of weight.
+    ewma picks the lowest expected wait, the latency EWMA times the requests
+    in flight, so a replica that slows down gets less traffic; targets
+    without a response yet are assumed to be as fast as the average.
+
+    Targets that fail are taken out of rotation before any request has to
+    wait on them. GATEWAY_HEALTH_MAX_FAILURES consecutive 5xx responses,
+    timeouts or connection errors eject a target for
+    GATEWAY_HEALTH_EJECTION_SECONDS; GATEWAY_HEALTH_UNHEALTHY_PROBES failed
+    active health checks take it out until a check passes again. A target
+    back in rotation, or added to a running pool, slow-starts: its weight
+    ramps up over GATEWAY_HEALTH_SLOW_START_SECONDS. When no target is
+    available, requests are spread across all of them anyway.
+    """
+
+    def __init__(self, strategy="round_robin", targets=()):
+        self._lock = threading.Lock()
+        self.strategy = strategy
+        self.targets = []
+        self.signature = None
+        self.update(strategy, targets)
+
+    def update(self, strategy, targets):
+        """Apply a new configuration, keeping the state of unchanged targets"""
+        signature = (strategy, tuple((t.url, t.weight) for t in targets))
+        with self._lock:
+            if signature == self.signature:
+                return
+            known = {}
+            for state in self.targets:
+                known.setdefault((state.url, state.weight), []).append(state)
+            states = []
+            for t in targets:
+                state = (known.get((t.url, t.weight)) or [None]).pop(0)
+                if state is None:
+                    state = TargetState(t.url, t.weight)
+                    if self.targets:
+                        # Added to a pool in use, don't flood it at once
+                        state.recovered_at = time.monotonic()
+                states.append(state)
+            self.targets = states
+            self.strategy = strategy
+            self.signature = signature
+
+    def choose(self, now=None):
+        """Pick a target and count the request as outstanding, None if empty"""
+        now = time.monotonic() if now is None else now
+        slow_start = getattr(settings, "GATEWAY_HEALTH_SLOW_START_SECONDS", 30)
+        with self._lock:
+            if not self.targets:
+                return None
+            candidates = [t for t in self.targets if t.is_available(now)]
+            if not candidates:
+                # Better to try a failing replica than to fail every request
+                candidates = self.targets
+            weights = {t: t.effective_weight(now, slow_start) for t in candidates}
+            if self.strategy == "least_outstanding":
+                target = min(candidates, key=lambda t: t.outstanding / weights[t])
+            elif self.strategy == "ewma":
+                known = [t.ewma for t in candidates if t.ewma is not None]
+                prior = sum(known) / len(known) if known else 0.0
+                target = min(
+                    candidates,
+                    key=lambda t: self._expected_wait(t, weights[t], prior),
+                )
+            else:
+                target = self._next_round_robin(weights)
+            target.outstanding += 1
+            target.requests += 1
+            return target
+
+    def _expected_wait(self, target, weight, prior):
+        latency = prior if target.ewma is None else target.ewma
+        load = (target.outstanding + 1) / weight
+        # Ties, e.g. before any response, go to the least loaded target
+        return (latency * load, load)
+
+    def _next_round_robin(self, weights):
+        total = 0
+        best = None
+        for target, weight in weights.items():
+            target.current_weight += weight
+            total += weight
+            if best is None or target.current_weight > best.current_weight:
+                best = target
+        best.current_weight -= total
+        return best
+
+    def release(self, target, latency=None, failed=False, now=None):
+        """
+        Count a request as answered, with its response time if it had one.
+
+        failed is set for 5xx responses, timeouts and connection errors,
+        enough of them in a row eject the target.
+        """
+        now = time.monotonic() if now is None else now
+        decay = getattr(settings, "GATEWAY_BALANCER_EWMA_DECAY", 10)
+        max_failures = getattr(settings, "GATEWAY_HEALTH_MAX_FAILURES", 5)
+        with self._lock:
+            target.outstanding -= 1
+            if latency is not None:
+                target.observe(latency, now, decay)
+            if not failed:
+                target.failures = 0
+                return
+            target.failures += 1
+            if (
+                max_failures
+                and target.failures >= max_failures
+                and target.is_available(now)
+            ):
+                self._eject(target, now)
+
+    def _eject(self, target, now):
+        seconds = getattr(settings, "GATEWAY_HEALTH_EJECTION_SECONDS", 30)
+        target.ejected_until = now + seconds
+        target.ejections += 1
+        target.failures = 0
+        target.current_weight = 0
+
+    def record_probe(self, target, healthy, result, now=None):
+        """
+        Count the outcome of an active health check of a target.
+
+        result is the status code the check got, or its error message.
+        """
+        now = time.monotonic() if now is None else now
+        threshold = getattr(settings, "GATEWAY_HEALTH_UNHEALTHY_PROBES", 2)
+        with self._lock:
+            target.last_probe = result
+            if healthy:
+                target.probe_failures = 0
+                if not target.probe_healthy:
+                    target.probe_healthy = True
+                    target.recovered_at = now
+                return
+            target.probe_failures += 1
+            if target.probe_healthy and target.probe_failures >= threshold:
+                target.probe_healthy = False
+                target.current_weight = 0
+
+    def stats(self, now=None):
+        now = time.monotonic() if now is None else now
+        slow_start = getattr(settings, "GATEWAY_HEALTH_SLOW_START_SECONDS", 30)
+        with self._lock:
+            return {
+                "strategy": self.strategy,
+                "targets": [target.stats(now, slow_start) for target in self.targets],
+            }
+
+
+class LoadBalancerRegistry:
+    """One LoadBalancer per UpstreamPool, kept across routing table reloads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._balancers = {}
+
+    def get(self, pool):
+        """Return the balancer of a pool, updated to its current targets"""
+        balancer = self._balancers.get(pool.pk)
+        if balancer is None:
+            with self._lock:
+                balancer = self._balancers.setdefault(pool.pk, LoadBalancer())
+        balancer.update(pool.strategy, pool_targets(pool))
+        return balancer
+
+    def stats(self, pool):
+        return self.get(pool).stats()
+
+    def clear(self):
+        with self._lock:
+            self._balancers.clear()
+
+
+load_balancers = LoadBalancerRegistry()
@@ -0,0 +1,213 @@
+import threading
+import time
+from urllib.parse import urlsplit
+from django.conf import settings
+from .balancer import endpoint_pool
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def upstream_host(url):
+    """The host and port a target URL points to, which breakers are kept for"""
+    return urlsplit(url).netloc.lower()
+
+
+class CircuitBreaker:
+    """
+    Tracks the failures of one upstream host and stops calling it when too
+    many requests fail.
+
+    Closed, requests go through and their outcomes are counted in a rolling
+    window of GATEWAY_BREAKER_WINDOW seconds. Once the window holds at least
+    GATEWAY_BREAKER_MIN_REQUESTS outcomes and the share of failures reaches
+    GATEWAY_BREAKER_FAILURE_RATIO, the breaker opens and requests are
+    rejected right away. After GATEWAY_BREAKER_OPEN_SECONDS it is half-open
+    and lets GATEWAY_BREAKER_PROBES requests through: it closes when they all
+    succeed and opens again as soon as one fails.
+    """
+
+    # Number of buckets the rolling window is divided into
+    BUCKETS = 10
+
+    def __init__(self, host):
+        self._lock = threading.Lock()
+        self.host = host
+        self.state = CLOSED
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        # Rolling window of [bucket start, successes, failures]
+        self._buckets = []
+        # Probes let through and probes that succeeded while half-open
+        self._probes = 0
+        self._probe_successes = 0
+
+    @staticmethod
+    def config():
+        return {
+            "failure_ratio": getattr(settings, "GATEWAY_BREAKER_FAILURE_RATIO", 0.5),
+            "window": getattr(settings, "GATEWAY_BREAKER_WINDOW", 30),
+            "min_requests": getattr(settings, "GATEWAY_BREAKER_MIN_REQUESTS", 10),
+            "open_seconds": getattr(settings, "GATEWAY_BREAKER_OPEN_SECONDS", 30),
+            "probes": getattr(settings, "GATEWAY_BREAKER_PROBES", 1),
+        }
+
+    def allow(self, now=None):
+        """Whether a request may be sent, counts it as a probe when half-open"""
+        now = time.time() if now is None else now
+        config = self.config()
+        with self._lock:
+            if self.state == OPEN:
+                if now - self.opened_at < config["open_seconds"]:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probes = self._probe_successes = 0
+
+            if self.state == HALF_OPEN:
+                if self._probes >= config["probes"]:
+                    self.rejected += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, success, now=None):
+        """Count the outcome of a request that allow() let through"""
+        now = time.time() if now is None else now
+        config = self.config()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if not success:
+                    self._open(now)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= config["probes"]:
+                        self.state = CLOSED
+                        self._buckets = []
+                return
+            if self.state == OPEN:
+                # Sent before the breaker opened
+                return
+
+            self._count(success, now, config["window"])
+            successes, failures = self._totals()
+            total = successes + failures
+            if (
+                total >= config["min_requests"]
+                and failures / total >= config["failure_ratio"]
+            ):
+                self._open(now)
+
+    def abandon(self):
+        """Give back a probe whose request ended without an outcome"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def reset(self):
+        """Close the breaker and forget the counted outcomes"""
+        with self._lock:
+            self.state = CLOSED
+            self.opened_at = None
+            self._buckets = []
+
+    def retry_after(self, now=None):
+        """Seconds until an open breaker lets a probe through"""
+        now = time.time() if now is None else now
+        if self.state != OPEN:
+            return 0
+        return max(self.config()["open_seconds"] - (now - self.opened_at), 0)
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.times_opened += 1
+
+    def _count(self, success, now, window):
+        width = window / self.BUCKETS
+        start = now - now % width
+        # Drop buckets that left the window
+        self._buckets = [b for b in self._buckets if b[0] > now - window]
+        if not self._buckets or self._buckets[-1][0] != start:
+            self._buckets.append([start, 0, 0])
+        self._buckets[-1][1 if success else 2] += 1
+
+    def _totals(self):
+        return (
+            sum(bucket[1] for bucket in self._buckets),
+            sum(bucket[2] for bucket in self._buckets),
+        )
+
+    def stats(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            window = self.config()["window"]
+            self._buckets = [b for b in self._buckets if b[0] > now - window]
+            successes, failures = self._totals()
+            state = self.state
+        return {
+            "host": self.host,
+            "state": state,
+            "successes": successes,
+            "failures": failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_after": self.retry_after(now),
+        }
+
+
+class BreakerRegistry:
+    """
+    One CircuitBreaker per upstream host, shared by every endpoint whose
+    target_url points to it. Disabled with GATEWAY_BREAKER_ENABLED = False.
+
+    Endpoints with an upstream pool have none: a breaker for the host of
+    their target_url would cut off every replica when one fails, and the
+    pool's health checks already take failing replicas out of rotation.
+    """
+
+    # Statuses that count as failures, the gateway's own 502 included
+    FAILURE_STATUSES = (500, 502, 503, 504)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def is_enabled(self):
+        return getattr(settings, "GATEWAY_BREAKER_ENABLED", True)
+
+    def get(self, host):
+        """Return the breaker of a host, created on first use"""
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(host, CircuitBreaker(host))
+        return breaker
+
+    def for_endpoint(self, endpoint):
+        """
+        Return the breaker of an endpoint's target, or None if disabled or
+        the endpoint has an upstream pool
+        """
+        if not self.is_enabled() or endpoint_pool(endpoint) is not None:
+            return None
+        return self.get(upstream_host(endpoint.target_url))
+
+    def find(self, host):
+        """Return the breaker of a host if one was created"""
+        return self._breakers.get(host)
+
+    def is_failure(self, status):
+        return status in self.FAILURE_STATUSES
+
+    def stats(self):
+        return [breaker.stats() for _, breaker in sorted(self._breakers.items())]
+
+    def clear(self):
+        with self._lock:
+            self._breakers.clear()
+
+
+circuit_breakers = BreakerRegistry()
@@ -0,0 +1,439 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+
+# Methods whose responses can be served from the cache
+CACHEABLE_METHODS = ("GET", "HEAD")
+# Statuses that are cacheable by default (RFC 9110, section 15.1)
+CACHEABLE_STATUSES = (200, 203, 204, 300, 301, 404, 405, 410, 414, 501)
+# Request headers that identify a client
+CREDENTIAL_HEADERS = ("Authorization", "Cookie")
+# Cache-Control directives that allow sharing a response to a request with
+# credentials (RFC 9111, section 3.5)
+SHARED_DIRECTIVES = frozenset(("public", "s-maxage"))
+
+
+def parse_name_list(value):
+    """Turn a comma-separated list into a sorted tuple of names"""
+    return tuple(
+        sorted({name.strip() for name in (value or "").split(",") if name.strip()})
+    )
+
+
+def cache_directives(value):
+    """Names of the directives of a Cache-Control header, lowercased"""
+    return {
+        directive.split("=", 1)[0].strip().lower()
+        for directive in (value or "").split(",")
+        if directive.strip()
+    }
+
+
+def vary_names(value):
+    """Header names of a Vary header, lowercased"""
+    return {name.strip().lower() for name in (value or "").split(",") if name.strip()}
+
+
+class CachedResponse:
+    """A response as the gateway sent it to the client, after transformations"""
+
+    def __init__(
+        self,
+        status,
+        headers,
+        content,
+        stored_at=None,
+        ttl=0,
+        stale_while_revalidate=0,
+        stale_if_error=0,
+        revalidate_for=0,
+        vary=(),
+    ):
+        self.status = status
+        # List of (name, value) pairs
+        self.headers = headers
+        self.content = content
+        self.stored_at = time.time() if stored_at is None else stored_at
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        # Seconds after the TTL during which the entry is kept for revalidation
+        self.revalidate_for = revalidate_for
+        # (name, value) of the request headers the response varies on, as
+        # the request that got it sent them
+        self.vary = vary
+
+    @classmethod
+    def from_response(cls, response, endpoint, request=None):
+        """Snapshot a buffered Django response to a request"""
+        vary = ()
+        if request is not None:
+            vary = tuple(
+                (name, request.headers.get(name, ""))
+                for name in sorted(vary_names(response.get("Vary")))
+            )
+        entry = cls(
+            response.status_code,
+            [(key, value) for key, value in response.items() if key != "X-Cache"],
+            response.content,
+            ttl=endpoint.cache_ttl,
+            stale_while_revalidate=endpoint.cache_stale_while_revalidate,
+            stale_if_error=endpoint.cache_stale_if_error,
+            vary=vary,
+        )
+        if entry.conditional_headers():
+            entry.revalidate_for = getattr(
+                settings, "GATEWAY_CACHE_REVALIDATE_FOR", 3600
+            )
+        return entry
+
+    def header(self, name):
+        """Return the value of a stored header, or None"""
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return None
+
+    def matches(self, request):
+        """Whether a request sends the headers the entry varies on alike"""
+        return all(request.headers.get(name, "") == value for name, value in self.vary)
+
+    def conditional_headers(self):
+        """Headers that ask the target service whether the entry changed"""
+        headers = {}
+        etag = self.header("ETag")
+        if etag:
+            headers["If-None-Match"] = etag
+        last_modified = self.header("Last-Modified")
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    @property
+    def expires_at(self):
+        return self.stored_at + self.ttl
+
+    @property
+    def retain_until(self):
+        """Time after which the entry can't be served in any case"""
+        return self.expires_at + max(
+            self.stale_while_revalidate, self.stale_if_error, self.revalidate_for
+        )
+
+    def is_fresh(self, now=None):
+        return (time.time() if now is None else now) < self.expires_at
+
+    def can_serve_while_revalidating(self, now=None):
+        """Whether the stale entry may be served while it is refreshed"""
+        now = time.time() if now is None else now
+        return now < self.expires_at + self.stale_while_revalidate
+
+    def can_serve_on_error(self, now=None):
+        """Whether the stale entry may be served when the upstream fails"""
+        now = time.time() if now is None else now
+        return now < self.expires_at + self.stale_if_error
+
+    @property
+    def size(self):
+        return len(self.content) + sum(
+            len(name) + len(value) for name, value in self.headers
+        )
+
+
+class LocalMemoryBackend:
+    """
+    Per-process LRU cache.
+
+    Bounded by GATEWAY_CACHE_MAX_ENTRIES and GATEWAY_CACHE_MAX_BYTES, the
+    least recently used entries are evicted first.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.retain_until <= time.time():
+                del self._entries[key]
+                self._size -= entry.size
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        max_entries = getattr(settings, "GATEWAY_CACHE_MAX_ENTRIES", 1000)
+        max_bytes = getattr(settings, "GATEWAY_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+        if entry.size > max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[key] = entry
+            self._size += entry.size
+
+            while len(self._entries) > max_entries or self._size > max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry.size
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, entry):
+        self.set(key, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "evictions": self.evictions,
+        }
+
+
+class DjangoCacheBackend:
+    """
+    Stores entries in the Django cache named by GATEWAY_CACHE_ALIAS.
+
+    Shared between workers when the cache is, e.g. Redis or Memcached. Size
+    limits and eviction are left to the cache itself.
+    """
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, entry):
+        self.cache.set(key, entry, timeout=self._timeout(entry))
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    async def aget(self, key):
+        return await self.cache.aget(key)
+
+    async def aset(self, key, entry):
+        await self.cache.aset(key, entry, timeout=self._timeout(entry))
+
+    def _timeout(self, entry):
+        # Let the cache drop the entry once it can no longer be served
+        return max(int(entry.retain_until - time.time()) + 1, 1)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return {"alias": self.alias}
+
+
+class ResponseCache:
+    """
+    Opt-in response cache for endpoints with a cache_ttl.
+
+    Only GET and HEAD requests are cached, and only responses with a
+    cacheable status that the upstream didn't mark no-store or private, and
+    that set no cookie. The key covers the method, the path, the endpoint's
+    cache_query_params (all query parameters when empty) and its
+    cache_vary_headers; an entry is only served to requests that send the
+    headers named in its Vary header alike, and "Vary: *" isn't stored.
+    Responses to requests with an Authorization or Cookie header that
+    neither of them covers are only stored and served if the upstream marked
+    them public or s-maxage. Entries hold the response after the response
+    transformations ran, so a hit skips the upstream call and the
+    transformations.
+
+    Entries are kept past their TTL for the endpoint's stale-while-revalidate
+    and stale-if-error windows; get() returns them and the caller decides
+    whether a stale entry may be served. Stale entries with an ETag or
+    Last-Modified header are revalidated with a conditional request.
+
+    GATEWAY_CACHE_BACKEND picks the storage: "local" for a per-process LRU,
+    "django" for the Django cache framework.
+    """
+
+    # Values of the X-Cache header, and the counters kept for them
+    OUTCOMES = {
+        "HIT": "hits",
+        "MISS": "misses",
+        "STALE": "stale",
+        "COALESCED": "coalesced",
+        "REVALIDATED": "revalidated",
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backends = {}
+        self._counters = dict.fromkeys(self.OUTCOMES.values(), 0)
+
+    @property
+    def backend(self):
+        name = getattr(settings, "GATEWAY_CACHE_BACKEND", "local")
+        alias = getattr(settings, "GATEWAY_CACHE_ALIAS", "default")
+        backend = self._backends.get((name, alias))
+        if backend is None:
+            with self._lock:
+                backend = self._backends.get((name, alias))
+                if backend is None:
+                    if name == "local":
+                        backend = LocalMemoryBackend()
+                    elif name == "django":
+                        backend = DjangoCacheBackend(alias)
+                    else:
+                        raise ValueError(f"Unknown GATEWAY_CACHE_BACKEND: {name}")
+                    self._backends[(name, alias)] = backend
+        return backend
+
+    def is_enabled(self, endpoint, request):
+        """Whether responses to the request are cached"""
+        return bool(endpoint.cache_ttl) and request.method in CACHEABLE_METHODS
+
+    def key(self, endpoint, request):
+        """Return the cache key for a request, or None if it can't be cached"""
+        if not self.is_enabled(endpoint, request):
+            return None
+
+        query_params = parse_name_list(endpoint.cache_query_params)
+        if query_params:
+            query = [(name, request.GET.getlist(name)) for name in query_params]
+        else:
+            query = sorted(request.GET.lists())
+        headers = [
+            (name.lower(), request.headers.get(name, ""))
+            for name in parse_name_list(endpoint.cache_vary_headers)
+        ]
+
+        digest = hashlib.sha256(
+            repr((request.method, request.path_info, query, headers)).encode()
+        ).hexdigest()
+        # The generation changes with every rule change, which retires entries
+        # built with old transformations
+        generation = getattr(endpoint, "config_generation", 0)
+        return f"gateway:response:{endpoint.pk}:{generation}:{digest}"
+
+    def _uncovered_credentials(self, endpoint, request, vary):
+        """
+        Credential headers of a request that neither the endpoint's
+        cache_vary_headers nor the response's Vary header names
+        """
+        covered = vary | {
+            name.lower() for name in parse_name_list(endpoint.cache_vary_headers)
+        }
+        return [
+            name
+            for name in CREDENTIAL_HEADERS
+            if request.headers.get(name) and name.lower() not in covered
+        ]
+
+    def is_cacheable(self, response, endpoint=None, request=None):
+        """Check whether a response may be stored"""
+        if response.status_code not in CACHEABLE_STATUSES or response.streaming:
+            return False
+        directives = cache_directives(response.get("Cache-Control"))
+        if "no-store" in directives or "private" in directives:
+            return False
+        # A cookie set for one client must never reach another
+        if response.has_header("Set-Cookie") or response.cookies:
+            return False
+        vary = vary_names(response.get("Vary"))
+        if "*" in vary:
+            return False
+        if request is not None and self._uncovered_credentials(endpoint, request, vary):
+            return bool(directives & SHARED_DIRECTIVES)
+        return True
+
+    def usable(self, entry, endpoint, request):
+        """Whether an entry may answer a request"""
+        if not entry.matches(request):
+            return False
+        vary = {name for name, _ in entry.vary}
+        if self._uncovered_credentials(endpoint, request, vary):
+            directives = cache_directives(entry.header("Cache-Control"))
+            return bool(directives & SHARED_DIRECTIVES)
+        return True
+
+    def get(self, key, endpoint=None, request=None):
+        """
+        Return the entry for a key, fresh or stale, or None. With a request,
+        an entry that may not answer it is left out.
+        """
+        entry = self.backend.get(key)
+        if entry is None or request is None:
+            return entry
+        return entry if self.usable(entry, endpoint, request) else None
+
+    async def aget(self, key, endpoint=None, request=None):
+        """Async version of get"""
+        entry = await self.backend.aget(key)
+        if entry is None or request is None:
+            return entry
+        return entry if self.usable(entry, endpoint, request) else None
+
+    def set(self, key, endpoint, response, request=None):
+        """
+        Store a response to a request if it is cacheable.
+
+        Returns the stored entry, which coalesced requests may share, or None
+        when the response isn't cacheable; waiters then make their own call.
+        """
+        if not self.is_cacheable(response, endpoint, request):
+            return None
+        entry = CachedResponse.from_response(response, endpoint, request)
+        self.backend.set(key, entry)
+        return entry
+
+    async def aset(self, key, endpoint, response, request=None):
+        """Async version of set"""
+        if not self.is_cacheable(response, endpoint, request):
+            return None
+        entry = CachedResponse.from_response(response, endpoint, request)
+        await self.backend.aset(key, entry)
+        return entry
+
+    def record(self, outcome):
+        """Count a response served with the given X-Cache value"""
+        counter = self.OUTCOMES[outcome]
+        with self._lock:
+            self._counters[counter] += 1
+
+    def clear(self):
+        """Drop every entry of the current backend"""
+        self.backend.clear()
+
+    def stats(self):
+        """Return the outcome counters and the backend's own numbers"""
+        return {
+            "backend": getattr(settings, "GATEWAY_CACHE_BACKEND", "local"),
+            **self._counters,
+            **self.backend.stats(),
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,93 @@
+import json
+import re
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Raised by loads() for invalid JSON, whichever codec is in use
+JSONDecodeError = json.JSONDecodeError
+
+# A run of digits as long as the smallest integers that don't fit 64 bits,
+# orjson parses those as floats
+LONG_DIGITS = re.compile(rb"\d{19}")
+LONG_DIGITS_STR = re.compile(r"\d{19}")
+
+
+class StdlibCodec:
+    """JSON codec built on the standard library"""
+
+    name = "json"
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode()
+
+
+class OrjsonCodec:
+    """
+    JSON codec built on orjson, which parses and serializes straight from and
+    to bytes several times faster than the standard library.
+
+    Its output is compact and not ASCII-escaped. Integers wider than 64
+    bits, which orjson can't serialize and would parse as floats, fall back
+    to the standard library: documents with a run of 19 digits or more are
+    parsed with it.
+    """
+
+    name = "orjson"
+
+    def loads(self, data):
+        pattern = LONG_DIGITS_STR if isinstance(data, str) else LONG_DIGITS
+        if pattern.search(data):
+            return json.loads(data)
+        # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+        return orjson.loads(data)
+
+    def dumps(self, obj):
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            return json.dumps(obj).encode()
+
+
+_codecs = {}
+
+
+def get_codec():
+    """
+    Return the codec picked by GATEWAY_JSON_CODEC.
+
+    "auto" (the default) and "orjson" use orjson when it is installed and the
+    standard library otherwise, "json" always uses the standard library.
+    """
+    name = getattr(settings, "GATEWAY_JSON_CODEC", "auto")
+    codec = _codecs.get(name)
+    if codec is None:
+        if name in ("auto", "orjson") and orjson is not None:
+            codec = OrjsonCodec()
+        elif name in ("auto", "orjson", "json"):
+            codec = StdlibCodec()
+        else:
+            raise ValueError(f"Unknown GATEWAY_JSON_CODEC: {name}")
+        _codecs[name] = codec
+    return codec
+
+
+def loads(data):
+    """Parse JSON from bytes or str"""
+    return get_codec().loads(data)
+
+
+def dumps(obj):
+    """Serialize an object to JSON bytes"""
+    return get_codec().dumps(obj)
+
+
+def dumps_str(obj):
+    """Serialize an object to a JSON str, for text fields"""
+    return get_codec().dumps(obj).decode()
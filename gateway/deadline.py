@@ -0,0 +1,86 @@
+import time
+from django.conf import settings
+from .retry import ERROR_KINDS
+
+
+class DeadlineExceeded(Exception):
+    """The time budget of a request was spent before it could be answered"""
+
+
+def deadline_header():
+    """Name of the header carrying a request's time budget in milliseconds"""
+    return getattr(settings, "GATEWAY_DEADLINE_HEADER", "X-Request-Timeout-Ms")
+
+
+def client_budget(request):
+    """Seconds the client is willing to wait, from the deadline header, or None"""
+    header = deadline_header()
+    value = request.headers.get(header) if header else None
+    if not value:
+        return None
+    try:
+        budget = float(value) / 1000
+    except ValueError:
+        return None
+    # NaN never compares, treat it like a missing header
+    return budget if budget == budget else None
+
+
+class Deadline:
+    """
+    The time by which the gateway must have answered a request.
+
+    It is the endpoint's total timeout after the request arrived, or the
+    budget the client sent in the deadline header if that is shorter. Every
+    upstream attempt gets connect and read timeouts capped at what is left,
+    and forwards what is left in the same header, so the services behind the
+    gateway can give up in time too.
+
+    client is set when the client's budget is what set the deadline; running
+    out of it says nothing about the target service, unlike running out of
+    the endpoint's own timeout.
+    """
+
+    def __init__(self, expires_at, client=False):
+        self.expires_at = expires_at
+        self.client = client
+
+    @classmethod
+    def for_request(cls, request, endpoint, start_time=None):
+        start_time = time.time() if start_time is None else start_time
+        client = client_budget(request)
+        if client is not None and client < endpoint.timeout:
+            return cls(start_time + client, client=True)
+        return cls(start_time + endpoint.timeout)
+
+    def remaining(self, now=None):
+        """Seconds left, 0 once the deadline passed"""
+        now = time.time() if now is None else now
+        return max(self.expires_at - now, 0)
+
+    def expired(self, now=None):
+        return self.remaining(now) <= 0
+
+    def timeouts(self, connect=None, read=None, now=None):
+        """
+        (connect, read) timeouts for an attempt made now, each defaulting to
+        and capped at the time left
+        """
+        remaining = self.remaining(now)
+        if remaining <= 0:
+            raise DeadlineExceeded("Deadline exceeded")
+        return (
+            min(connect or remaining, remaining),
+            min(read or remaining, remaining),
+        )
+
+    def timed_out(self, error, now=None):
+        """
+        Whether an attempt failed with error because the deadline passed: it
+        timed out, and the timeouts it got, capped at the time left, are spent
+        """
+        return isinstance(error, ERROR_KINDS["timeout"]) and self.expired(now)
+
+    def header_value(self, now=None):
+        """The time left in milliseconds, as sent upstream"""
+        return str(int(self.remaining(now) * 1000))
@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+import time
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Prefetch
+from .balancer import load_balancers
+from .models import UpstreamPool, UpstreamTarget
+from .routing import route_table
+
+logger = logging.getLogger(__name__)
+
+
+class HealthChecker:
+    """
+    Background active health checks of the targets of upstream pools.
+
+    A daemon thread requests the health_check_path of every target of the
+    pools the routing table uses, once per health_check_interval, and tells
+    their load balancers whether it got the health_check_expected_status
+    within GATEWAY_HEALTH_CHECK_TIMEOUT seconds. Failing targets are taken
+    out of rotation before a request has to find out. The thread starts with
+    the first request to a pool that has a health_check_path; it doesn't run
+    with GATEWAY_HEALTH_CHECKS = False.
+    """
+
+    # Seconds between two looks at which checks are due
+    TICK = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = None
+        self._pid = None
+        # Time the next check of each pool is due, by pool pk
+        self._due = {}
+        self._session = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, "GATEWAY_HEALTH_CHECKS", True)
+
+    def watch(self, pool):
+        """Make sure the checks of a pool run, called for every pooled request"""
+        if not pool.health_check_path or self._pid == os.getpid():
+            return
+        if not self.enabled:
+            return
+
+        # Start lazily, and again in a forked worker whose thread didn't survive
+        with self._lock:
+            if self._pid != os.getpid():
+                self._stop = threading.Event()
+                self._session = requests.Session()
+                self._due = {}
+                self._thread = threading.Thread(
+                    target=self._run,
+                    args=(self._stop,),
+                    name="gateway-health-checker",
+                    daemon=True,
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self, stop):
+        while not stop.is_set():
+            try:
+                self.run_due_checks()
+            except Exception:
+                logger.exception("Upstream health checks failed")
+            finally:
+                close_old_connections()
+            stop.wait(self.TICK)
+
+    def run_due_checks(self, now=None):
+        """Check the pools whose interval is over"""
+        now = time.monotonic() if now is None else now
+        for pool in route_table.snapshot().pools.values():
+            if not pool.health_check_path or now < self._due.get(pool.pk, 0):
+                continue
+            self._due[pool.pk] = now + pool.health_check_interval
+            self.check_pool(pool)
+
+    def check_pool(self, pool):
+        """Request the health check path of every target of a pool"""
+        balancer = load_balancers.get(pool)
+        for target in list(balancer.targets):
+            healthy, result = self.probe(target.resolve(pool.health_check_path), pool)
+            balancer.record_probe(target, healthy, result)
+
+    def probe(self, url, pool):
+        """Return whether a target is healthy and the status code or error"""
+        timeout = getattr(settings, "GATEWAY_HEALTH_CHECK_TIMEOUT", 2)
+        session = self._session or requests
+        try:
+            response = session.get(url, timeout=timeout, allow_redirects=False)
+        except requests.RequestException as e:
+            return False, str(e)
+        status = response.status_code
+        response.close()
+        return status == pool.health_check_expected_status, status
+
+    def stop(self, timeout=5):
+        """Stop the checker thread and forget when checks are due"""
+        with self._lock:
+            self._due = {}
+            stop, thread = self._stop, self._thread
+            if thread is None or self._pid != os.getpid():
+                return
+            self._stop = self._thread = self._pid = None
+        stop.set()
+        thread.join(timeout)
+
+
+health_checker = HealthChecker()
+
+
+def pool_health():
+    """Return the pools with the health of their targets, as this process sees it"""
+    pools = UpstreamPool.objects.prefetch_related(
+        Prefetch(
+            "targets",
+            queryset=UpstreamTarget.objects.filter(is_active=True).order_by("id"),
+            to_attr="active_targets",
+        )
+    ).order_by("name")
+    result = []
+    for pool in pools:
+        targets = load_balancers.stats(pool)["targets"]
+        result.append(
+            {
+                "id": pool.pk,
+                "name": pool.name,
+                "strategy": pool.strategy,
+                "health_check_path": pool.health_check_path,
+                # Targets in rotation, slow-starting ones included
+                "available": sum(
+                    t["health"] in ("healthy", "slow_start") for t in targets
+                ),
+                "targets": targets,
+            }
+        )
+    return result
@@ -0,0 +1,234 @@
+import asyncio
+import math
+import queue
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from .retry import retry_budget
+
+# Methods safe to send twice at the same time
+HEDGED_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class Hedge:
+    """
+    Hedged requests of one endpoint.
+
+    When an attempt hasn't answered after the hedge delay, a second one is
+    sent and whichever answers first is used; a failed attempt only loses if
+    the other one succeeds. The delay is the endpoint's hedge_delay_ms, or
+    the GATEWAY_HEDGE_PERCENTILE of its last GATEWAY_HEDGE_SAMPLES response
+    times, so only the slowest few percent get hedged; until
+    GATEWAY_HEDGE_MIN_SAMPLES are known nothing is. Hedges are taken from
+    the retry budget, so an upstream that slows down for everyone doesn't
+    get twice the load.
+    """
+
+    def __init__(self, delay_ms=None):
+        self._lock = threading.Lock()
+        self.delay_ms = delay_ms
+        samples = getattr(settings, "GATEWAY_HEDGE_SAMPLES", 200)
+        self._latencies = deque(maxlen=samples)
+        self.requests = 0
+        self.hedged = 0
+        self.wins = 0
+
+    def delay(self):
+        """Seconds to wait before hedging, None while it can't be learned yet"""
+        if self.delay_ms:
+            return self.delay_ms / 1000
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < getattr(settings, "GATEWAY_HEDGE_MIN_SAMPLES", 20):
+            return None
+        percentile = getattr(settings, "GATEWAY_HEDGE_PERCENTILE", 95)
+        rank = math.ceil(len(latencies) * percentile / 100) - 1
+        return latencies[min(max(rank, 0), len(latencies) - 1)]
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _timed(self, send):
+        started = time.monotonic()
+        result = send()
+        self.record(time.monotonic() - started)
+        return result
+
+    def run(self, send, discard):
+        """
+        Call send(), and again from a second thread if the first call is slow.
+
+        Returns the first result, discard() is called with the other one
+        once it arrives. Raises the last error if both calls fail.
+        """
+        delay = self.delay()
+        self._count("requests")
+        if delay is None:
+            return self._timed(send)
+
+        race = _Race(discard)
+        race.start(lambda: self._timed(send), False)
+        outcome = race.wait(delay)
+        if outcome is None:
+            if retry_budget.try_retry():
+                self._count("hedged")
+                race.start(lambda: self._timed(send), True)
+            outcome = race.wait(None)
+        hedge, result, error = outcome
+        if error is not None and race.pending:
+            # The other attempt may still succeed
+            hedge, result, error = race.wait(None)
+        race.finish()
+        if error is not None:
+            raise error
+        if hedge:
+            self._count("wins")
+        return result
+
+    async def arun(self, send, discard):
+        """Async version of run, the losing attempt is cancelled"""
+        delay = self.delay()
+        self._count("requests")
+        if delay is None:
+            return await self._atimed(send)
+
+        primary = asyncio.ensure_future(self._atimed(send))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and retry_budget.try_retry():
+                self._count("hedged")
+                tasks.add(asyncio.ensure_future(self._atimed(send)))
+            while True:
+                done, pending = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = next((t for t in done if t.exception() is None), None)
+                if winner is not None or not pending:
+                    break
+                tasks = pending
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Wait for the losers to stop, and retrieve what they raised
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for task in done:
+            if task is not winner and not task.cancelled() and not task.exception():
+                await discard(task.result())
+        if winner is None:
+            raise next(iter(done)).exception()
+        if winner is not primary:
+            self._count("wins")
+        return winner.result()
+
+    async def _atimed(self, send):
+        started = time.monotonic()
+        result = await send()
+        self.record(time.monotonic() - started)
+        return result
+
+    def stats(self):
+        delay = self.delay()
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "wins": self.wins,
+            "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+            "win_rate": self.wins / self.hedged if self.hedged else 0.0,
+            "delay": delay,
+        }
+
+
+class _Race:
+    """Attempts running in threads, the first outcome is taken"""
+
+    def __init__(self, discard):
+        self._lock = threading.Lock()
+        self._outcomes = queue.Queue()
+        self._discard = discard
+        self._finished = False
+        self.pending = 0
+
+    def start(self, send, hedge):
+        with self._lock:
+            self.pending += 1
+        threading.Thread(
+            target=self._attempt, args=(send, hedge), name="gateway-hedge", daemon=True
+        ).start()
+
+    def _attempt(self, send, hedge):
+        try:
+            outcome = (hedge, send(), None)
+        except Exception as e:
+            outcome = (hedge, None, e)
+        with self._lock:
+            if not self._finished:
+                self._outcomes.put(outcome)
+                return
+        # Lost the race
+        if outcome[2] is None:
+            self._discard(outcome[1])
+
+    def wait(self, timeout):
+        """Return the next (hedge, result, error), None after timeout seconds"""
+        try:
+            outcome = self._outcomes.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            self.pending -= 1
+        return outcome
+
+    def finish(self):
+        """Stop taking outcomes, and discard the ones that came too late"""
+        with self._lock:
+            self._finished = True
+        while True:
+            try:
+                hedge, result, error = self._outcomes.get_nowait()
+            except queue.Empty:
+                return
+            if error is None:
+                self._discard(result)
+
+
+class HedgeRegistry:
+    """One Hedge per endpoint with hedge_requests enabled"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hedges = {}
+
+    def get(self, endpoint):
+        hedge = self._hedges.get(endpoint.pk)
+        if hedge is None:
+            with self._lock:
+                hedge = self._hedges.setdefault(endpoint.pk, Hedge())
+        # Delay changes apply without dropping the learned latencies
+        hedge.delay_ms = endpoint.hedge_delay_ms
+        return hedge
+
+    def for_request(self, endpoint, method, content=None):
+        """Return the Hedge of a request that may be hedged, or None"""
+        if not endpoint.hedge_requests or method.upper() not in HEDGED_METHODS:
+            return None
+        if content is not None and not isinstance(content, bytes):
+            return None
+        return self.get(endpoint)
+
+    def stats(self, endpoint):
+        return self.get(endpoint).stats()
+
+    def clear(self):
+        with self._lock:
+            self._hedges.clear()
+
+
+hedges = HedgeRegistry()
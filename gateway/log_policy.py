@@ -0,0 +1,120 @@
+import random
+from . import codec
+
+# Appended to a body that was cut at log_max_body_bytes
+TRUNCATION_MARKER = "...[truncated {} bytes]"
+
+
+def parse_header_list(value):
+    """Turn a comma-separated list of header names into a set of lowercase names"""
+    return frozenset(
+        name.strip().lower() for name in (value or "").split(",") if name.strip()
+    )
+
+
+class LogPolicy:
+    """
+    Decides what the gateway stores in ApiLog for one endpoint.
+
+    Built from the log_* fields of an ApiEndpoint. The checks are ordered so
+    that a request that is not going to be logged, or parts of it that are
+    going to be dropped, are never serialized.
+    """
+
+    def __init__(
+        self,
+        sample_rate=1.0,
+        errors_only=False,
+        metadata_only=False,
+        max_body_bytes=None,
+        header_allowlist="",
+        header_denylist="",
+    ):
+        self.sample_rate = sample_rate
+        self.errors_only = errors_only
+        self.metadata_only = metadata_only
+        self.max_body_bytes = max_body_bytes
+        self.header_allowlist = parse_header_list(header_allowlist)
+        self.header_denylist = parse_header_list(header_denylist)
+
+    @classmethod
+    def for_endpoint(cls, endpoint):
+        """Return the policy of an endpoint, cached on the instance"""
+        if endpoint is None:
+            return DEFAULT_POLICY
+
+        policy = getattr(endpoint, "_log_policy", None)
+        if policy is None:
+            policy = cls(
+                sample_rate=endpoint.log_sample_rate,
+                errors_only=endpoint.log_errors_only,
+                metadata_only=endpoint.log_metadata_only,
+                max_body_bytes=endpoint.log_max_body_bytes,
+                header_allowlist=endpoint.log_header_allowlist,
+                header_denylist=endpoint.log_header_denylist,
+            )
+            endpoint._log_policy = policy
+        return policy
+
+    def should_log(self, status):
+        """Decide whether a request that ended with the given status is logged"""
+        if status >= 400:
+            return True
+        if self.errors_only:
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def headers(self, headers):
+        """Return the headers to store, or None in metadata only mode"""
+        if self.metadata_only:
+            return None
+        if not self.header_allowlist and not self.header_denylist:
+            return dict(headers)
+        return {
+            key: value
+            for key, value in headers.items()
+            if (not self.header_allowlist or key.lower() in self.header_allowlist)
+            and key.lower() not in self.header_denylist
+        }
+
+    def request_body(self, body):
+        """Return the request body to store, serialized as JSON"""
+        if self.metadata_only or not body:
+            return None
+        if not isinstance(body, bytes):
+            return self._truncate(codec.dumps(body))
+
+        # Bodies that aren't JSON are stored as a JSON string, cut before
+        # decoding so a large upload isn't decoded only to be dropped
+        max_bytes = self.max_body_bytes
+        if max_bytes is None or len(body) <= max_bytes:
+            return codec.dumps_str(body.decode("utf-8", errors="replace"))
+        text = codec.dumps_str(body[:max_bytes].decode("utf-8", errors="ignore"))
+        return text + TRUNCATION_MARKER.format(len(body) - max_bytes)
+
+    def response_body(self, body):
+        """Return the response body to store"""
+        if self.metadata_only or body is None:
+            return None
+        return self._truncate(body)
+
+    def _truncate(self, body):
+        """Cut a body to max_body_bytes and decode bytes to text"""
+        max_bytes = self.max_body_bytes
+        if isinstance(body, str):
+            if max_bytes is None or len(body) <= max_bytes // 4:
+                # Can't be over the limit, skip encoding
+                return body
+            body = body.encode("utf-8")
+
+        if max_bytes is None or len(body) <= max_bytes:
+            # Bodies that aren't JSON are forwarded as raw bytes
+            return body.decode("utf-8", errors="replace")
+
+        # Drop a character cut in half instead of storing a replacement char
+        text = body[:max_bytes].decode("utf-8", errors="ignore")
+        return text + TRUNCATION_MARKER.format(len(body) - max_bytes)
+
+
+# Used for requests without an endpoint, logs everything like before
+DEFAULT_POLICY = LogPolicy()
@@ -0,0 +1,199 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from .models import ApiLog
+
+logger = logging.getLogger(__name__)
+
+# Queued to tell the writer thread to stop
+_STOP = object()
+
+
+class LogWriter:
+    """
+    Background writer for ApiLog rows.
+
+    The middleware hands finished log entries to submit(), which only puts
+    them on a bounded in-process queue. A writer thread inserts them with
+    bulk_create once GATEWAY_LOG_BATCH_SIZE entries are waiting or
+    GATEWAY_LOG_FLUSH_INTERVAL_MS after the first one arrived, so requests no
+    longer wait on an INSERT (or on SQLite's write lock).
+
+    When the queue is full, GATEWAY_LOG_QUEUE_FULL decides what happens:
+    "drop" discards the entry straight away, "block" makes the request wait
+    up to GATEWAY_LOG_BLOCK_TIMEOUT_MS for room before dropping it. With
+    GATEWAY_LOG_ASYNC = False every entry is saved immediately instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def enabled(self):
+        """Whether entries are written in the background"""
+        return getattr(settings, "GATEWAY_LOG_ASYNC", True)
+
+    @property
+    def may_block(self):
+        """Whether submit() can block the calling thread"""
+        return (
+            not self.enabled
+            or getattr(settings, "GATEWAY_LOG_QUEUE_FULL", "drop") == "block"
+        )
+
+    def submit(self, log):
+        """Queue an unsaved ApiLog for writing"""
+        if not self.enabled:
+            log.save()
+            return
+
+        log_queue = self._ensure_started()
+        try:
+            if getattr(settings, "GATEWAY_LOG_QUEUE_FULL", "drop") == "block":
+                timeout = getattr(settings, "GATEWAY_LOG_BLOCK_TIMEOUT_MS", 100)
+                log_queue.put(log, timeout=timeout / 1000)
+            else:
+                log_queue.put_nowait(log)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _ensure_started(self):
+        # Start lazily, and again in a forked worker whose thread didn't survive
+        if self._pid == os.getpid():
+            return self._queue
+
+        with self._lock:
+            if self._pid != os.getpid():
+                size = getattr(settings, "GATEWAY_LOG_QUEUE_SIZE", 10000)
+                self._queue = queue.Queue(maxsize=size)
+                self._thread = threading.Thread(
+                    target=self._run,
+                    args=(self._queue,),
+                    name="gateway-log-writer",
+                    daemon=True,
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+        return self._queue
+
+    def _run(self, log_queue):
+        while True:
+            # Wait for the first entry, then collect a batch
+            batch = [log_queue.get()]
+            stop = batch[0] is _STOP
+            if stop:
+                batch = []
+
+            batch_size = getattr(settings, "GATEWAY_LOG_BATCH_SIZE", 100)
+            interval = getattr(settings, "GATEWAY_LOG_FLUSH_INTERVAL_MS", 500)
+            deadline = time.monotonic() + interval / 1000
+            while not stop and len(batch) < batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    log = log_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if log is _STOP:
+                    stop = True
+                else:
+                    batch.append(log)
+
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + stop):
+                log_queue.task_done()
+
+            if stop:
+                return
+
+    def _write(self, batch):
+        try:
+            try:
+                ApiLog.objects.bulk_create(batch)
+                self.written += len(batch)
+            except DatabaseError:
+                # One bad row, such as the log of an endpoint deleted while it
+                # was queued, fails the whole batch: save the rest one by one
+                logger.warning(
+                    "Writing a batch of %d API logs failed, retrying one by one",
+                    len(batch),
+                    exc_info=True,
+                )
+                self._write_each(batch)
+        except Exception:
+            # Losing log entries must never take the writer down
+            self.failed += len(batch)
+            logger.exception("Writing API logs failed")
+        finally:
+            close_old_connections()
+
+    def _write_each(self, batch):
+        for log in batch:
+            try:
+                log.save()
+                self.written += 1
+            except DatabaseError:
+                self.failed += 1
+                logger.exception("Dropping an API log that can't be written")
+
+    def flush(self, timeout=None):
+        """Wait until every queued entry is written, return False on timeout"""
+        log_queue = self._queue
+        if log_queue is None or self._pid != os.getpid():
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with log_queue.all_tasks_done:
+            while log_queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                log_queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=5):
+        """Write what is queued and stop the writer thread"""
+        with self._lock:
+            log_queue, thread = self._queue, self._thread
+            if log_queue is None or self._pid != os.getpid():
+                return
+            self._queue = self._thread = self._pid = None
+
+        # Wait for room even with the "drop" policy, this entry must arrive
+        try:
+            log_queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def stats(self):
+        """Return queue depth and counters"""
+        log_queue = self._queue
+        return {
+            "enabled": self.enabled,
+            "queue_depth": log_queue.qsize() if log_queue is not None else 0,
+            "queue_size": getattr(settings, "GATEWAY_LOG_QUEUE_SIZE", 10000),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+log_writer = LogWriter()
+
+# Flush what is still queued when the worker shuts down
+atexit.register(log_writer.close)
@@ -1,17 +1,76 @@
+import asyncio
+import copy
+import functools
+import logging
+import math
+import threading
 import time
-import json
-import re
 import requests
-from django.http import JsonResponse, HttpResponse
+import urllib3
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.urls import resolve, Resolver404
-from .models import Domain, ApiEndpoint, ApiLog
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from . import codec
+from .admission import admission_control
+from .balancer import endpoint_pool, load_balancers
+from .breaker import circuit_breakers
+from .cache import CachedResponse, response_cache
+from .deadline import Deadline, DeadlineExceeded, deadline_header
+from .health import health_checker
+from .hedging import hedges
+from .log_policy import LogPolicy
+from .log_writer import log_writer
+from .retry import RetryPolicy, retry_budget
+from .route_tree import expand_url
+from .models import ApiLog
+from .routing import normalize_path, route_table
+from .singleflight import async_coalescer, coalescer
+from .streaming import ArrayTransformer, can_stream
+from .transformations import FieldPath, TransformationPlan
+from .upstream import async_client_pool, httpx, session_pool
+
+logger = logging.getLogger(__name__)
 
 
 class ApiGatewayMiddleware:
+    """
+    Forward requests that match an ApiEndpoint to its target service.
+
+    The middleware works in both sync and async stacks. Under ASGI the upstream
+    call is made with httpx on the event loop, so an in-flight proxy request
+    doesn't hold a worker thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    SUPPORTED_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD")
+    # Methods whose request body is forwarded to the target service
+    BODY_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+    # Size of the chunks a streamed upstream body is forwarded in
+    STREAM_CHUNK_SIZE = 64 * 1024
+    # Client headers that make a request conditional on a cached copy
+    CONDITIONAL_HEADERS = ["if-none-match", "if-modified-since"]
+    # Headers a 304 from the target service updates on a cached entry
+    REVALIDATION_HEADERS = ("ETag", "Last-Modified", "Cache-Control", "Expires", "Date")
+    # Headers that only apply to the upstream connection
+    HOP_BY_HOP_HEADERS = ("connection", "keep-alive", "transfer-encoding")
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        # Background cache refresh tasks, see _arefresh_in_background
+        self._background_tasks = set()
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
         # Check if the request should be handled by the API gateway
         if self._should_handle_request(request):
             return self._handle_api_gateway_request(request)
@@ -19,12 +78,54 @@ class ApiGatewayMiddleware:
         # If not, continue with the normal Django request/response cycle
         return self.get_response(request)
 
+    async def __acall__(self, request):
+        if await self._ashould_handle_request(request):
+            return await self._ahandle_api_gateway_request(request)
+
+        return await self.get_response(request)
+
     def _should_handle_request(self, request):
         """
         Determine if the request should be handled by the API gateway.
         This checks if the request path is not a Django admin, static file, or web interface URL.
         """
-        path = request.path_info
+        handle = self._check_path(request.path_info)
+        if handle is not None:
+            return handle
+
+        # Turn away requests no endpoint can match before resolving the URL
+        host = self._request_host(request)
+        if not route_table.may_match(host, request.path_info):
+            return False
+        if self._is_django_view(request.path_info):
+            return False
+
+        # Not a Django view, check if we have a matching API endpoint
+        return self._find_endpoint(request) is not None
+
+    async def _ashould_handle_request(self, request):
+        """Async version of _should_handle_request"""
+        handle = self._check_path(request.path_info)
+        if handle is not None:
+            return handle
+
+        # Turn away requests no endpoint can match before resolving the URL
+        snapshot = await self._aroute_snapshot()
+        host = self._request_host(request)
+        if not route_table.may_match(host, request.path_info, snapshot):
+            return False
+        if self._is_django_view(request.path_info):
+            return False
+
+        # Not a Django view, check if we have a matching API endpoint
+        return await self._afind_endpoint(request) is not None
+
+    def _check_path(self, path):
+        """
+        Decide from the path alone whether the gateway handles a request.
+
+        Returns None when the answer depends on the configured endpoints.
+        """
 
         # Skip Django admin, static files, API management, web interface, and docs URLs
         if (
@@ -43,299 +144,1306 @@ class ApiGatewayMiddleware:
         # Handle API requests
         if path.startswith("/api/"):
             return True
+        return None
 
-        # Try to resolve the URL to see if it's a Django view
+    def _is_django_view(self, path):
+        """Whether the path is a Django view, which the gateway leaves alone"""
         try:
             resolve(path)
-            return False  # It's a Django view, don't handle with gateway
+            return True
         except Resolver404:
-            # Not a Django view, check if we have a matching API endpoint
-            host = request.get_host().split(":")[0]  # Remove port if present
-            domain = Domain.objects.filter(name=host, is_active=True).first()
-
-            if domain:
-                # Check if we have a matching endpoint for this domain and path
-                endpoint = ApiEndpoint.objects.filter(
-                    domain=domain,
-                    path=self._normalize_path(path),
-                    method=request.method,
-                    is_active=True,
-                ).first()
-
-                return endpoint is not None
-
             return False
 
+    def _request_host(self, request):
+        """The host a request was sent to, without the port"""
+        return request.get_host().split(":")[0]
+
     def _normalize_path(self, path):
         """Normalize the path to match the format stored in the database"""
-        # Remove trailing slash if present (except for root path)
-        if path != "/" and path.endswith("/"):
-            path = path[:-1]
-        return path
+        return normalize_path(path)
+
+    def _find_endpoint(self, request):
+        """
+        Look up the endpoint for a request in the in-memory routing table,
+        keeping the params its path template captured on the request
+        """
+        endpoint, request.gateway_params = route_table.lookup(
+            self._request_host(request), request.method, request.path_info
+        )
+        return endpoint
+
+    async def _afind_endpoint(self, request):
+        """Async version of _find_endpoint, only touches the database to reload"""
+        endpoint, request.gateway_params = route_table.lookup(
+            self._request_host(request),
+            request.method,
+            request.path_info,
+            await self._aroute_snapshot(),
+        )
+        return endpoint
+
+    async def _aroute_snapshot(self):
+        """The routing table, built in a thread when it has to be (re)loaded"""
+        snapshot = route_table.current()
+        if snapshot is None:
+            snapshot = await sync_to_async(route_table.snapshot)()
+        return snapshot
 
     def _handle_api_gateway_request(self, request):
         """Handle an API gateway request by forwarding it to the target service"""
         start_time = time.time()
-        host = request.get_host().split(":")[0]  # Remove port if present
-        path = self._normalize_path(request.path_info)
 
-        # Find the domain and endpoint
-        domain = Domain.objects.filter(name=host, is_active=True).first()
-
-        if not domain:
-            # If the request starts with /api/, try to find a default domain
-            if path.startswith("/api/"):
-                # Remove /api/ prefix for matching
-                api_path = path[4:]
-                domain = Domain.objects.filter(is_active=True).first()
-                if domain:
-                    endpoint = ApiEndpoint.objects.filter(
-                        domain=domain,
-                        path=self._normalize_path(api_path),
-                        method=request.method,
-                        is_active=True,
-                    ).first()
-            else:
-                endpoint = None
+        # Find the endpoint
+        endpoint = self._find_endpoint(request)
+
+        if not endpoint:
+            response, log_args = self._not_found_response(request, start_time)
         else:
-            endpoint = ApiEndpoint.objects.filter(
-                domain=domain, path=path, method=request.method, is_active=True
-            ).first()
+            cache_key = response_cache.key(endpoint, request)
+            if cache_key:
+                response, log_args = self._cached_request(
+                    endpoint, request, cache_key, start_time
+                )
+                response, log_args = self._conditional_response(
+                    request, response, log_args
+                )
+            else:
+                response, log_args = self._proxy_request(endpoint, request, start_time)
+
+        self._log_request(*log_args)
+        return response
+
+    async def _ahandle_api_gateway_request(self, request):
+        """Async version of _handle_api_gateway_request"""
+        if httpx is None:
+            # Without an async HTTP client, proxy from a worker thread
+            return await sync_to_async(self._handle_api_gateway_request)(request)
+
+        start_time = time.time()
+
+        # Find the endpoint
+        endpoint = await self._afind_endpoint(request)
 
         if not endpoint:
-            # No matching endpoint found
-            response_data = {
-                "error": "Not Found",
-                "message": f"No API endpoint found for {request.method} {path}",
+            response, log_args = self._not_found_response(request, start_time)
+        else:
+            cache_key = response_cache.key(endpoint, request)
+            if cache_key:
+                response, log_args = await self._acached_request(
+                    endpoint, request, cache_key, start_time
+                )
+                response, log_args = self._conditional_response(
+                    request, response, log_args
+                )
+            else:
+                response, log_args = await self._aproxy_request(
+                    endpoint, request, start_time
+                )
+
+        await self._alog_request(*log_args)
+        return response
+
+    def _proxy_request(self, endpoint, request, start_time, cached=None):
+        """
+        Forward a request within the concurrency limits of its endpoint and
+        domain, or reject it with a 503 when they are exhausted or the circuit
+        breaker of the target host is open, and with a 504 when its deadline
+        passes before it is answered.
+        """
+        request.gateway_deadline = Deadline.for_request(request, endpoint, start_time)
+        if request.gateway_deadline.expired():
+            return self._deadline_response(endpoint, request, None, start_time)
+
+        breaker = circuit_breakers.for_endpoint(endpoint)
+        if breaker is not None and not breaker.allow():
+            return self._circuit_open_response(endpoint, request, breaker, start_time)
+
+        admission = admission_control.admit(endpoint)
+        if admission is None:
+            if breaker is not None:
+                breaker.abandon()
+            return self._overloaded_response(endpoint, request, start_time)
+        request.gateway_queue_time = admission.queue_time
+
+        try:
+            response, log_args = self._forward_request(
+                endpoint, request, start_time, cached
+            )
+        except DeadlineExceeded:
+            admission.release()
+            self._record_deadline(breaker, request.gateway_deadline)
+            return self._deadline_response(endpoint, request, None, start_time)
+        except BaseException:
+            admission.release()
+            if breaker is not None:
+                breaker.abandon()
+            raise
+        self._release_when_sent(response, admission)
+        self._record_outcome(breaker, response)
+        return response, log_args
+
+    async def _aproxy_request(self, endpoint, request, start_time, cached=None):
+        """Async version of _proxy_request"""
+        request.gateway_deadline = Deadline.for_request(request, endpoint, start_time)
+        if request.gateway_deadline.expired():
+            return self._deadline_response(endpoint, request, None, start_time)
+
+        breaker = circuit_breakers.for_endpoint(endpoint)
+        if breaker is not None and not breaker.allow():
+            return self._circuit_open_response(endpoint, request, breaker, start_time)
+
+        admission = await admission_control.aadmit(endpoint)
+        if admission is None:
+            if breaker is not None:
+                breaker.abandon()
+            return self._overloaded_response(endpoint, request, start_time)
+        request.gateway_queue_time = admission.queue_time
+
+        try:
+            response, log_args = await self._aforward_request(
+                endpoint, request, start_time, cached
+            )
+        except DeadlineExceeded:
+            admission.release()
+            self._record_deadline(breaker, request.gateway_deadline)
+            return self._deadline_response(endpoint, request, None, start_time)
+        except BaseException:
+            admission.release()
+            if breaker is not None:
+                breaker.abandon()
+            raise
+        self._release_when_sent(response, admission)
+        self._record_outcome(breaker, response)
+        return response, log_args
+
+    def _record_outcome(self, breaker, response):
+        """Count the response of the target service in its circuit breaker"""
+        if breaker is not None:
+            breaker.record(not circuit_breakers.is_failure(response.status_code))
+
+    def _record_deadline(self, breaker, deadline):
+        """
+        Count a request whose deadline passed as a failure of the target
+        service, unless the client's own budget was too short for it
+        """
+        if breaker is None:
+            return
+        if deadline.client:
+            breaker.abandon()
+        else:
+            breaker.record(False)
+
+    def _release_when_sent(self, response, admission):
+        """Release the concurrency slots of a request once its body is sent"""
+        if not response.streaming:
+            admission.release()
+        elif response.is_async:
+            # The upstream is still sending, hold the slots until the body
+            # is sent or the response closed
+            response.streaming_content = self._arelease_after(
+                response.streaming_content, admission
+            )
+        else:
+            content = self._release_after(response.streaming_content, admission)
+            next(content)
+            response.streaming_content = content
+
+    def _release_after(self, chunks, admission):
+        """
+        Yield a streamed body, then release the concurrency slots of its
+        request. It is started before it is sent, so closing the response
+        releases them even when none of the body was sent.
+        """
+        try:
+            yield
+            yield from chunks
+        finally:
+            admission.release()
+
+    async def _arelease_after(self, chunks, admission):
+        """Async version of _release_after"""
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            admission.release()
+
+    def _forward_request(self, endpoint, request, start_time, cached=None):
+        """
+        Forward a request to the target service and build the response.
+
+        With a cached entry, the request is made conditional on its validators
+        and a 304 from the target service refreshes the entry.
+        """
+        body, upstream_request = self._prepare_request(request, endpoint, cached)
+
+        # Make the request to the target service
+        try:
+            upstream_response = self._send_with_retries(
+                endpoint, request, upstream_request
+            )
+        except requests.RequestException as e:
+            return self._gateway_error_response(endpoint, request, body, e, start_time)
+
+        if cached is not None and upstream_response["status_code"] == 304:
+            return self._revalidated_response(
+                endpoint, request, cached, upstream_response, start_time
+            )
+        return self._build_response(
+            endpoint, request, body, upstream_response, start_time
+        )
+
+    async def _aforward_request(self, endpoint, request, start_time, cached=None):
+        """Async version of _forward_request"""
+        body, upstream_request = self._prepare_request(request, endpoint, cached)
+
+        # Make the request to the target service
+        try:
+            upstream_response = await self._asend_with_retries(
+                endpoint, request, upstream_request
+            )
+        except httpx.HTTPError as e:
+            return self._gateway_error_response(endpoint, request, body, e, start_time)
+
+        if cached is not None and upstream_response["status_code"] == 304:
+            return self._revalidated_response(
+                endpoint, request, cached, upstream_response, start_time
+            )
+        return self._build_response(
+            endpoint, request, body, upstream_response, start_time
+        )
+
+    def _send_with_retries(self, endpoint, request, upstream_request):
+        """
+        Make the upstream request, and make it again as the endpoint's retry
+        policy and the retry budget allow.
+
+        Returns the last upstream response or raises the last error. The
+        number of retries is kept on the request for the log. No attempt
+        outlives the request's deadline, and DeadlineExceeded is raised when
+        it passes before one could start.
+        """
+        policy = RetryPolicy.for_endpoint(endpoint)
+        deadline = self._deadline(endpoint, request)
+        attempts = policy.attempts_for(request.method, upstream_request["content"])
+        retry_budget.record_request()
+        for attempt in range(1, attempts + 1):
+            delay = policy.delay(attempt)
+            try:
+                upstream_response = self._send_hedged(
+                    endpoint, request, upstream_request, deadline
+                )
+            except requests.RequestException as e:
+                if not policy.retries_error(e) or not self._may_retry(
+                    attempt, attempts, delay, deadline
+                ):
+                    raise
+            else:
+                if not policy.retries_status(
+                    upstream_response["status_code"]
+                ) or not self._may_retry(attempt, attempts, delay, deadline):
+                    return upstream_response
+                self._discard(upstream_response)
+            request.gateway_retries = attempt
+            time.sleep(delay)
+
+    async def _asend_with_retries(self, endpoint, request, upstream_request):
+        """Async version of _send_with_retries"""
+        policy = RetryPolicy.for_endpoint(endpoint)
+        deadline = self._deadline(endpoint, request)
+        attempts = policy.attempts_for(request.method, upstream_request["content"])
+        retry_budget.record_request()
+        for attempt in range(1, attempts + 1):
+            delay = policy.delay(attempt)
+            try:
+                upstream_response = await self._asend_hedged(
+                    endpoint, request, upstream_request, deadline
+                )
+            except httpx.HTTPError as e:
+                if not policy.retries_error(e) or not self._may_retry(
+                    attempt, attempts, delay, deadline
+                ):
+                    raise
+            else:
+                if not policy.retries_status(
+                    upstream_response["status_code"]
+                ) or not self._may_retry(attempt, attempts, delay, deadline):
+                    return upstream_response
+                await self._adiscard(upstream_response)
+            request.gateway_retries = attempt
+            await asyncio.sleep(delay)
+
+    def _deadline(self, endpoint, request):
+        """The deadline of a request, set when it was admitted"""
+        deadline = getattr(request, "gateway_deadline", None)
+        if deadline is None:
+            deadline = Deadline.for_request(request, endpoint)
+        return deadline
+
+    def _may_retry(self, attempt, attempts, delay, deadline):
+        """
+        Whether a retry is made after the given attempt: attempts are left,
+        the retry would start before the deadline, and the budget allows it.
+        """
+        return (
+            attempt < attempts
+            and delay < deadline.remaining()
+            and retry_budget.try_retry()
+        )
+
+    def _attempt_request(self, endpoint, deadline, upstream_request):
+        """
+        The request of an attempt starting now: its connect and read timeouts
+        are capped at what is left of the deadline, which is forwarded in the
+        deadline header.
+        """
+        attempt = dict(
+            upstream_request,
+            timeout=deadline.timeouts(endpoint.connect_timeout, endpoint.read_timeout),
+            deadline=deadline,
+        )
+        header = deadline_header()
+        if header:
+            attempt["headers"] = {
+                **(upstream_request["headers"] or {}),
+                header: deadline.header_value(),
             }
-            response = JsonResponse(response_data, status=404)
-
-            # Log the failed request
-            self._log_request(
-                None,
-                request,
-                None,
-                404,
-                response.headers,
-                json.dumps(response_data),
-                time.time() - start_time,
+        return attempt
+
+    def _send_hedged(self, endpoint, request, upstream_request, deadline):
+        """Make one attempt, hedged if the endpoint asks for it"""
+
+        def send():
+            return self._make_request(
+                **self._attempt_request(endpoint, deadline, upstream_request)
             )
 
-            return response
+        hedge = hedges.for_request(
+            endpoint, request.method, upstream_request["content"]
+        )
+        if hedge is None:
+            return send()
+        return hedge.run(send, self._discard)
 
-        # Prepare the request to the target service
-        target_url = endpoint.target_url
+    async def _asend_hedged(self, endpoint, request, upstream_request, deadline):
+        """
+        Async version of _send_hedged, an attempt still running when the
+        deadline passes is cancelled
+        """
 
-        # Get request body
-        if request.body:
+        async def send():
+            attempt = self._attempt_request(endpoint, deadline, upstream_request)
             try:
-                body = json.loads(request.body)
-            except json.JSONDecodeError:
-                body = request.body.decode("utf-8")
+                return await asyncio.wait_for(
+                    self._amake_request(**attempt), deadline.remaining()
+                )
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("Deadline exceeded") from None
+
+        hedge = hedges.for_request(
+            endpoint, request.method, upstream_request["content"]
+        )
+        if hedge is None:
+            return await send()
+        return await hedge.arun(send, self._adiscard)
+
+    def _discard(self, upstream_response):
+        """Drop the response of an attempt that is retried"""
+        stream = upstream_response.get("stream")
+        if stream is not None:
+            # A generator that never started skips its finally block, start
+            # it so the connection and the target are released
+            for _ in stream:
+                break
+            stream.close()
+
+    async def _adiscard(self, upstream_response):
+        """Async version of _discard"""
+        stream = upstream_response.get("stream")
+        if stream is not None:
+            async for _ in stream:
+                break
+            await stream.aclose()
+
+    def _cached_request(self, endpoint, request, cache_key, start_time):
+        """
+        Answer a cacheable request from the cache where possible.
+
+        A stale entry inside the stale-while-revalidate window is served while
+        one background request refreshes it. Otherwise the upstream is called,
+        with concurrent identical requests waiting for a single call. If that
+        call fails, a stale entry inside the stale-if-error window is served.
+        """
+        entry = response_cache.get(cache_key, endpoint, request)
+        if entry is not None:
+            if entry.is_fresh():
+                return self._cached_response(
+                    endpoint, request, entry, start_time, "HIT"
+                )
+            if entry.can_serve_while_revalidating():
+                self._refresh_in_background(endpoint, request, cache_key, entry)
+                return self._cached_response(
+                    endpoint, request, entry, start_time, "STALE"
+                )
+
+        own = {}
+
+        def fetch():
+            own["result"] = self._proxy_request(endpoint, request, start_time, entry)
+            return response_cache.set(cache_key, endpoint, own["result"][0], request)
+
+        shared, _ = coalescer.do(cache_key, fetch, timeout=endpoint.timeout)
+        if "result" in own:
+            response, log_args = own["result"]
+            # Revalidated responses are already labelled
+            outcome = None if response.has_header("X-Cache") else "MISS"
+        elif shared is not None and response_cache.usable(shared, endpoint, request):
+            response, log_args = self._cached_response(
+                endpoint, request, shared, start_time, "COALESCED"
+            )
+            outcome = None
         else:
-            body = None
+            # The call we waited for failed or got a response that isn't
+            # cacheable, or that this request may not be given
+            response, log_args = self._proxy_request(endpoint, request, start_time)
+            outcome = "MISS"
+
+        return self._finish_cached_request(
+            endpoint, request, entry, response, log_args, outcome, start_time
+        )
+
+    async def _acached_request(self, endpoint, request, cache_key, start_time):
+        """Async version of _cached_request"""
+        entry = await response_cache.aget(cache_key, endpoint, request)
+        if entry is not None:
+            if entry.is_fresh():
+                return self._cached_response(
+                    endpoint, request, entry, start_time, "HIT"
+                )
+            if entry.can_serve_while_revalidating():
+                self._arefresh_in_background(endpoint, request, cache_key, entry)
+                return self._cached_response(
+                    endpoint, request, entry, start_time, "STALE"
+                )
+
+        own = {}
+
+        async def fetch():
+            own["result"] = await self._aproxy_request(
+                endpoint, request, start_time, entry
+            )
+            return await response_cache.aset(
+                cache_key, endpoint, own["result"][0], request
+            )
+
+        shared, _ = await async_coalescer.do(cache_key, fetch, timeout=endpoint.timeout)
+        if "result" in own:
+            response, log_args = own["result"]
+            # Revalidated responses are already labelled
+            outcome = None if response.has_header("X-Cache") else "MISS"
+        elif shared is not None and response_cache.usable(shared, endpoint, request):
+            response, log_args = self._cached_response(
+                endpoint, request, shared, start_time, "COALESCED"
+            )
+            outcome = None
+        else:
+            # The call we waited for failed or got a response that isn't
+            # cacheable, or that this request may not be given
+            response, log_args = await self._aproxy_request(
+                endpoint, request, start_time
+            )
+            outcome = "MISS"
+
+        return self._finish_cached_request(
+            endpoint, request, entry, response, log_args, outcome, start_time
+        )
+
+    def _finish_cached_request(
+        self, endpoint, request, entry, response, log_args, outcome, start_time
+    ):
+        """Fall back to a stale entry on upstream errors and label the response"""
+        if (
+            response.status_code >= 500
+            and entry is not None
+            and entry.can_serve_on_error()
+        ):
+            return self._cached_response(endpoint, request, entry, start_time, "STALE")
+
+        if outcome is not None:
+            response["X-Cache"] = outcome
+            response_cache.record(outcome)
+        return response, log_args
+
+    def _refresh_in_background(self, endpoint, request, cache_key, entry):
+        """Refresh a stale entry from a background thread, once per key"""
+        if coalescer.in_flight(cache_key):
+            return
+        # The refresh sets its own deadline, queue time and retries, keep
+        # them off the request the stale entry is served to
+        request = copy.copy(request)
+
+        def refresh():
+            try:
+                response, _ = self._proxy_request(endpoint, request, time.time(), entry)
+                return response_cache.set(cache_key, endpoint, response, request)
+            except Exception:
+                logger.exception("Refreshing a cached response failed")
+
+        threading.Thread(
+            target=coalescer.do,
+            args=(cache_key, refresh),
+            name="gateway-cache-refresh",
+            daemon=True,
+        ).start()
+
+    def _arefresh_in_background(self, endpoint, request, cache_key, entry):
+        """Async version of _refresh_in_background, runs as a task"""
+        if async_coalescer.in_flight(cache_key):
+            return
+        request = copy.copy(request)
+
+        async def refresh():
+            try:
+                response, _ = await self._aproxy_request(
+                    endpoint, request, time.time(), entry
+                )
+                return await response_cache.aset(cache_key, endpoint, response, request)
+            except Exception:
+                logger.exception("Refreshing a cached response failed")
+
+        task = asyncio.get_running_loop().create_task(
+            async_coalescer.do(cache_key, refresh)
+        )
+        # Keep a reference until the task is done
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _revalidated_response(
+        self, endpoint, request, cached, upstream_response, start_time
+    ):
+        """Serve a cached entry the target service confirmed with a 304"""
+        updated = {
+            name: upstream_response["headers"].get(name)
+            for name in self.REVALIDATION_HEADERS
+            if upstream_response["headers"].get(name)
+        }
+        replaced = {name.lower() for name in updated}
+        headers = [
+            (key, value) for key, value in cached.headers if key.lower() not in replaced
+        ] + list(updated.items())
+
+        refreshed = CachedResponse(cached.status, headers, cached.content)
+        return self._cached_response(
+            endpoint, request, refreshed, start_time, "REVALIDATED"
+        )
+
+    def _conditional_response(self, request, response, log_args):
+        """Answer the client's If-None-Match or If-Modified-Since with a 304"""
+        if response.status_code != 200 or response.streaming:
+            return response, log_args
+
+        etag = response.get("ETag")
+        last_modified = parse_http_date_safe(response.get("Last-Modified", ""))
+        if not etag and last_modified is None:
+            return response, log_args
+
+        conditional = get_conditional_response(
+            request, etag=etag, last_modified=last_modified, response=response
+        )
+        if conditional is response:
+            return response, log_args
+
+        conditional["X-Cache"] = response["X-Cache"]
+        endpoint, request, body, _, _, _, execution_time = log_args
+        log_args = (
+            endpoint,
+            request,
+            body,
+            conditional.status_code,
+            conditional.headers,
+            None,
+            execution_time,
+        )
+        return conditional, log_args
+
+    def _cached_response(self, endpoint, request, cached, start_time, outcome):
+        """Build the response for a cache hit, without calling the upstream"""
+        response = HttpResponse(content=cached.content, status=cached.status)
+        for key, value in cached.headers:
+            response[key] = value
+        response["X-Cache"] = outcome
+        response_cache.record(outcome)
+
+        log_args = (
+            endpoint,
+            request,
+            None,
+            cached.status,
+            response.headers,
+            cached.content,
+            time.time() - start_time,
+        )
+        return response, log_args
+
+    def _not_found_response(self, request, start_time):
+        """Build the 404 response for requests without a matching endpoint"""
+        path = self._normalize_path(request.path_info)
+        response_data = {
+            "error": "Not Found",
+            "message": f"No API endpoint found for {request.method} {path}",
+        }
+        content = codec.dumps(response_data)
+        response = HttpResponse(content, status=404, content_type="application/json")
+
+        log_args = (
+            None,
+            request,
+            None,
+            404,
+            response.headers,
+            content,
+            time.time() - start_time,
+        )
+        return response, log_args
+
+    def _gateway_error_response(self, endpoint, request, body, error, start_time):
+        """Build the 502 response for a failed upstream request"""
+        response_data = {"error": "Gateway Error", "message": str(error)}
+        content = codec.dumps(response_data)
+        response = HttpResponse(content, status=502, content_type="application/json")
+
+        log_args = (
+            endpoint,
+            request,
+            body,
+            502,
+            response.headers,
+            content,
+            time.time() - start_time,
+        )
+        return response, log_args
+
+    def _deadline_response(self, endpoint, request, body, start_time):
+        """Build the 504 response for a request whose deadline passed"""
+        response_data = {"error": "Gateway Timeout", "message": "Deadline exceeded"}
+        content = codec.dumps(response_data)
+        response = HttpResponse(content, status=504, content_type="application/json")
+
+        log_args = (
+            endpoint,
+            request,
+            body,
+            504,
+            response.headers,
+            content,
+            time.time() - start_time,
+        )
+        return response, log_args
+
+    def _overloaded_response(self, endpoint, request, start_time):
+        """Build the 503 response for a request over a concurrency limit"""
+        response_data = {
+            "error": "Service Unavailable",
+            "message": f"Too many concurrent requests for {endpoint.method} "
+            f"{endpoint.path}",
+        }
+        content = codec.dumps(response_data)
+        response = HttpResponse(content, status=503, content_type="application/json")
+        response["Retry-After"] = str(
+            getattr(settings, "GATEWAY_ADMISSION_RETRY_AFTER", 1)
+        )
+
+        log_args = (
+            endpoint,
+            request,
+            None,
+            503,
+            response.headers,
+            content,
+            time.time() - start_time,
+        )
+        return response, log_args
 
-        # Apply request transformations
-        transformed_body = self._apply_request_transformations(endpoint, body)
+    def _circuit_open_response(self, endpoint, request, breaker, start_time):
+        """Build the 503 response for a target host whose breaker is open"""
+        response_data = {
+            "error": "Service Unavailable",
+            "message": f"Circuit breaker open for {breaker.host}",
+        }
+        content = codec.dumps(response_data)
+        response = HttpResponse(content, status=503, content_type="application/json")
+        response["Retry-After"] = str(max(math.ceil(breaker.retry_after()), 1))
+
+        log_args = (
+            endpoint,
+            request,
+            None,
+            503,
+            response.headers,
+            content,
+            time.time() - start_time,
+        )
+        return response, log_args
+
+    def _prepare_request(self, request, endpoint, cached=None):
+        """
+        Read and transform the client request.
+
+        Returns the original body, for logging, and the keyword arguments for
+        _make_request. The validators of a cached entry are sent along to
+        revalidate it.
+        """
+        body = None
+        content = None
+        transformed_body = None
+
+        if self._should_stream_request(request, endpoint):
+            # Forward the body as it is read from the client
+            content = self._iter_request_body(request)
+        elif request.body:
+            # Get request body
+            try:
+                body = codec.loads(request.body)
+            except codec.JSONDecodeError:
+                # Not JSON, forward the bytes unchanged
+                body = content = request.body
+
+        if content is None:
+            # Apply request transformations
+            transformed_body = self._apply_request_transformations(
+                endpoint, body, request
+            )
 
         # Prepare headers
+        excluded = ["host", "content-length", "connection"]
+        if deadline_header():
+            # Each attempt sends what is left of the deadline instead
+            excluded.append(deadline_header().lower())
+        if response_cache.is_enabled(endpoint, request):
+            # The gateway answers the client's conditional requests itself
+            excluded += self.CONDITIONAL_HEADERS
         headers = {
             key: value
             for key, value in request.headers.items()
-            if key.lower() not in ["host", "content-length", "connection"]
+            if key.lower() not in excluded
+        }
+        if cached is not None:
+            headers.update(cached.conditional_headers())
+        stream = self._should_stream(endpoint)
+        # Transformed bodies are read decoded
+        decode_content = bool(self._get_plan(endpoint, "response"))
+        if stream and not decode_content:
+            # The body is passed on as received, in an encoding the client
+            # accepts rather than the HTTP client's default gzip
+            headers.setdefault("Accept-Encoding", "identity")
+
+        upstream_request = {
+            "method": request.method,
+            "url": expand_url(
+                endpoint.target_url, getattr(request, "gateway_params", None)
+            ),
+            "headers": headers,
+            "params": request.GET.dict(),
+            "data": transformed_body,
+            "content": content,
+            "timeout": endpoint.timeout,
+            "domain": endpoint.domain,
+            "pool": endpoint_pool(endpoint),
+            "stream": stream,
+            "decode_content": decode_content,
         }
+        return body, upstream_request
+
+    def _should_stream_request(self, request, endpoint):
+        """Stream the body if the endpoint asks for it and nothing rewrites it"""
+        return (
+            endpoint.stream_request
+            and request.method in self.BODY_METHODS
+            and not self._get_plan(endpoint, "request")
+        )
 
-        # Make the request to the target service
-        try:
-            response = self._make_request(
-                method=request.method,
-                url=target_url,
-                headers=headers,
-                params=request.GET.dict(),
-                data=transformed_body,
-                timeout=endpoint.timeout,
-            )
+    def _iter_request_body(self, request):
+        """Read the client body in chunks without loading all of it"""
+        while True:
+            chunk = request.read(self.STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
 
-            # Apply response transformations
-            transformed_response = self._apply_response_transformations(
-                endpoint, response
-            )
+    async def _aiter_request_body(self, chunks):
+        """Feed a request body iterator to httpx, which needs an async one"""
+        for chunk in chunks:
+            yield chunk
 
-            # Create Django response
-            django_response = HttpResponse(
-                content=transformed_response.get("content", ""),
-                status=transformed_response.get("status_code", 200),
-                content_type=transformed_response.get(
-                    "content_type", "application/json"
-                ),
-            )
+    def _should_stream(self, endpoint):
+        """
+        Stream the response if the endpoint asks for it and its response
+        transformations, if any, can be applied as the body arrives
+        """
+        return endpoint.stream_response and can_stream(
+            self._get_plan(endpoint, "response")
+        )
 
-            # Add headers
-            for key, value in transformed_response.get("headers", {}).items():
-                if key.lower() not in [
-                    "content-length",
-                    "transfer-encoding",
-                    "connection",
-                ]:
-                    django_response[key] = value
-
-            # Log the successful request
-            self._log_request(
-                endpoint,
-                request,
-                body,
-                transformed_response.get("status_code", 200),
-                transformed_response.get("headers", {}),
-                transformed_response.get("content", ""),
-                time.time() - start_time,
+    def _build_response(self, endpoint, request, body, upstream_response, start_time):
+        """Turn the upstream response into a Django response"""
+        if "stream" in upstream_response:
+            return self._build_streaming_response(
+                endpoint, request, body, upstream_response, start_time
             )
 
-            return django_response
+        # Apply response transformations
+        transformed_response = self._apply_response_transformations(
+            endpoint, upstream_response, request
+        )
 
-        except requests.RequestException as e:
-            # Handle request errors
-            error_message = str(e)
-            response_data = {"error": "Gateway Error", "message": error_message}
-            response = JsonResponse(response_data, status=502)
-
-            # Log the failed request
-            self._log_request(
-                endpoint,
-                request,
-                body,
-                502,
-                response.headers,
-                json.dumps(response_data),
-                time.time() - start_time,
-            )
+        # Create Django response
+        django_response = HttpResponse(
+            content=transformed_response.get("content", ""),
+            status=transformed_response.get("status_code", 200),
+            content_type=transformed_response.get("content_type", "application/json"),
+        )
 
-            return response
+        # Add headers, the body was decoded so Content-Encoding no longer applies
+        for key, value in transformed_response.get("headers", {}).items():
+            if key.lower() not in [
+                "content-length",
+                "content-encoding",
+                "transfer-encoding",
+                "connection",
+            ]:
+                django_response[key] = value
+
+        log_args = (
+            endpoint,
+            request,
+            body,
+            transformed_response.get("status_code", 200),
+            transformed_response.get("headers", {}),
+            transformed_response.get("content", ""),
+            time.time() - start_time,
+        )
+        return django_response, log_args
+
+    def _build_streaming_response(
+        self, endpoint, request, body, upstream_response, start_time
+    ):
+        """Forward the upstream body chunk by chunk as it arrives"""
+        chunks = upstream_response["stream"]
+        # Without transformations the body is passed on undecoded, so
+        # Content-Length and Content-Encoding still describe it
+        excluded = self.HOP_BY_HOP_HEADERS
+        plan = self._get_plan(endpoint, "response", request)
+        if plan:
+            excluded += ("content-length", "content-encoding")
+            if "application/json" in upstream_response["content_type"]:
+                if hasattr(chunks, "__aiter__"):
+                    chunks = self._atransform_chunks(plan, chunks)
+                else:
+                    chunks = self._transform_chunks(plan, chunks)
+
+        django_response = StreamingHttpResponse(
+            chunks,
+            status=upstream_response["status_code"],
+            content_type=upstream_response["content_type"] or None,
+        )
+        for key, value in upstream_response["headers"].items():
+            if key.lower() not in excluded:
+                django_response[key] = value
+
+        # The body is not kept in memory, so it can't be logged
+        log_args = (
+            endpoint,
+            request,
+            body,
+            upstream_response["status_code"],
+            upstream_response["headers"],
+            None,
+            time.time() - start_time,
+        )
+        return django_response, log_args
 
     def _make_request(
-        self, method, url, headers=None, params=None, data=None, timeout=30
+        self,
+        method,
+        url,
+        headers=None,
+        params=None,
+        data=None,
+        timeout=30,
+        domain=None,
+        stream=False,
+        content=None,
+        decode_content=False,
+        pool=None,
+        deadline=None,
     ):
-        """Make a request to the target service"""
+        """
+        Make a request to the target service.
+
+        data is sent JSON encoded, content (bytes or an iterator of bytes) is
+        sent as it is. A streamed body is yielded as received unless
+        decode_content is set. With an upstream pool, the request goes to the
+        replica its load balancer picks. timeout is in seconds, or a
+        (connect, read) tuple. The body is read in chunks as it arrives, each
+        read capped at what is left of the deadline, and DeadlineExceeded is
+        raised once it passes.
+        """
         method = method.upper()
 
-        if method == "GET":
-            response = requests.get(
-                url, headers=headers, params=params, timeout=timeout
+        if method not in self.SUPPORTED_METHODS:
+            raise ValueError(f"Unsupported HTTP method: {method}")
+
+        body = {}
+        if method in self.BODY_METHODS:
+            if content is None:
+                content = self._json_content(data, headers)
+            # An iterator is sent with chunked transfer encoding
+            body = {"data": content}
+
+        balancer, target, url = self._choose_target(pool, url)
+
+        # Reuse the pooled connections of the endpoint's domain
+        session = session_pool.get(domain)
+        started = time.monotonic()
+        response = None
+        try:
+            # Always streamed, so the body can be read within the deadline
+            response = session.request(
+                method=method,
+                url=url,
+                headers=headers,
+                params=params,
+                timeout=timeout,
+                stream=True,
+                **body,
             )
-        elif method == "POST":
-            response = requests.post(
-                url, headers=headers, params=params, json=data, timeout=timeout
+            if not stream:
+                result = self._read_response(
+                    response, self._read_body(response, deadline)
+                )
+        except BaseException as e:
+            self._release_failed(balancer, target, timeout, deadline, e)
+            if response is not None:
+                # The rest of the body is never read
+                response.close()
+            if deadline is not None and deadline.timed_out(e):
+                raise DeadlineExceeded("Deadline exceeded") from e
+            raise
+
+        if stream:
+            release = self._target_release(balancer, target, started, response)
+            return self._stream_result(
+                response, self._iter_raw(response, decode_content, release, deadline)
             )
-        elif method == "PUT":
-            response = requests.put(
-                url, headers=headers, params=params, json=data, timeout=timeout
+        if target is not None:
+            balancer.release(
+                target,
+                time.monotonic() - started,
+                failed=response.status_code >= 500,
             )
-        elif method == "PATCH":
-            response = requests.patch(
-                url, headers=headers, params=params, json=data, timeout=timeout
+        return result
+
+    async def _amake_request(
+        self,
+        method,
+        url,
+        headers=None,
+        params=None,
+        data=None,
+        timeout=30,
+        domain=None,
+        stream=False,
+        content=None,
+        decode_content=False,
+        pool=None,
+        deadline=None,
+    ):
+        """Async version of _make_request"""
+        method = method.upper()
+
+        if method not in self.SUPPORTED_METHODS:
+            raise ValueError(f"Unsupported HTTP method: {method}")
+
+        body = {}
+        if method in self.BODY_METHODS:
+            if content is None:
+                content = self._json_content(data, headers)
+            if content is None or isinstance(content, bytes):
+                body = {"content": content}
+            else:
+                body = {"content": self._aiter_request_body(content)}
+
+        balancer, target, url = self._choose_target(pool, url)
+
+        # Reuse the pooled connections of the endpoint's domain
+        client = async_client_pool.get(domain)
+        started = time.monotonic()
+        try:
+            upstream_request = client.build_request(
+                method=method,
+                url=url,
+                headers=headers,
+                params=params,
+                timeout=(
+                    # (connect, read) like requests takes it
+                    httpx.Timeout(timeout[1], connect=timeout[0])
+                    if isinstance(timeout, tuple)
+                    else timeout
+                ),
+                **body,
             )
-        elif method == "DELETE":
-            response = requests.delete(
-                url, headers=headers, params=params, json=data, timeout=timeout
+            response = await client.send(upstream_request, stream=stream)
+        except BaseException as e:
+            self._release_failed(balancer, target, timeout, deadline, e)
+            if deadline is not None and deadline.timed_out(e):
+                raise DeadlineExceeded("Deadline exceeded") from e
+            raise
+
+        if stream:
+            release = self._target_release(balancer, target, started, response)
+            return self._stream_result(
+                response,
+                self._aiter_raw(response, decode_content, release, deadline),
             )
-        elif method == "OPTIONS":
-            response = requests.options(url, headers=headers, timeout=timeout)
-        elif method == "HEAD":
-            response = requests.head(
-                url, headers=headers, params=params, timeout=timeout
+        result = self._read_response(response)
+        if target is not None:
+            balancer.release(
+                target,
+                time.monotonic() - started,
+                failed=response.status_code >= 500,
             )
-        else:
-            raise ValueError(f"Unsupported HTTP method: {method}")
+        return result
 
-        # Try to parse response as JSON
-        content_type = response.headers.get("Content-Type", "")
-        if "application/json" in content_type:
-            try:
-                content = response.json()
-                content = json.dumps(content)
-            except ValueError:
-                content = response.text
+    def _release_failed(self, balancer, target, timeout, deadline, error):
+        """
+        Release the target of a request that failed with error. It counts as
+        taking the whole timeout, and towards ejecting the target unless it
+        was cancelled or the client's own deadline cut it short.
+        """
+        if target is None:
+            return
+        cut_short = deadline is not None and (
+            isinstance(error, DeadlineExceeded) or deadline.timed_out(error)
+        )
+        balancer.release(
+            target,
+            max(timeout) if isinstance(timeout, tuple) else timeout,
+            failed=isinstance(error, Exception) and not (cut_short and deadline.client),
+        )
+
+    def _choose_target(self, pool, url):
+        """
+        Pick the replica of the pool a request goes to.
+
+        Returns the balancer, the target to release once the request is done
+        and the URL pointed to the target; without a pool, or targets, the
+        URL is returned unchanged.
+        """
+        if pool is None:
+            return None, None, url
+        health_checker.watch(pool)
+        balancer = load_balancers.get(pool)
+        target = balancer.choose()
+        if target is None:
+            return None, None, url
+        return balancer, target, target.resolve(url)
+
+    def _target_release(self, balancer, target, started, response):
+        """
+        Release a target once a streamed body is done, with the time to the
+        response headers as its latency
+        """
+        if target is None:
+            return None
+        return functools.partial(
+            balancer.release,
+            target,
+            time.monotonic() - started,
+            failed=response.status_code >= 500,
+        )
+
+    def _json_content(self, data, headers):
+        """Encode a JSON body with the gateway's codec, None for no body"""
+        if data is None:
+            return None
+        if headers is not None and not any(
+            key.lower() == "content-type" for key in headers
+        ):
+            headers["Content-Type"] = "application/json"
+        return codec.dumps(data)
+
+    def _stream_result(self, response, chunks):
+        """Describe an upstream response whose body hasn't been read yet"""
+        return {
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "content_type": response.headers.get("Content-Type", ""),
+            "stream": chunks,
+        }
+
+    def _iter_raw(self, response, decode_content=False, release=None, deadline=None):
+        """Yield the body of a requests response, then release it"""
+        try:
+            yield from self._iter_body(response, decode_content, deadline)
+        finally:
+            response.close()
+            if release is not None:
+                release()
+
+    async def _aiter_raw(
+        self, response, decode_content=False, release=None, deadline=None
+    ):
+        """
+        Yield the body of an httpx response, then release it. DeadlineExceeded
+        is raised when the deadline passes before the body ends.
+        """
+        if decode_content:
+            chunks = response.aiter_bytes(self.STREAM_CHUNK_SIZE)
         else:
-            content = response.text
+            chunks = response.aiter_raw(self.STREAM_CHUNK_SIZE)
+        try:
+            async for chunk in chunks:
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded("Deadline exceeded")
+                yield chunk
+        finally:
+            await response.aclose()
+            if release is not None:
+                release()
+
+    def _read_body(self, response, deadline=None):
+        """Read the decoded body of a streamed requests response"""
+        if not isinstance(response.raw, urllib3.HTTPResponse):
+            # Not read from a connection
+            return response.content
+        return b"".join(self._iter_body(response, True, deadline))
+
+    def _iter_body(self, response, decode_content, deadline=None):
+        """
+        Yield the body of a streamed requests response as it arrives.
+
+        Each read waits for the next bytes at most until the deadline, and
+        DeadlineExceeded is raised once it passed, so an upstream trickling
+        its body can't hold the request past it. Read errors are raised as
+        the requests exceptions Response.iter_content() raises.
+        """
+        raw = response.raw
+        # read1() returns what has arrived instead of waiting for a full
+        # chunk, urllib3 before 2.3 doesn't have it
+        read = getattr(raw, "read1", raw.read)
+        try:
+            while True:
+                if deadline is not None:
+                    self._cap_read_timeout(raw, deadline)
+                chunk = read(self.STREAM_CHUNK_SIZE, decode_content=decode_content)
+                if not chunk:
+                    return
+                yield chunk
+        except urllib3.exceptions.ReadTimeoutError as e:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("Deadline exceeded") from e
+            raise requests.ConnectionError(e) from e
+        except urllib3.exceptions.ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e) from e
+        except urllib3.exceptions.DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e) from e
+
+    def _cap_read_timeout(self, raw, deadline):
+        """Make the next read of a urllib3 response give up at the deadline"""
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Deadline exceeded")
+        sock = getattr(raw.connection, "sock", None)
+        if sock is not None:
+            timeout = sock.gettimeout()
+            sock.settimeout(remaining if timeout is None else min(timeout, remaining))
+
+    def _transform_chunks(self, plan, chunks):
+        """Apply response transformations to a streamed JSON body"""
+        transformer = ArrayTransformer(plan)
+        try:
+            for chunk in chunks:
+                output = transformer.feed(chunk)
+                if output:
+                    yield output
+            yield transformer.close()
+        finally:
+            chunks.close()
+
+    async def _atransform_chunks(self, plan, chunks):
+        """Async version of _transform_chunks"""
+        transformer = ArrayTransformer(plan)
+        try:
+            async for chunk in chunks:
+                output = transformer.feed(chunk)
+                if output:
+                    yield output
+            yield transformer.close()
+        finally:
+            await chunks.aclose()
+
+    def _read_response(self, response, content=None):
+        """
+        Read an upstream requests or httpx response, or describe it with its
+        body already read as content.
 
+        The body is kept as the raw bytes received; it is only parsed if a
+        response transformation needs it.
+        """
         return {
             "status_code": response.status_code,
             "headers": dict(response.headers),
-            "content": content,
-            "content_type": content_type,
+            "content": response.content if content is None else content,
+            "content_type": response.headers.get("Content-Type", ""),
         }
 
-    def _apply_request_transformations(self, endpoint, body):
+    def _get_transformations(self, endpoint, kind):
+        """Return the active request or response transformations of an endpoint"""
+        # Endpoints from the routing table have them preloaded
+        transformations = getattr(endpoint, f"active_{kind}_transformations", None)
+        if transformations is None:
+            manager = getattr(endpoint, f"{kind}_transformations")
+            transformations = list(manager.filter(is_active=True).order_by("id"))
+        return transformations
+
+    def _get_plan(self, endpoint, kind, request=None):
+        """
+        Return the compiled request or response transformations of an
+        endpoint, with the path params of the request filled in
+        """
+        # Endpoints from the routing table have their plans compiled
+        plan = getattr(endpoint, f"{kind}_plan", None)
+        if plan is None:
+            plan = TransformationPlan(self._get_transformations(endpoint, kind))
+        if request is not None:
+            plan = plan.bind(getattr(request, "gateway_params", None))
+        return plan
+
+    def _apply_request_transformations(self, endpoint, body, request=None):
         """Apply transformations to the request body"""
         if not body:
             return body
 
-        transformations = endpoint.request_transformations.filter(is_active=True)
-        if not transformations:
+        plan = self._get_plan(endpoint, "request", request)
+        if not plan:
             return body
 
         # If body is a string, try to parse it as JSON
         if isinstance(body, str):
             try:
-                body = json.loads(body)
-            except json.JSONDecodeError:
+                body = codec.loads(body)
+            except codec.JSONDecodeError:
                 # If it's not valid JSON, return as is
                 return body
 
-        # Create a copy of the body to transform
-        transformed_body = body.copy() if isinstance(body, dict) else body
-
-        for transformation in transformations:
-            if transformation.transformation_type == "direct":
-                # Direct field mapping
-                source_value = self._get_nested_value(body, transformation.source_field)
-                if source_value is not None:
-                    self._set_nested_value(
-                        transformed_body, transformation.target_field, source_value
-                    )
-
-            elif transformation.transformation_type == "template":
-                # Template-based transformation
-                template = transformation.transformation_value
-                if template:
-                    # Replace placeholders with values from the request
-                    for match in re.finditer(r"\${(.*?)}", template):
-                        field_name = match.group(1)
-                        field_value = self._get_nested_value(body, field_name)
-                        if field_value is not None:
-                            template = template.replace(
-                                match.group(0), str(field_value)
-                            )
-
-                    # Set the transformed value
-                    self._set_nested_value(
-                        transformed_body, transformation.target_field, template
-                    )
-
-            elif transformation.transformation_type == "constant":
-                # Set a constant value
-                self._set_nested_value(
-                    transformed_body,
-                    transformation.target_field,
-                    transformation.transformation_value,
-                )
+        return plan.apply_to_request(body)
 
-        return transformed_body
-
-    def _apply_response_transformations(self, endpoint, response):
+    def _apply_response_transformations(self, endpoint, response, request=None):
         """Apply transformations to the response"""
-        transformations = endpoint.response_transformations.filter(is_active=True)
-
-        # Debug: Print transformations
-        print(
-            f"Applying response transformations for endpoint {endpoint.id}: {endpoint.path}"
-        )
-        print(f"Found {transformations.count()} transformations")
-        for t in transformations:
-            print(
-                f"Transformation: {t.transformation_type} - {t.source_field} -> {t.target_field}"
-            )
+        plan = self._get_plan(endpoint, "response", request)
 
-        if not transformations:
+        # Nothing to change, pass the upstream bytes through untouched
+        if not plan:
             return response
 
         # Try to parse the response content as JSON
@@ -344,167 +1452,36 @@ class ApiGatewayMiddleware:
 
         if "application/json" in content_type:
             try:
-                if isinstance(content, str):
-                    body = json.loads(content)
+                # This is the only place the upstream body gets parsed
+                if isinstance(content, (str, bytes)):
+                    body = codec.loads(content)
                 else:
                     body = content
 
-                # Create a copy of the body to transform
-                transformed_body = body.copy() if isinstance(body, dict) else body
-
-                for transformation in transformations:
-                    # Handle list responses
-                    if isinstance(body, list) and "." in transformation.source_field:
-                        # If source field starts with a number (e.g., "0.name"), it's targeting a specific list item
-                        parts = transformation.source_field.split(".", 1)
-                        if parts[0].isdigit():
-                            index = int(parts[0])
-                            if index < len(body):
-                                item = body[index]
-                                if isinstance(item, dict):
-                                    source_value = self._get_nested_value(
-                                        item, parts[1]
-                                    )
-                                    if (
-                                        source_value is not None
-                                        and isinstance(transformed_body, list)
-                                        and index < len(transformed_body)
-                                    ):
-                                        if not isinstance(
-                                            transformed_body[index], dict
-                                        ):
-                                            transformed_body[index] = {}
-                                        self._set_nested_value(
-                                            transformed_body[index],
-                                            transformation.target_field,
-                                            source_value,
-                                        )
-                        continue
-
-                    # Regular transformations for dict responses
-                    if isinstance(body, dict):
-                        if transformation.transformation_type == "direct":
-                            # Direct field mapping
-                            source_value = self._get_nested_value(
-                                body, transformation.source_field
-                            )
-                            if source_value is not None:
-                                self._set_nested_value(
-                                    transformed_body,
-                                    transformation.target_field,
-                                    source_value,
-                                )
-
-                        elif transformation.transformation_type == "template":
-                            # Template-based transformation
-                            template = transformation.transformation_value
-                            if template:
-                                # Replace placeholders with values from the response
-                                for match in re.finditer(r"\${(.*?)}", template):
-                                    field_name = match.group(1)
-                                    field_value = self._get_nested_value(
-                                        body, field_name
-                                    )
-                                    if field_value is not None:
-                                        template = template.replace(
-                                            match.group(0), str(field_value)
-                                        )
-
-                                # Set the transformed value
-                                self._set_nested_value(
-                                    transformed_body,
-                                    transformation.target_field,
-                                    template,
-                                )
-
-                        elif transformation.transformation_type == "constant":
-                            # Set a constant value
-                            self._set_nested_value(
-                                transformed_body,
-                                transformation.target_field,
-                                transformation.transformation_value,
-                            )
-
                 # Update the response with the transformed body
-                response["content"] = json.dumps(transformed_body)
-
-                # Debug: Print transformation result
-                if isinstance(transformed_body, dict):
-                    print(
-                        f"Transformation result: {transformed_body.get('first_user', 'Not found')}"
-                    )
-                else:
-                    print(
-                        f"Transformation result: List response, first_user not applicable"
-                    )
+                response["content"] = codec.dumps(plan.apply_to_response(body))
 
-            except (json.JSONDecodeError, TypeError) as e:
+            except (codec.JSONDecodeError, TypeError) as e:
                 # If it's not valid JSON, return as is
                 print(f"Error applying transformation: {str(e)}")
-                pass
 
         return response
 
     def _get_nested_value(self, obj, path):
         """Get a value from a nested object using dot notation"""
-        if not path:
-            return None
-
-        if not obj:
-            return None
-
-        parts = path.split(".")
-        current = obj
-
-        for part in parts:
-            if isinstance(current, dict) and part in current:
-                current = current[part]
-            elif (
-                isinstance(current, list)
-                and part.isdigit()
-                and int(part) < len(current)
-            ):
-                current = current[int(part)]
-            else:
-                return None
-
-        return current
+        return FieldPath(path).get(obj)
 
     def _set_nested_value(self, obj, path, value):
         """Set a value in a nested object using dot notation"""
-        if not path or not obj:
-            return
+        FieldPath(path).set(obj, value)
 
-        parts = path.split(".")
-        current = obj
-
-        # Navigate to the parent of the field to set
-        for i, part in enumerate(parts[:-1]):
-            if isinstance(current, dict):
-                if part not in current:
-                    # Create missing dictionaries along the path
-                    current[part] = {}
-                current = current[part]
-            elif (
-                isinstance(current, list)
-                and part.isdigit()
-                and int(part) < len(current)
-            ):
-                current = current[int(part)]
-            else:
-                # Can't navigate further
-                return
-
-        # Set the value on the parent
-        last_part = parts[-1]
-        if isinstance(current, dict):
-            current[last_part] = value
-        elif (
-            isinstance(current, list)
-            and last_part.isdigit()
-            and int(last_part) < len(current)
-        ):
-            current[int(last_part)] = value
+    async def _alog_request(self, *args):
+        """Async version of _log_request"""
+        if log_writer.may_block:
+            await sync_to_async(self._log_request)(*args)
+        else:
+            # Only puts the entry on the writer's queue
+            self._log_request(*args)
 
     def _log_request(
         self,
@@ -516,23 +1493,35 @@ class ApiGatewayMiddleware:
         response_body,
         execution_time,
     ):
-        """Log the API request and response"""
+        """Log the API request and response according to the endpoint's policy"""
         try:
+            policy = LogPolicy.for_endpoint(endpoint)
+            # Decide before serializing anything
+            if not policy.should_log(response_status):
+                return
+
             log = ApiLog(
                 endpoint=endpoint,
                 request_method=request.method,
                 request_path=request.path_info,
-                request_body=json.dumps(request_body) if request_body else None,
+                request_body=policy.request_body(request_body),
                 response_status=response_status,
-                response_body=response_body,
+                response_body=policy.response_body(response_body),
                 execution_time=execution_time,
+                queue_time=getattr(request, "gateway_queue_time", None),
+                retries=getattr(request, "gateway_retries", 0),
             )
 
             # Set headers
-            log.set_request_headers(dict(request.headers))
-            log.set_response_headers(response_headers)
-
-            log.save()
+            request_headers = policy.headers(request.headers)
+            if request_headers is not None:
+                log.set_request_headers(request_headers)
+            response_headers = policy.headers(response_headers)
+            if response_headers is not None:
+                log.set_response_headers(response_headers)
+
+            # Written in the background, see LogWriter
+            log_writer.submit(log)
         except Exception as e:
             # Don't let logging errors affect the response
             print(f"Error logging API request: {str(e)}")
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConfigGeneration",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "value",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="Current generation of the gateway configuration",
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
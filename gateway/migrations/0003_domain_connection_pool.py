@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0002_config_generation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="domain",
+            name="pool_block",
+            field=models.BooleanField(
+                default=False,
+                help_text="Wait for a free connection instead of opening more than pool_maxsize connections to an upstream host",
+            ),
+        ),
+        migrations.AddField(
+            model_name="domain",
+            name="pool_maxsize",
+            field=models.PositiveIntegerField(
+                default=10,
+                help_text="Maximum number of keep-alive connections per upstream host",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0003_domain_connection_pool"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="stream_response",
+            field=models.BooleanField(
+                default=False,
+                help_text="Stream the upstream response to the client as it arrives instead of buffering it (ignored while response transformations are active)",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0004_apiendpoint_stream_response"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="stream_request",
+            field=models.BooleanField(
+                default=False,
+                help_text="Stream the client request body to the target service with chunked transfer encoding instead of buffering it (ignored while request transformations are active)",
+            ),
+        ),
+    ]
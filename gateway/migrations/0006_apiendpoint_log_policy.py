@@ -0,0 +1,69 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:21
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0005_apiendpoint_stream_request"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="log_errors_only",
+            field=models.BooleanField(
+                default=False,
+                help_text="Only log requests that ended with a status of 400 or above",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="log_header_allowlist",
+            field=models.TextField(
+                blank=True,
+                default="",
+                help_text="Comma-separated header names to log, all others are dropped (empty to log all headers)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="log_header_denylist",
+            field=models.TextField(
+                blank=True,
+                default="",
+                help_text="Comma-separated header names never to log (e.g. 'Authorization, Cookie')",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="log_max_body_bytes",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Truncate logged request and response bodies to this many bytes (empty for no limit)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="log_metadata_only",
+            field=models.BooleanField(
+                default=False,
+                help_text="Log method, path, status and timing without headers or bodies",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="log_sample_rate",
+            field=models.FloatField(
+                default=1.0,
+                help_text="Fraction of successful requests to log, between 0 and 1 (errors are always logged)",
+                validators=[
+                    django.core.validators.MinValueValidator(0.0),
+                    django.core.validators.MaxValueValidator(1.0),
+                ],
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0006_apiendpoint_log_policy"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="cache_query_params",
+            field=models.TextField(
+                blank=True,
+                default="",
+                help_text="Comma-separated query parameters that make up the cache key (empty to use all of them)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="cache_ttl",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Seconds to cache GET and HEAD responses for (0 disables caching)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="cache_vary_headers",
+            field=models.TextField(
+                blank=True,
+                default="",
+                help_text="Comma-separated request headers that make up the cache key (e.g. 'Accept, Accept-Language')",
+            ),
+        ),
+    ]
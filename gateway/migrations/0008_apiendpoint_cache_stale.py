@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0007_apiendpoint_response_cache"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="cache_stale_if_error",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Seconds after the TTL during which a stale response is served if the target service fails",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="cache_stale_while_revalidate",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Seconds after the TTL during which a stale response is served while one request refreshes it in the background",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0008_apiendpoint_cache_stale"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="apiendpoint",
+            name="stream_response",
+            field=models.BooleanField(
+                default=False,
+                help_text="Stream the upstream response to the client as it arrives instead of buffering it (JSON array responses are transformed one element at a time; ignored while a response transformation needs the whole array)",
+            ),
+        ),
+    ]
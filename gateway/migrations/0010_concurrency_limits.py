@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0009_apiendpoint_stream_response_help"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="max_concurrent_requests",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Maximum number of requests in flight to this endpoint, further requests wait briefly and are then rejected with a 503 (0 for no limit)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apilog",
+            name="queue_time",
+            field=models.FloatField(
+                blank=True,
+                help_text="Seconds the request waited for a concurrency slot",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="domain",
+            name="max_concurrent_requests",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Maximum number of requests in flight to all endpoints of this domain together (0 for no limit)",
+            ),
+        ),
+    ]
@@ -0,0 +1,130 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:48
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0010_concurrency_limits"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UpstreamPool",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        help_text="Name of the pool (e.g., 'cat-api')",
+                        max_length=255,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "strategy",
+                    models.CharField(
+                        choices=[
+                            ("round_robin", "Weighted round robin"),
+                            ("least_outstanding", "Least outstanding requests"),
+                            ("ewma", "Lowest latency (EWMA)"),
+                        ],
+                        default="round_robin",
+                        help_text="How requests are spread across the targets",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "description",
+                    models.TextField(
+                        blank=True, help_text="Description of the pool", null=True
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="upstream_pool",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Pool of replicas to balance requests across instead of sending them to the host of the target URL",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="endpoints",
+                to="gateway.upstreampool",
+            ),
+        ),
+        migrations.AddField(
+            model_name="domain",
+            name="upstream_pool",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Pool of replicas to balance the requests of all endpoints across, unless an endpoint has its own",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="domains",
+                to="gateway.upstreampool",
+            ),
+        ),
+        migrations.CreateModel(
+            name="UpstreamTarget",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "url",
+                    models.CharField(
+                        help_text="Base URL of the replica (e.g., 'http://10.0.0.5:8080'), replaces the scheme and host of the endpoint's target URL",
+                        max_length=255,
+                        validators=[django.core.validators.URLValidator()],
+                    ),
+                ),
+                (
+                    "weight",
+                    models.PositiveIntegerField(
+                        default=1,
+                        help_text="Share of the requests relative to the other targets",
+                        validators=[django.core.validators.MinValueValidator(1)],
+                    ),
+                ),
+                (
+                    "is_active",
+                    models.BooleanField(
+                        default=True,
+                        help_text="Whether requests are sent to this target",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "pool",
+                    models.ForeignKey(
+                        help_text="Pool this target belongs to",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="targets",
+                        to="gateway.upstreampool",
+                    ),
+                ),
+            ],
+        ),
+    ]
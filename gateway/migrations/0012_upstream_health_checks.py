@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:54
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0011_upstream_pools"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="upstreampool",
+            name="health_check_expected_status",
+            field=models.PositiveIntegerField(
+                default=200, help_text="Status code a healthy target answers with"
+            ),
+        ),
+        migrations.AddField(
+            model_name="upstreampool",
+            name="health_check_interval",
+            field=models.PositiveIntegerField(
+                default=10,
+                help_text="Seconds between two health checks of a target",
+                validators=[django.core.validators.MinValueValidator(1)],
+            ),
+        ),
+        migrations.AddField(
+            model_name="upstreampool",
+            name="health_check_path",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Path requested on each target to check its health (e.g., '/health/'), empty to rely on failed requests only",
+                max_length=255,
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:57
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0012_upstream_health_checks"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="retry_backoff_ms",
+            field=models.PositiveIntegerField(
+                default=100,
+                help_text="Base delay before a retry in milliseconds, doubled for each further retry and randomized (jitter)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="retry_max_attempts",
+            field=models.PositiveIntegerField(
+                default=1,
+                help_text="Maximum number of attempts per request, retries included (1 disables retries)",
+                validators=[django.core.validators.MinValueValidator(1)],
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="retry_non_idempotent",
+            field=models.BooleanField(
+                default=False,
+                help_text="Also retry POST and PATCH requests, which may then be processed twice",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="retry_on_errors",
+            field=models.CharField(
+                blank=True,
+                default="connect, timeout",
+                help_text="Comma-separated kinds of upstream errors that are retried: 'connect' (connection failed or was reset), 'timeout'",
+                max_length=255,
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="retry_on_statuses",
+            field=models.CharField(
+                blank=True,
+                default="502, 503, 504",
+                help_text="Comma-separated upstream status codes that are retried",
+                max_length=255,
+            ),
+        ),
+        migrations.AddField(
+            model_name="apilog",
+            name="retries",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of times the upstream request was retried"
+            ),
+        ),
+    ]
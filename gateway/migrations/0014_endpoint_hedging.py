@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0013_endpoint_retry_policy"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="hedge_delay_ms",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Milliseconds to wait for an answer before hedging, empty to use the 95th percentile of recent response times",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="hedge_requests",
+            field=models.BooleanField(
+                default=False,
+                help_text="Send a second GET, HEAD or OPTIONS request when the first one is slow, and use whichever answers first",
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0014_endpoint_hedging"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="connect_timeout",
+            field=models.FloatField(
+                blank=True,
+                help_text="Seconds to wait for a connection to the target service (empty to use the total timeout)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiendpoint",
+            name="read_timeout",
+            field=models.FloatField(
+                blank=True,
+                help_text="Seconds to wait for each read of the response (empty to use the total timeout)",
+                null=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="apiendpoint",
+            name="timeout",
+            field=models.FloatField(
+                default=30,
+                help_text="Total seconds the target service has to answer, retries included; shortened by a client's deadline header",
+            ),
+        ),
+    ]
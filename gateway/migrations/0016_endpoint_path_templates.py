@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:11
+
+import django.core.validators
+import gateway.route_tree
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0015_endpoint_split_timeouts"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="apiendpoint",
+            name="path",
+            field=models.CharField(
+                help_text="Path of the endpoint (e.g., '/users'). '{name}' captures a path segment and a final '{name*}' the rest of the path",
+                max_length=255,
+                validators=[gateway.route_tree.validate_path_template],
+            ),
+        ),
+        migrations.AlterField(
+            model_name="apiendpoint",
+            name="target_url",
+            field=models.CharField(
+                help_text="Target URL to forward the request to, '{name}' is replaced by the path parameter of that name",
+                max_length=255,
+                validators=[django.core.validators.URLValidator()],
+            ),
+        ),
+    ]
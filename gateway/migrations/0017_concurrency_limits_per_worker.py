@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gateway", "0016_endpoint_path_templates"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="apiendpoint",
+            name="max_concurrent_requests",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Maximum number of requests in flight to this endpoint in each worker process, further requests wait briefly and are then rejected with a 503 (0 for no limit)",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="domain",
+            name="max_concurrent_requests",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Maximum number of requests in flight to all endpoints of this domain together, in each worker process (0 for no limit)",
+            ),
+        ),
+    ]
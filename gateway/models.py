@@ -1,6 +1,82 @@
 from django.db import models
-from django.core.validators import URLValidator
-import json
+from django.db.models import F
+from django.utils import timezone
+from django.core.validators import URLValidator, MinValueValidator, MaxValueValidator
+from . import codec
+from .route_tree import validate_path_template
+
+
+class UpstreamPool(models.Model):
+    """Model to store a group of backend replicas requests are balanced across"""
+
+    STRATEGIES = (
+        ("round_robin", "Weighted round robin"),
+        ("least_outstanding", "Least outstanding requests"),
+        ("ewma", "Lowest latency (EWMA)"),
+    )
+
+    name = models.CharField(
+        max_length=255, unique=True, help_text="Name of the pool (e.g., 'cat-api')"
+    )
+    strategy = models.CharField(
+        max_length=20,
+        choices=STRATEGIES,
+        default="round_robin",
+        help_text="How requests are spread across the targets",
+    )
+    health_check_path = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        help_text="Path requested on each target to check its health "
+        "(e.g., '/health/'), empty to rely on failed requests only",
+    )
+    health_check_interval = models.PositiveIntegerField(
+        default=10,
+        validators=[MinValueValidator(1)],
+        help_text="Seconds between two health checks of a target",
+    )
+    health_check_expected_status = models.PositiveIntegerField(
+        default=200, help_text="Status code a healthy target answers with"
+    )
+    description = models.TextField(
+        blank=True, null=True, help_text="Description of the pool"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class UpstreamTarget(models.Model):
+    """Model to store one backend replica of an upstream pool"""
+
+    pool = models.ForeignKey(
+        UpstreamPool,
+        on_delete=models.CASCADE,
+        related_name="targets",
+        help_text="Pool this target belongs to",
+    )
+    url = models.CharField(
+        max_length=255,
+        validators=[URLValidator()],
+        help_text="Base URL of the replica (e.g., 'http://10.0.0.5:8080'), "
+        "replaces the scheme and host of the endpoint's target URL",
+    )
+    weight = models.PositiveIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text="Share of the requests relative to the other targets",
+    )
+    is_active = models.BooleanField(
+        default=True, help_text="Whether requests are sent to this target"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.pool.name} - {self.url}"
 
 
 class Domain(models.Model):
@@ -20,6 +96,29 @@ class Domain(models.Model):
     is_active = models.BooleanField(
         default=True, help_text="Whether this domain is active"
     )
+    pool_maxsize = models.PositiveIntegerField(
+        default=10,
+        help_text="Maximum number of keep-alive connections per upstream host",
+    )
+    pool_block = models.BooleanField(
+        default=False,
+        help_text="Wait for a free connection instead of opening more than "
+        "pool_maxsize connections to an upstream host",
+    )
+    max_concurrent_requests = models.PositiveIntegerField(
+        default=0,
+        help_text="Maximum number of requests in flight to all endpoints of "
+        "this domain together, in each worker process (0 for no limit)",
+    )
+    upstream_pool = models.ForeignKey(
+        UpstreamPool,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="domains",
+        help_text="Pool of replicas to balance the requests of all endpoints "
+        "across, unless an endpoint has its own",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -47,7 +146,10 @@ class ApiEndpoint(models.Model):
         help_text="Domain this endpoint belongs to",
     )
     path = models.CharField(
-        max_length=255, help_text="Path of the endpoint (e.g., '/users')"
+        max_length=255,
+        validators=[validate_path_template],
+        help_text="Path of the endpoint (e.g., '/users'). '{name}' captures a "
+        "path segment and a final '{name*}' the rest of the path",
     )
     method = models.CharField(
         max_length=10,
@@ -58,10 +160,151 @@ class ApiEndpoint(models.Model):
     target_url = models.CharField(
         max_length=255,
         validators=[URLValidator()],
-        help_text="Target URL to forward the request to",
+        help_text="Target URL to forward the request to, '{name}' is replaced "
+        "by the path parameter of that name",
+    )
+    timeout = models.FloatField(
+        default=30,
+        help_text="Total seconds the target service has to answer, retries "
+        "included; shortened by a client's deadline header",
+    )
+    connect_timeout = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="Seconds to wait for a connection to the target service "
+        "(empty to use the total timeout)",
+    )
+    read_timeout = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="Seconds to wait for each read of the response "
+        "(empty to use the total timeout)",
+    )
+    stream_request = models.BooleanField(
+        default=False,
+        help_text="Stream the client request body to the target service with "
+        "chunked transfer encoding instead of buffering it (ignored while "
+        "request transformations are active)",
+    )
+    stream_response = models.BooleanField(
+        default=False,
+        help_text="Stream the upstream response to the client as it arrives "
+        "instead of buffering it (JSON array responses are transformed one "
+        "element at a time; ignored while a response transformation needs "
+        "the whole array)",
+    )
+    upstream_pool = models.ForeignKey(
+        UpstreamPool,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="endpoints",
+        help_text="Pool of replicas to balance requests across instead of "
+        "sending them to the host of the target URL",
+    )
+    max_concurrent_requests = models.PositiveIntegerField(
+        default=0,
+        help_text="Maximum number of requests in flight to this endpoint in "
+        "each worker process, further requests wait briefly and are then "
+        "rejected with a 503 (0 for no limit)",
+    )
+    retry_max_attempts = models.PositiveIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text="Maximum number of attempts per request, retries included "
+        "(1 disables retries)",
+    )
+    retry_backoff_ms = models.PositiveIntegerField(
+        default=100,
+        help_text="Base delay before a retry in milliseconds, doubled for each "
+        "further retry and randomized (jitter)",
+    )
+    retry_on_statuses = models.CharField(
+        max_length=255,
+        blank=True,
+        default="502, 503, 504",
+        help_text="Comma-separated upstream status codes that are retried",
+    )
+    retry_on_errors = models.CharField(
+        max_length=255,
+        blank=True,
+        default="connect, timeout",
+        help_text="Comma-separated kinds of upstream errors that are retried: "
+        "'connect' (connection failed or was reset), 'timeout'",
+    )
+    retry_non_idempotent = models.BooleanField(
+        default=False,
+        help_text="Also retry POST and PATCH requests, which may then be "
+        "processed twice",
+    )
+    hedge_requests = models.BooleanField(
+        default=False,
+        help_text="Send a second GET, HEAD or OPTIONS request when the first one "
+        "is slow, and use whichever answers first",
+    )
+    hedge_delay_ms = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Milliseconds to wait for an answer before hedging, empty to "
+        "use the 95th percentile of recent response times",
+    )
+    cache_ttl = models.PositiveIntegerField(
+        default=0,
+        help_text="Seconds to cache GET and HEAD responses for (0 disables caching)",
+    )
+    cache_stale_while_revalidate = models.PositiveIntegerField(
+        default=0,
+        help_text="Seconds after the TTL during which a stale response is served "
+        "while one request refreshes it in the background",
     )
-    timeout = models.IntegerField(
-        default=30, help_text="Timeout in seconds for the request"
+    cache_stale_if_error = models.PositiveIntegerField(
+        default=0,
+        help_text="Seconds after the TTL during which a stale response is served "
+        "if the target service fails",
+    )
+    cache_query_params = models.TextField(
+        blank=True,
+        default="",
+        help_text="Comma-separated query parameters that make up the cache key "
+        "(empty to use all of them)",
+    )
+    cache_vary_headers = models.TextField(
+        blank=True,
+        default="",
+        help_text="Comma-separated request headers that make up the cache key "
+        "(e.g. 'Accept, Accept-Language')",
+    )
+    log_sample_rate = models.FloatField(
+        default=1.0,
+        validators=[MinValueValidator(0.0), MaxValueValidator(1.0)],
+        help_text="Fraction of successful requests to log, between 0 and 1 "
+        "(errors are always logged)",
+    )
+    log_errors_only = models.BooleanField(
+        default=False,
+        help_text="Only log requests that ended with a status of 400 or above",
+    )
+    log_metadata_only = models.BooleanField(
+        default=False,
+        help_text="Log method, path, status and timing without headers or bodies",
+    )
+    log_max_body_bytes = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Truncate logged request and response bodies to this many "
+        "bytes (empty for no limit)",
+    )
+    log_header_allowlist = models.TextField(
+        blank=True,
+        default="",
+        help_text="Comma-separated header names to log, all others are "
+        "dropped (empty to log all headers)",
+    )
+    log_header_denylist = models.TextField(
+        blank=True,
+        default="",
+        help_text="Comma-separated header names never to log "
+        "(e.g. 'Authorization, Cookie')",
     )
     is_active = models.BooleanField(
         default=True, help_text="Whether this endpoint is active"
@@ -170,19 +413,58 @@ class ApiLog(models.Model):
         blank=True, null=True, help_text="Body of the response"
     )
     execution_time = models.FloatField(help_text="Execution time in seconds")
+    queue_time = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="Seconds the request waited for a concurrency slot",
+    )
+    retries = models.PositiveIntegerField(
+        default=0, help_text="Number of times the upstream request was retried"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.request_method} {self.request_path} - {self.response_status}"
 
     def set_request_headers(self, headers):
-        self.request_headers = json.dumps(dict(headers))
+        self.request_headers = codec.dumps_str(dict(headers))
 
     def get_request_headers(self):
-        return json.loads(self.request_headers) if self.request_headers else {}
+        return codec.loads(self.request_headers) if self.request_headers else {}
 
     def set_response_headers(self, headers):
-        self.response_headers = json.dumps(dict(headers))
+        self.response_headers = codec.dumps_str(dict(headers))
 
     def get_response_headers(self):
-        return json.loads(self.response_headers) if self.response_headers else {}
+        return codec.loads(self.response_headers) if self.response_headers else {}
+
+
+class ConfigGeneration(models.Model):
+    """Single-row counter bumped whenever the gateway configuration changes"""
+
+    value = models.BigIntegerField(
+        default=0, help_text="Current generation of the gateway configuration"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Generation {self.value}"
+
+    @classmethod
+    def current(cls):
+        """Return the current generation without creating the counter row"""
+        return cls.objects.filter(pk=1).values_list("value", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        """Increment the generation so every worker reloads its configuration"""
+        updated = cls.objects.filter(pk=1).update(
+            value=F("value") + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            _, created = cls.objects.get_or_create(pk=1, defaults={"value": 1})
+            if not created:
+                # Another process created the row first
+                cls.objects.filter(pk=1).update(
+                    value=F("value") + 1, updated_at=timezone.now()
+                )
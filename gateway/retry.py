@@ -0,0 +1,172 @@
+import math
+import random
+import threading
+import time
+import requests
+from django.conf import settings
+from .upstream import httpx
+
+# Methods that can be sent twice without changing the outcome
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+
+# Upstream errors retry_on_errors can name, for requests and httpx
+ERROR_KINDS = {
+    "connect": (requests.ConnectionError,)
+    + ((httpx.NetworkError, httpx.RemoteProtocolError) if httpx else ()),
+    "timeout": (requests.Timeout,) + ((httpx.TimeoutException,) if httpx else ()),
+}
+
+
+def parse_list(value):
+    """Split a comma-separated setting into its lowercase entries"""
+    return [item.strip().lower() for item in (value or "").split(",") if item.strip()]
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed upstream request is sent again, for one endpoint.
+
+    Built from the retry_* fields of an ApiEndpoint. Only idempotent methods
+    are retried unless non_idempotent is set, and never a request whose body
+    was streamed from the client, as it can't be read twice. The n-th retry
+    waits a random time up to backoff * 2 ** (n - 1), capped at
+    GATEWAY_RETRY_BACKOFF_MAX_MS, so clients that failed together don't retry
+    together.
+    """
+
+    def __init__(
+        self,
+        max_attempts=1,
+        backoff_ms=100,
+        statuses="",
+        errors="",
+        non_idempotent=False,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff = backoff_ms / 1000
+        self.statuses = frozenset(
+            int(status) for status in parse_list(statuses) if status.isdigit()
+        )
+        self.errors = tuple(
+            error for kind in parse_list(errors) for error in ERROR_KINDS.get(kind, ())
+        )
+        self.non_idempotent = non_idempotent
+
+    @classmethod
+    def for_endpoint(cls, endpoint):
+        """Return the policy of an endpoint, cached on the instance"""
+        policy = getattr(endpoint, "_retry_policy", None)
+        if policy is None:
+            policy = cls(
+                max_attempts=endpoint.retry_max_attempts,
+                backoff_ms=endpoint.retry_backoff_ms,
+                statuses=endpoint.retry_on_statuses,
+                errors=endpoint.retry_on_errors,
+                non_idempotent=endpoint.retry_non_idempotent,
+            )
+            endpoint._retry_policy = policy
+        return policy
+
+    def attempts_for(self, method, content=None):
+        """How many times a request may be sent"""
+        if method.upper() not in IDEMPOTENT_METHODS and not self.non_idempotent:
+            return 1
+        if content is not None and not isinstance(content, bytes):
+            # A streamed body is consumed by the first attempt
+            return 1
+        return max(self.max_attempts, 1)
+
+    def retries_status(self, status):
+        return status in self.statuses
+
+    def retries_error(self, error):
+        return isinstance(error, self.errors)
+
+    def delay(self, retry):
+        """Seconds to wait before the given retry, counted from 1"""
+        cap = getattr(settings, "GATEWAY_RETRY_BACKOFF_MAX_MS", 2000) / 1000
+        return random.uniform(0, min(self.backoff * 2 ** (retry - 1), cap))
+
+
+class RetryBudget:
+    """
+    Caps the retries of the whole process, so they can't multiply the load
+    on upstreams that are already failing.
+
+    Over the last GATEWAY_RETRY_BUDGET_WINDOW seconds, retries may add up to
+    GATEWAY_RETRY_BUDGET_RATIO of the requests, plus
+    GATEWAY_RETRY_BUDGET_MIN_RETRIES so that endpoints with little traffic
+    can retry at all. Beyond that, the failed attempt is the answer.
+    """
+
+    # Number of buckets the rolling window is divided into
+    BUCKETS = 10
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Rolling window of [bucket start, requests, retries]
+        self._buckets = []
+        self.rejected = 0
+
+    @staticmethod
+    def config():
+        return {
+            "ratio": getattr(settings, "GATEWAY_RETRY_BUDGET_RATIO", 0.1),
+            "min_retries": getattr(settings, "GATEWAY_RETRY_BUDGET_MIN_RETRIES", 10),
+            "window": getattr(settings, "GATEWAY_RETRY_BUDGET_WINDOW", 10),
+        }
+
+    def _bucket(self, now, window):
+        width = window / self.BUCKETS
+        start = now - now % width
+        # Drop buckets that left the window
+        self._buckets = [b for b in self._buckets if b[0] > now - window]
+        if not self._buckets or self._buckets[-1][0] != start:
+            self._buckets.append([start, 0, 0])
+        return self._buckets[-1]
+
+    def record_request(self, now=None):
+        """Count a request sent for the first time"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._bucket(now, self.config()["window"])[1] += 1
+
+    def try_retry(self, now=None):
+        """Take a retry from the budget, returns False when it is spent"""
+        now = time.time() if now is None else now
+        config = self.config()
+        with self._lock:
+            bucket = self._bucket(now, config["window"])
+            requests_sent = sum(b[1] for b in self._buckets)
+            retries = sum(b[2] for b in self._buckets)
+            if retries >= config["min_retries"] + config["ratio"] * requests_sent:
+                self.rejected += 1
+                return False
+            bucket[2] += 1
+            return True
+
+    def stats(self, now=None):
+        now = time.time() if now is None else now
+        config = self.config()
+        with self._lock:
+            self._bucket(now, config["window"])
+            requests_sent = sum(b[1] for b in self._buckets)
+            retries = sum(b[2] for b in self._buckets)
+        return {
+            "requests": requests_sent,
+            "retries": retries,
+            "available": max(
+                math.ceil(config["min_retries"] + config["ratio"] * requests_sent)
+                - retries,
+                0,
+            ),
+            "rejected": self.rejected,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._buckets = []
+            self.rejected = 0
+
+
+retry_budget = RetryBudget()
@@ -0,0 +1,195 @@
+import re
+from urllib.parse import quote
+from django.core.exceptions import ValidationError
+
+# A path template segment capturing one segment, "{id}", or all the rest of
+# the path, "{path*}"
+PARAM = re.compile(r"^\{(\w+)(\*?)\}$")
+# Placeholders of captured params in target URLs, e.g. "/images/{id}"
+URL_PARAM = re.compile(r"\{(\w+)\}")
+# Segments params never capture, so they can't climb out of the target path
+UNSAFE_SEGMENTS = frozenset(("", ".", ".."))
+
+
+def split_segments(path):
+    """Split a normalized path into its segments, "/" has none"""
+    path = path.lstrip("/")
+    return path.split("/") if path else []
+
+
+def parse_template(path):
+    """
+    Split a path template into (segments, names, catch_all).
+
+    Param segments are replaced by None and their names listed in order;
+    catch_all names the "{name*}" that ends the template, if any. Raises
+    ValueError for a catch-all that isn't the last segment or a param name
+    used twice.
+    """
+    segments = []
+    names = []
+    catch_all = None
+    parts = split_segments(path)
+    for position, part in enumerate(parts):
+        match = PARAM.match(part)
+        if match is None:
+            segments.append(part)
+            continue
+        name, star = match.groups()
+        if name in names or name == catch_all:
+            raise ValueError(f"Path parameter {name!r} is used twice")
+        if star:
+            if position != len(parts) - 1:
+                raise ValueError(f"{{{name}*}} must be the last segment of the path")
+            catch_all = name
+        else:
+            segments.append(None)
+            names.append(name)
+    return segments, names, catch_all
+
+
+def validate_path_template(path):
+    """Model validator for ApiEndpoint.path"""
+    try:
+        parse_template(path)
+    except ValueError as e:
+        raise ValidationError(str(e))
+
+
+def expand_url(url, params):
+    """Fill the "{name}" placeholders of a target URL with captured params"""
+    if not params:
+        return url
+    return URL_PARAM.sub(
+        lambda match: (
+            quote(params[match.group(1)], safe="/")
+            if match.group(1) in params
+            else match.group(0)
+        ),
+        url,
+    )
+
+
+class _Node:
+    """A path segment, with the routes of paths ending at it by method"""
+
+    __slots__ = ("children", "param", "routes", "catch_all")
+
+    def __init__(self):
+        # Static segments that follow, by segment
+        self.children = {}
+        # Node of a param segment that follows
+        self.param = None
+        # method -> (value, param names)
+        self.routes = {}
+        # method -> (value, param names) of "{name*}" templates ending here
+        self.catch_all = {}
+
+
+class RouteTree:
+    """
+    Path templates of one host, in a tree of their segments.
+
+    A request path is matched segment by segment, a static segment before a
+    "{param}" and both before a "{rest*}" catch-all, backing off to the next
+    choice when a branch has no route for the method. Lookups cost one dict
+    lookup per segment whatever the number of routes, plus the backing off
+    when templates overlap. Params never capture an empty, "." or ".."
+    segment.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+
+    def add(self, template, method, value):
+        """
+        Add a route, the first one added for a template and method wins.
+        Raises ValueError for an invalid template.
+        """
+        segments, names, catch_all = parse_template(template)
+        node = self.root
+        for segment in segments:
+            if segment is None:
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+            else:
+                node = node.children.setdefault(segment, _Node())
+        if catch_all is not None:
+            node.catch_all.setdefault(method, (value, names + [catch_all]))
+        else:
+            node.routes.setdefault(method, (value, names))
+
+    def match(self, method, path):
+        """Return (value, params) for a normalized path, or (None, {})"""
+        values = []
+        found = self._match(self.root, split_segments(path), 0, method, values)
+        if found is None:
+            return None, {}
+        value, names = found
+        return value, dict(zip(names, values))
+
+    def _match(self, node, segments, position, method, values):
+        if position == len(segments):
+            found = node.routes.get(method)
+            if found is not None:
+                return found
+        else:
+            segment = segments[position]
+            child = node.children.get(segment)
+            if child is not None:
+                found = self._match(child, segments, position + 1, method, values)
+                if found is not None:
+                    return found
+            if node.param is not None and segment not in UNSAFE_SEGMENTS:
+                values.append(segment)
+                found = self._match(node.param, segments, position + 1, method, values)
+                if found is not None:
+                    return found
+                values.pop()
+
+        found = node.catch_all.get(method)
+        if found is not None:
+            rest = segments[position:]
+            if not any(segment in (".", "..") for segment in rest):
+                values.append("/".join(rest))
+                return found
+        return None
+
+
+class PrefixTrie:
+    """
+    The literal beginnings of path templates, up to their first param, in a
+    trie of segments.
+
+    A path that doesn't start with one of them can't match any template, so
+    may_match() rejects it after walking at most as many segments as the
+    longest beginning. Paths it accepts may still not match.
+    """
+
+    # Key marking the end of a template's literal beginning, segments are
+    # always strings
+    END = None
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, template):
+        """Add a template, raises ValueError if it is invalid"""
+        segments, _, _ = parse_template(template)
+        node = self.root
+        for segment in segments:
+            if segment is None:
+                break
+            node = node.setdefault(segment, {})
+        node[self.END] = True
+
+    def may_match(self, path):
+        node = self.root
+        for segment in split_segments(path):
+            if self.END in node:
+                return True
+            node = node.get(segment)
+            if node is None:
+                return False
+        return self.END in node
@@ -0,0 +1,242 @@
+import threading
+import time
+from django.conf import settings
+from django.db.models import Prefetch
+from .models import (
+    Domain,
+    ApiEndpoint,
+    RequestTransformation,
+    ResponseTransformation,
+    ConfigGeneration,
+    UpstreamTarget,
+)
+from .balancer import endpoint_pool
+from .route_tree import PrefixTrie, RouteTree
+from .transformations import TransformationPlan
+
+
+def normalize_path(path):
+    """Normalize the path to match the format stored in the database"""
+    # Remove trailing slash if present (except for root path)
+    if path != "/" and path.endswith("/"):
+        path = path[:-1]
+    return path
+
+
+class RouteSnapshot:
+    """Immutable view of the active routing rules at one point in time"""
+
+    def __init__(
+        self, trees, hosts, default_host, generation=0, pools=None, prefixes=None
+    ):
+        # Maps a host to the RouteTree of its ApiEndpoints, with their active
+        # transformations preloaded and compiled
+        self.trees = trees
+        # Maps a host to the PrefixTrie of its endpoint paths, to reject
+        # requests no endpoint can match before anything else is done
+        self.prefixes = prefixes or {}
+        # Names of all active domains
+        self.hosts = hosts
+        # Domain used for /api/ requests on hosts that are not a known domain
+        self.default_host = default_host
+        # ConfigGeneration value the snapshot was built from
+        self.generation = generation
+        # Upstream pools the active endpoints use, with their targets, by pk
+        self.pools = pools or {}
+
+
+class RouteTable:
+    """
+    Per-process routing table built from the Domain and ApiEndpoint rows.
+
+    Matching a request walks the route tree of its host, one dictionary
+    lookup per path segment, so the request path does not touch the
+    database. Endpoint paths are templates: "/images/{id}" captures a
+    segment and "/files/{path*}" the rest of the path. The table is loaded lazily and
+    thrown away by invalidate(), which the model signals call whenever a
+    routing rule changes.
+
+    Changes made by other processes are picked up through ConfigGeneration:
+    at most once per GATEWAY_CONFIG_CHECK_INTERVAL_MS the table reads the
+    counter and reloads if it moved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = 0
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        """Drop the current snapshot so the next lookup rebuilds it"""
+        with self._lock:
+            self._version += 1
+            self._snapshot = None
+
+    def current(self):
+        """
+        Return the snapshot if it can be used without touching the database.
+
+        Returns None when the table has to be built or the generation counter
+        is due for a check; async callers then run snapshot() in a thread.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or self._check_due():
+            return None
+        return snapshot
+
+    def snapshot(self):
+        """Return the current snapshot, building it if necessary"""
+        snapshot = self._snapshot
+        if snapshot is not None and not self._generation_changed(snapshot):
+            return snapshot
+
+        with self._lock:
+            version = self._version
+            snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        # Build outside the lock so slow queries don't block other threads
+        snapshot = self._build()
+        with self._lock:
+            # Only publish if no rule changed while we were reading
+            if self._version == version:
+                self._snapshot = snapshot
+        return snapshot
+
+    def _check_due(self):
+        interval = getattr(settings, "GATEWAY_CONFIG_CHECK_INTERVAL_MS", 1000)
+        return (time.monotonic() - self._checked_at) * 1000 >= interval
+
+    def _generation_changed(self, snapshot):
+        """Check the shared generation counter, rate limited per process"""
+        if not self._check_due():
+            return False
+
+        self._checked_at = time.monotonic()
+        if ConfigGeneration.current() == snapshot.generation:
+            return False
+
+        self.invalidate()
+        return True
+
+    def _build(self):
+        # Read the generation first so a concurrent change triggers a reload
+        generation = ConfigGeneration.current()
+        self._checked_at = time.monotonic()
+
+        trees = {}
+        prefixes = {}
+        pools = {}
+        active_targets = UpstreamTarget.objects.filter(is_active=True).order_by("id")
+        endpoints = (
+            ApiEndpoint.objects.filter(is_active=True, domain__is_active=True)
+            .select_related("domain", "upstream_pool", "domain__upstream_pool")
+            .prefetch_related(
+                Prefetch(
+                    "request_transformations",
+                    queryset=RequestTransformation.objects.filter(
+                        is_active=True
+                    ).order_by("id"),
+                    to_attr="active_request_transformations",
+                ),
+                Prefetch(
+                    "response_transformations",
+                    queryset=ResponseTransformation.objects.filter(
+                        is_active=True
+                    ).order_by("id"),
+                    to_attr="active_response_transformations",
+                ),
+                Prefetch(
+                    "upstream_pool__targets",
+                    queryset=active_targets,
+                    to_attr="active_targets",
+                ),
+                Prefetch(
+                    "domain__upstream_pool__targets",
+                    queryset=active_targets,
+                    to_attr="active_targets",
+                ),
+            )
+            .order_by("id")
+        )
+        for endpoint in endpoints:
+            # Lets caches tell entries built from older rules apart
+            endpoint.config_generation = generation
+            endpoint.request_plan = TransformationPlan(
+                endpoint.active_request_transformations
+            )
+            endpoint.response_plan = TransformationPlan(
+                endpoint.active_response_transformations
+            )
+            tree = trees.setdefault(endpoint.domain.name, RouteTree())
+            try:
+                # Keep the first match, like the previous .first() lookups did
+                tree.add(normalize_path(endpoint.path), endpoint.method, endpoint)
+            except ValueError:
+                # Saved before paths were validated, it can never match
+                continue
+            prefix = prefixes.setdefault(endpoint.domain.name, PrefixTrie())
+            prefix.add(normalize_path(endpoint.path))
+            pool = endpoint_pool(endpoint)
+            if pool is not None:
+                pools.setdefault(pool.pk, pool)
+
+        hosts = frozenset(
+            Domain.objects.filter(is_active=True).values_list("name", flat=True)
+        )
+        default_host = (
+            Domain.objects.filter(is_active=True)
+            .order_by("pk")
+            .values_list("name", flat=True)
+            .first()
+        )
+        return RouteSnapshot(trees, hosts, default_host, generation, pools, prefixes)
+
+    def may_match(self, host, path, snapshot=None):
+        """
+        Whether an endpoint could match a request to host and path, whatever
+        its method; cheaper than lookup() and never wrong when it says no
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        if host not in snapshot.hosts:
+            if not path.startswith("/api/") or snapshot.default_host is None:
+                return False
+            host, path = snapshot.default_host, path[4:]
+        prefix = snapshot.prefixes.get(host)
+        return prefix is not None and prefix.may_match(normalize_path(path))
+
+    def lookup(self, host, method, path, snapshot=None):
+        """
+        Return the active endpoint for a request and the params its path
+        template captured, or (None, {}) if there is none
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        path = normalize_path(path)
+
+        if host in snapshot.hosts:
+            return self._lookup(snapshot, host, method, path)
+
+        # If the request starts with /api/, try the default domain
+        if path.startswith("/api/") and snapshot.default_host is not None:
+            # Remove /api/ prefix for matching
+            api_path = normalize_path(path[4:])
+            return self._lookup(snapshot, snapshot.default_host, method, api_path)
+
+        return None, {}
+
+    def _lookup(self, snapshot, host, method, path):
+        tree = snapshot.trees.get(host)
+        if tree is None:
+            return None, {}
+        return tree.match(method, path)
+
+    def match(self, host, method, path, snapshot=None):
+        """Return the active endpoint for a request, or None if there is none"""
+        return self.lookup(host, method, path, snapshot)[0]
+
+
+route_table = RouteTable()
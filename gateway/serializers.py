@@ -5,6 +5,8 @@ from .models import (
     RequestTransformation,
     ResponseTransformation,
     ApiLog,
+    UpstreamPool,
+    UpstreamTarget,
 )
 
 
@@ -40,6 +42,39 @@ class ResponseTransformationSerializer(serializers.ModelSerializer):
         ]
 
 
+class UpstreamTargetSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UpstreamTarget
+        fields = [
+            "id",
+            "pool",
+            "url",
+            "weight",
+            "is_active",
+            "created_at",
+            "updated_at",
+        ]
+
+
+class UpstreamPoolSerializer(serializers.ModelSerializer):
+    targets = UpstreamTargetSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = UpstreamPool
+        fields = [
+            "id",
+            "name",
+            "strategy",
+            "health_check_path",
+            "health_check_interval",
+            "health_check_expected_status",
+            "description",
+            "created_at",
+            "updated_at",
+            "targets",
+        ]
+
+
 class ApiEndpointSerializer(serializers.ModelSerializer):
     request_transformations = RequestTransformationSerializer(many=True, read_only=True)
     response_transformations = ResponseTransformationSerializer(
@@ -55,6 +90,30 @@ class ApiEndpointSerializer(serializers.ModelSerializer):
             "method",
             "target_url",
             "timeout",
+            "connect_timeout",
+            "read_timeout",
+            "stream_request",
+            "stream_response",
+            "upstream_pool",
+            "max_concurrent_requests",
+            "retry_max_attempts",
+            "retry_backoff_ms",
+            "retry_on_statuses",
+            "retry_on_errors",
+            "retry_non_idempotent",
+            "hedge_requests",
+            "hedge_delay_ms",
+            "cache_ttl",
+            "cache_stale_while_revalidate",
+            "cache_stale_if_error",
+            "cache_query_params",
+            "cache_vary_headers",
+            "log_sample_rate",
+            "log_errors_only",
+            "log_metadata_only",
+            "log_max_body_bytes",
+            "log_header_allowlist",
+            "log_header_denylist",
             "is_active",
             "created_at",
             "updated_at",
@@ -74,6 +133,10 @@ class DomainSerializer(serializers.ModelSerializer):
             "base_url",
             "description",
             "is_active",
+            "pool_maxsize",
+            "pool_block",
+            "max_concurrent_requests",
+            "upstream_pool",
             "created_at",
             "updated_at",
             "endpoints",
@@ -94,6 +157,8 @@ class ApiLogSerializer(serializers.ModelSerializer):
             "response_headers",
             "response_body",
             "execution_time",
+            "queue_time",
+            "retries",
             "created_at",
         ]
         read_only_fields = fields
@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from .models import (
+    Domain,
+    ApiEndpoint,
+    RequestTransformation,
+    ResponseTransformation,
+    ConfigGeneration,
+    UpstreamPool,
+    UpstreamTarget,
+)
+from .routing import route_table
+
+CONFIG_MODELS = (
+    Domain,
+    ApiEndpoint,
+    RequestTransformation,
+    ResponseTransformation,
+    UpstreamPool,
+    UpstreamTarget,
+)
+
+
+def config_changed(sender, **kwargs):
+    """Refresh this process and tell the other workers the config changed"""
+    ConfigGeneration.bump()
+    route_table.invalidate()
+    # A request may rebuild the table before the change is committed, so
+    # drop it again once the new rows are visible to other connections
+    transaction.on_commit(route_table.invalidate)
+
+
+for model in CONFIG_MODELS:
+    post_save.connect(config_changed, sender=model)
+    post_delete.connect(config_changed, sender=model)
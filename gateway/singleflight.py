@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """An in-flight call that other threads can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time within the process.
+
+    The first caller for a key runs the function, callers that arrive while
+    it is running wait for it and receive the same result instead of making
+    the call themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self, key):
+        """Whether a call for the key is running"""
+        return key in self._calls
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn, or wait for the running call for the same key.
+
+        Returns a (result, leader) pair, where leader tells whether this caller
+        ran fn. Waiting callers get None if the call failed or didn't finish
+        within timeout seconds.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait(timeout)
+            return call.result, False
+
+        try:
+            call.result = fn()
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, True
+
+
+class AsyncSingleFlight:
+    """Async version of SingleFlight, coalesces calls within one event loop"""
+
+    def __init__(self):
+        self._calls = {}
+
+    def in_flight(self, key):
+        """Whether a call for the key is running on the current event loop"""
+        future = self._calls.get(key)
+        return future is not None and future.get_loop() is asyncio.get_running_loop()
+
+    async def do(self, key, fn, timeout=None):
+        """Await fn(), or wait for the running call for the same key"""
+        loop = asyncio.get_running_loop()
+        future = self._calls.get(key)
+
+        if future is not None and future.get_loop() is loop:
+            try:
+                # Shield so a waiter timing out doesn't cancel the call
+                return await asyncio.wait_for(asyncio.shield(future), timeout), False
+            except asyncio.TimeoutError:
+                return None, False
+
+        future = self._calls[key] = loop.create_future()
+        result = None
+        try:
+            result = await fn()
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+            # Waiters get None if the call failed or was cancelled
+            future.set_result(result)
+        return result, True
+
+
+coalescer = SingleFlight()
+async_coalescer = AsyncSingleFlight()
@@ -0,0 +1,88 @@
+from . import codec
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover
+    ijson = None
+
+
+def can_stream(plan):
+    """
+    Whether responses can be streamed with a plan: without one the body is
+    passed on untouched, otherwise it is transformed with an ArrayTransformer
+    """
+    return not plan or (ijson is not None and plan.streamable)
+
+
+class ArrayTransformer:
+    """
+    Applies a response plan to a JSON body as it arrives, fed chunk by chunk.
+
+    A top-level array is parsed one element at a time with ijson, and each
+    element is transformed with the plan and re-encoded before the next one
+    is read, so only one element is held in memory. Any other document is
+    buffered and transformed as a whole when the body ends, like a response
+    that isn't streamed. Bodies that turn out not to be JSON are passed on
+    unchanged.
+
+    feed() and close() return the bytes to send on, which may be empty.
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+        # None until the first non-whitespace byte tells what the body is
+        self.is_array = None
+        self._buffer = []
+        self._elements = None
+        self._parser = None
+        self._count = 0
+
+    def feed(self, chunk):
+        if self.is_array is None:
+            self._buffer.append(chunk)
+            start = b"".join(self._buffer).lstrip()
+            if not start:
+                return b""
+            self.is_array = start.startswith(b"[")
+            if not self.is_array:
+                return b""
+            self._buffer = []
+            self._elements = ijson.sendable_list()
+            self._parser = ijson.items_coro(self._elements, "item", use_float=True)
+            self._parser.send(start)
+            return b"[" + self._encode_elements()
+
+        if not self.is_array:
+            self._buffer.append(chunk)
+            return b""
+
+        self._parser.send(chunk)
+        return self._encode_elements()
+
+    def close(self):
+        if self.is_array:
+            # Raises if the array isn't complete
+            self._parser.close()
+            return self._encode_elements() + b"]"
+
+        content = b"".join(self._buffer)
+        self._buffer = []
+        if not content:
+            return b""
+        try:
+            return codec.dumps(self.plan.apply_to_response(codec.loads(content)))
+        except (codec.JSONDecodeError, TypeError):
+            # Not JSON, send it on as it is
+            return content
+
+    def _encode_elements(self):
+        """Transform and encode the elements parsed so far"""
+        pieces = []
+        dumps = codec.get_codec().dumps
+        for element in self._elements:
+            if self._count:
+                pieces.append(b",")
+            pieces.append(dumps(self.plan.apply_to_element(self._count, element)))
+            self._count += 1
+        del self._elements[:]
+        return b"".join(pieces)
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import pytest
+from gateway.admission import admission_control
+from gateway.balancer import load_balancers
+from gateway.breaker import circuit_breakers
+from gateway.cache import response_cache
+from gateway.health import health_checker
+from gateway.hedging import hedges
+from gateway.retry import retry_budget
+from gateway.routing import route_table
+
+
+def array_payload(size):
+    """The JSON array /array/<size> answers with"""
+    return [
+        {
+            "id": i,
+            "url": f"https://cdn.example.com/{i}.jpg",
+            "breeds": [{"name": "Bengal"}],
+        }
+        for i in range(size)
+    ]
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """
+    Upstream service for tests that echoes the request back as JSON.
+
+    /status/<code> answers with that status code, /delay/<seconds> waits
+    before answering, /bytes/<n> sends n bytes of binary data and /array/<n>
+    a JSON array of n image-like objects, both in 64 KB writes, and
+    /trickle/<seconds> sends its body a byte every 50 ms for that long. Request
+    bodies may be chunked; only their length and hash are echoed for large
+    ones. Connections are kept alive and every response sets a cookie.
+    """
+
+    # Largest request body echoed back in full
+    ECHO_BODY_LIMIT = 1024 * 1024
+
+    def _read_body(self):
+        """Yield the request body, plain or chunked, in pieces"""
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return
+                yield self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get("Content-Length") or 0)
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, 64 * 1024))
+                remaining -= len(chunk)
+                yield chunk
+
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        body = b""
+        length = 0
+        digest = hashlib.sha256()
+        for chunk in self._read_body():
+            length += len(chunk)
+            digest.update(chunk)
+            if length <= self.ECHO_BODY_LIMIT:
+                body += chunk
+
+        status = 200
+        parts = url.path.strip("/").split("/")
+        if parts[0] == "bytes" and len(parts) > 1:
+            return self._send_bytes(int(parts[1]))
+        if parts[0] == "array" and len(parts) > 1:
+            return self._send_array(int(parts[1]))
+        if parts[0] == "trickle" and len(parts) > 1:
+            return self._send_trickle(float(parts[1]))
+        if parts[0] == "status" and len(parts) > 1:
+            status = int(parts[1])
+        elif parts[0] == "delay" and len(parts) > 1:
+            time.sleep(float(parts[1]))
+
+        content = json.dumps(
+            {
+                "method": self.command,
+                "path": url.path,
+                "query": url.query,
+                "headers": dict(self.headers),
+                "body": body.decode("latin-1"),
+                "body_length": length,
+                "body_sha256": digest.hexdigest(),
+            }
+        ).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Set-Cookie", "session=secret; Path=/")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+    def _send_bytes(self, size, chunk_size=64 * 1024):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        chunk = bytes(range(256)) * (chunk_size // 256)
+        while size > 0:
+            self.wfile.write(chunk[:size])
+            size -= len(chunk)
+
+    def _send_array(self, size, chunk_size=64 * 1024):
+        content = json.dumps(array_payload(size)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        for start in range(0, len(content), chunk_size):
+            self.wfile.write(content[start : start + chunk_size])
+
+    def _send_trickle(self, seconds, interval=0.05):
+        size = int(seconds / interval)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        for _ in range(size):
+            self.wfile.write(b"x")
+            self.wfile.flush()
+            time.sleep(interval)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upstream_server():
+    """Run a local upstream service and return its base URL"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def synchronous_logs(settings):
+    """Save API logs right away so tests see them inside their transaction"""
+    settings.GATEWAY_LOG_ASYNC = False
+
+
+# Process-wide registries a test may leave state in
+REGISTRIES = (
+    response_cache,
+    admission_control,
+    circuit_breakers,
+    load_balancers,
+    retry_budget,
+    hedges,
+)
+
+
+def reset_registries():
+    route_table.invalidate()
+    for registry in REGISTRIES:
+        registry.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_gateway_state(settings):
+    """
+    Make sure no routes, cached responses, concurrency counts, breakers,
+    ejected targets, retry budget or learned latencies leak from one test to
+    the next, and run health checks only when a test asks for them
+    """
+    settings.GATEWAY_HEALTH_CHECKS = False
+    reset_registries()
+    yield
+    health_checker.stop()
+    reset_registries()
@@ -0,0 +1,278 @@
+import asyncio
+import threading
+import time
+import pytest
+import requests
+from asgiref.sync import async_to_sync
+from unittest.mock import patch, MagicMock
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory
+from rest_framework.test import APIClient
+from gateway.admission import ConcurrencyLimit, admission_control
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import ApiEndpoint, ApiLog, Domain
+from gateway.routing import route_table
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture(autouse=True)
+def short_queue(settings):
+    settings.GATEWAY_ADMISSION_QUEUE_SIZE = 10
+    settings.GATEWAY_ADMISSION_QUEUE_TIMEOUT_MS = 20
+
+
+def create_endpoint(name, path, endpoint_limit=0, domain_limit=0):
+    domain, _ = Domain.objects.get_or_create(
+        name=name,
+        defaults={
+            "base_url": f"https://{name}",
+            "max_concurrent_requests": domain_limit,
+        },
+    )
+    ApiEndpoint.objects.create(
+        domain=domain,
+        path=path,
+        method="GET",
+        target_url=f"https://{name}/v1{path}",
+        max_concurrent_requests=endpoint_limit,
+    )
+    # The instance the gateway works with, as loaded by the routing table
+    route_table.invalidate()
+    return route_table.match(name, "GET", path)
+
+
+def upstream_response():
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b'{"id": "abc"}'
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def gateway_request(host, path):
+    request = RequestFactory().get(path)
+    request.META["HTTP_HOST"] = host
+    return request
+
+
+def test_limit_rejects_without_queue():
+    limit = ConcurrencyLimit(2)
+
+    assert limit.acquire(0, queue_size=0)
+    assert limit.acquire(0, queue_size=0)
+    assert not limit.acquire(1, queue_size=0)
+
+    limit.release()
+    assert limit.acquire(0, queue_size=0)
+    assert limit.stats()["rejected"] == 1
+    assert limit.stats()["in_flight"] == 2
+
+
+def test_waiter_times_out():
+    """Test that a request waits at most its timeout for a slot"""
+    limit = ConcurrencyLimit(1)
+    limit.acquire(0, queue_size=1)
+
+    start = time.monotonic()
+    assert not limit.acquire(0.05, queue_size=1)
+
+    assert time.monotonic() - start >= 0.05
+    stats = limit.stats()
+    assert (stats["queued"], stats["rejected"], stats["waiting"]) == (1, 1, 0)
+
+
+def test_released_slot_goes_to_oldest_waiter():
+    limit = ConcurrencyLimit(1)
+    limit.acquire(0, queue_size=2)
+    order = []
+
+    def wait(name):
+        if limit.acquire(1, queue_size=2):
+            order.append(name)
+
+    first = threading.Thread(target=wait, args=("first",))
+    first.start()
+    while not limit.stats()["waiting"]:
+        time.sleep(0.001)
+    second = threading.Thread(target=wait, args=("second",))
+    second.start()
+    while limit.stats()["waiting"] < 2:
+        time.sleep(0.001)
+
+    limit.release()
+    first.join()
+    limit.release()
+    second.join()
+
+    assert order == ["first", "second"]
+    assert limit.stats()["in_flight"] == 1
+
+
+def test_async_waiter_gets_slot_released_by_thread():
+    limit = ConcurrencyLimit(1)
+    limit.acquire(0, queue_size=1)
+
+    async def wait():
+        threading.Timer(0.02, limit.release).start()
+        return await limit.aacquire(1, queue_size=1)
+
+    assert async_to_sync(wait)()
+    assert limit.stats()["queue_time"] >= 0.02
+
+
+def test_cancelled_async_waiter_leaves_queue():
+    limit = ConcurrencyLimit(1)
+    limit.acquire(0, queue_size=1)
+
+    async def wait():
+        task = asyncio.ensure_future(limit.aacquire(1, queue_size=1))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    async_to_sync(wait)()
+
+    limit.release()
+    assert limit.stats()["waiting"] == 0
+    assert limit.stats()["in_flight"] == 0
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_request_over_limit_is_rejected(mock_request, middleware):
+    """Test that a request over the endpoint's limit gets a 503 with Retry-After"""
+    endpoint = create_endpoint("example.com", "/images", endpoint_limit=1)
+    busy = admission_control.admit(endpoint)
+
+    response = middleware(gateway_request("example.com", "/images"))
+
+    assert response.status_code == 503
+    assert response["Retry-After"] == "1"
+    mock_request.assert_not_called()
+    assert ApiLog.objects.get().response_status == 503
+
+    busy.release()
+    mock_request.return_value = upstream_response()
+    assert middleware(gateway_request("example.com", "/images")).status_code == 200
+
+
+@pytest.mark.django_db
+def test_async_request_over_limit_is_rejected():
+    endpoint = create_endpoint("example.com", "/images", endpoint_limit=1)
+    busy = admission_control.admit(endpoint)
+
+    async def get_response(request):
+        return HttpResponse("Default response")
+
+    middleware = ApiGatewayMiddleware(get_response)
+    request = AsyncRequestFactory().get("/images")
+    request.META["HTTP_HOST"] = "example.com"
+
+    response = async_to_sync(middleware)(request)
+
+    assert response.status_code == 503
+    assert response["Retry-After"] == "1"
+    busy.release()
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_queue_wait_is_logged(mock_request, middleware, settings):
+    """Test that a request waits for a slot and its wait ends up in ApiLog"""
+    settings.GATEWAY_ADMISSION_QUEUE_TIMEOUT_MS = 2000
+    mock_request.return_value = upstream_response()
+    endpoint = create_endpoint("example.com", "/images", endpoint_limit=1)
+    busy = admission_control.admit(endpoint)
+    threading.Timer(0.05, busy.release).start()
+
+    response = middleware(gateway_request("example.com", "/images"))
+
+    assert response.status_code == 200
+    assert ApiLog.objects.get().queue_time >= 0.04
+    stats = admission_control.stats("endpoint", endpoint)
+    assert (stats["queued"], stats["in_flight"]) == (1, 0)
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_unlimited_requests_log_no_queue_time(mock_request, middleware):
+    mock_request.return_value = upstream_response()
+    create_endpoint("example.com", "/images")
+
+    middleware(gateway_request("example.com", "/images"))
+
+    assert ApiLog.objects.get().queue_time is None
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_domain_limit_covers_its_endpoints_only(mock_request, middleware):
+    """Test that a saturated domain doesn't affect other domains"""
+    mock_request.return_value = upstream_response()
+    images = create_endpoint("slow.example.com", "/images", domain_limit=1)
+    create_endpoint("slow.example.com", "/breeds")
+    create_endpoint("fast.example.com", "/images", domain_limit=1)
+    busy = admission_control.admit(images)
+
+    slow = middleware(gateway_request("slow.example.com", "/breeds"))
+    fast = middleware(gateway_request("fast.example.com", "/images"))
+
+    assert slow.status_code == 503
+    assert fast.status_code == 200
+    busy.release()
+
+
+@pytest.mark.django_db
+def test_streamed_response_holds_slot_until_closed(middleware, upstream_server):
+    endpoint = create_endpoint("example.com", "/download", endpoint_limit=1)
+    ApiEndpoint.objects.filter(pk=endpoint.pk).update(
+        target_url=f"{upstream_server}/bytes/1024", stream_response=True
+    )
+    route_table.invalidate()
+
+    response = middleware(gateway_request("example.com", "/download"))
+
+    assert response.streaming
+    assert admission_control.stats("endpoint", endpoint)["in_flight"] == 1
+    b"".join(response.streaming_content)
+    response.close()
+    assert admission_control.stats("endpoint", endpoint)["in_flight"] == 0
+
+
+@pytest.mark.django_db
+def test_unread_streamed_response_releases_slot_when_closed(
+    middleware, upstream_server
+):
+    endpoint = create_endpoint("example.com", "/download", endpoint_limit=1)
+    ApiEndpoint.objects.filter(pk=endpoint.pk).update(
+        target_url=f"{upstream_server}/bytes/1024", stream_response=True
+    )
+    route_table.invalidate()
+
+    response = middleware(gateway_request("example.com", "/download"))
+    response.close()
+
+    assert admission_control.stats("endpoint", endpoint)["in_flight"] == 0
+
+
+@pytest.mark.django_db
+def test_concurrency_stats_api():
+    """Test the concurrency counters of the management API"""
+    endpoint = create_endpoint("example.com", "/images", domain_limit=3)
+    client = APIClient()
+
+    endpoint_stats = client.get(f"/api/v1/endpoints/{endpoint.id}/concurrency_stats/")
+    domain_stats = client.get(
+        f"/api/v1/domains/{endpoint.domain_id}/concurrency_stats/"
+    )
+
+    assert endpoint_stats.status_code == 200
+    assert endpoint_stats.json()["limit"] == 0
+    assert domain_stats.json()["limit"] == 3
+    assert domain_stats.json()["rejected"] == 0
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import time
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import Domain, ApiEndpoint, ApiLog, ResponseTransformation
+from gateway.routing import route_table
+
+
+async def async_get_response(request):
+    return HttpResponse("Default response")
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance in an async middleware stack"""
+    return ApiGatewayMiddleware(async_get_response)
+
+
+@pytest.fixture
+def request_factory():
+    """Create a request factory for generating async test requests"""
+    return AsyncRequestFactory()
+
+
+@pytest.fixture
+def domain(db):
+    """Create a test domain"""
+    return Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+
+
+def gateway_request(request_factory, path):
+    request = request_factory.get(path)
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+def create_endpoint(domain, path, target_url):
+    return ApiEndpoint.objects.create(
+        domain=domain, path=path, method="GET", target_url=target_url, timeout=5
+    )
+
+
+def test_middleware_is_async_capable(middleware):
+    """Test that the middleware runs natively in an async stack"""
+    assert ApiGatewayMiddleware.async_capable is True
+    assert iscoroutinefunction(middleware)
+
+
+@pytest.mark.django_db
+def test_async_proxy_request(middleware, request_factory, domain, upstream_server):
+    """Test that an async request is proxied to the target service"""
+    create_endpoint(domain, "/test", f"{upstream_server}/echo")
+
+    request = gateway_request(request_factory, "/test?limit=1")
+    response = async_to_sync(middleware)(request)
+
+    assert response.status_code == 200
+    data = json.loads(response.content)
+    assert data["path"] == "/echo"
+    assert data["query"] == "limit=1"
+    assert ApiLog.objects.filter(response_status=200).count() == 1
+
+
+@pytest.mark.django_db
+def test_async_response_transformations(
+    middleware, request_factory, domain, upstream_server
+):
+    """Test that response transformations run on the async path"""
+    endpoint = create_endpoint(domain, "/test", f"{upstream_server}/echo")
+    ResponseTransformation.objects.create(
+        endpoint=endpoint, source_field="path", target_field="upstream_path"
+    )
+
+    request = gateway_request(request_factory, "/test")
+    response = async_to_sync(middleware)(request)
+
+    assert json.loads(response.content)["upstream_path"] == "/echo"
+
+
+@pytest.mark.django_db
+def test_async_routing_without_queries(
+    middleware, request_factory, domain, django_assert_num_queries
+):
+    """Test that async routing uses the loaded table without the database"""
+    endpoint = create_endpoint(domain, "/test", "https://example.com/api/test")
+    route_table.snapshot()
+
+    request = gateway_request(request_factory, "/test")
+    with django_assert_num_queries(0):
+        assert async_to_sync(middleware._afind_endpoint)(request) == endpoint
+
+
+@pytest.mark.django_db
+def test_async_upstream_error(middleware, request_factory, domain):
+    """Test that connection errors on the async path return a 502"""
+    create_endpoint(domain, "/test", "http://127.0.0.1:9/unreachable")
+
+    request = gateway_request(request_factory, "/test")
+    response = async_to_sync(middleware)(request)
+
+    assert response.status_code == 502
+    assert json.loads(response.content)["error"] == "Gateway Error"
+
+
+@pytest.mark.django_db
+def test_async_passes_through_other_requests(middleware, request_factory, domain):
+    """Test that non-gateway requests go to the next async handler"""
+    request = request_factory.get("/admin/login/")
+    response = async_to_sync(middleware)(request)
+
+    assert response.content == b"Default response"
+
+
+@pytest.mark.django_db
+def test_async_requests_run_concurrently(
+    middleware, request_factory, domain, upstream_server
+):
+    """Test that slow upstream calls overlap instead of running one by one"""
+    create_endpoint(domain, "/slow", f"{upstream_server}/delay/0.3")
+    route_table.snapshot()
+
+    async def run_all():
+        requests = [gateway_request(request_factory, "/slow") for _ in range(20)]
+        return await asyncio.gather(*(middleware(request) for request in requests))
+
+    start = time.monotonic()
+    responses = async_to_sync(run_all)()
+    elapsed = time.monotonic() - start
+
+    assert all(response.status_code == 200 for response in responses)
+    # Run one after the other these would take 6 seconds
+    assert elapsed < 3
+
+
+@pytest.mark.django_db
+def test_async_without_httpx_uses_thread(
+    middleware, request_factory, domain, upstream_server, monkeypatch
+):
+    """Test that the async path falls back to requests when httpx is missing"""
+    monkeypatch.setattr("gateway.middleware.httpx", None)
+    create_endpoint(domain, "/test", f"{upstream_server}/echo")
+
+    response = async_to_sync(middleware)(gateway_request(request_factory, "/test"))
+
+    assert response.status_code == 200
+    assert json.loads(response.content)["path"] == "/echo"
@@ -0,0 +1,230 @@
+import pytest
+import requests
+from asgiref.sync import async_to_sync
+from unittest.mock import patch, MagicMock
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from gateway.balancer import LoadBalancer, TargetState, load_balancers
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import ApiEndpoint, Domain, UpstreamPool, UpstreamTarget
+
+
+def targets(*weights):
+    """Unsaved targets, the balancer only reads their url and weight"""
+    return [
+        UpstreamTarget(url=f"http://replica-{i}:8080", weight=weight)
+        for i, weight in enumerate(weights)
+    ]
+
+
+def picks(balancer, count):
+    chosen = []
+    for _ in range(count):
+        target = balancer.choose()
+        balancer.release(target)
+        chosen.append(target.url[-6])
+    return "".join(chosen)
+
+
+def test_weighted_round_robin_is_interleaved():
+    balancer = LoadBalancer("round_robin", targets(3, 1))
+
+    assert picks(balancer, 8) == "00100010"
+
+
+def test_least_outstanding_per_weight():
+    balancer = LoadBalancer("least_outstanding", targets(1, 2))
+    first, second = balancer.targets
+
+    chosen = [balancer.choose() for _ in range(3)]
+
+    assert chosen.count(second) == 2
+    assert (first.outstanding, second.outstanding) == (1, 2)
+
+
+def test_ewma_prefers_fast_targets():
+    balancer = LoadBalancer("ewma", targets(1, 1))
+    fast, slow = balancer.targets
+    fast.observe(0.01, now=0, decay=10)
+    slow.observe(0.5, now=0, decay=10)
+
+    chosen = [balancer.choose() for _ in range(10)]
+    assert chosen == [fast] * 10
+
+    # Until the fast target is expected to make requests wait longer
+    fast.outstanding = 50
+    assert balancer.choose() is slow
+
+
+def test_ewma_spreads_requests_before_any_response():
+    balancer = LoadBalancer("ewma", targets(1, 1, 1))
+
+    chosen = [balancer.choose() for _ in range(3)]
+
+    assert len(set(chosen)) == 3
+
+
+def test_ewma_decays_old_samples():
+    target = TargetState("http://replica:8080", 1)
+    target.observe(1.0, now=0, decay=10)
+
+    target.observe(0.0, now=1000, decay=10)
+
+    assert target.ewma < 0.01
+
+
+def test_target_url_replaces_scheme_and_host():
+    target = TargetState("https://replica-1:8443/prefix/", 1)
+
+    url = target.resolve("http://api.example.com/v1/images?limit=5")
+
+    assert url == "https://replica-1:8443/prefix/v1/images?limit=5"
+
+
+def test_update_keeps_state_of_unchanged_targets():
+    balancer = LoadBalancer("round_robin", targets(1, 1))
+    kept = balancer.targets[0]
+    kept.outstanding = 3
+
+    balancer.update("least_outstanding", targets(1, 5))
+
+    assert balancer.targets[0] is kept
+    assert balancer.targets[1].weight == 5
+    assert balancer.strategy == "least_outstanding"
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture
+def pool(db):
+    """Create a pool of two replicas and an endpoint on a domain using it"""
+    pool = UpstreamPool.objects.create(name="cat-api", strategy="round_robin")
+    UpstreamTarget.objects.create(pool=pool, url="http://replica-1:8080", weight=2)
+    UpstreamTarget.objects.create(pool=pool, url="http://replica-2:8080", weight=1)
+    UpstreamTarget.objects.create(
+        pool=pool, url="http://replica-3:8080", is_active=False
+    )
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", upstream_pool=pool
+    )
+    ApiEndpoint.objects.create(
+        domain=domain,
+        path="/images",
+        method="GET",
+        target_url="https://api.thecatapi.com/v1/images/search",
+    )
+    return pool
+
+
+def gateway_request(path="/images"):
+    request = RequestFactory().get(path, {"limit": "5"})
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+def upstream_response(method, url, **kwargs):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"[]"
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request", side_effect=upstream_response)
+def test_requests_spread_across_pool(mock_request, middleware, pool):
+    """Test that the domain's pool spreads requests by weight"""
+    for _ in range(6):
+        assert middleware(gateway_request()).status_code == 200
+
+    urls = [call.kwargs["url"] for call in mock_request.call_args_list]
+    assert urls.count("http://replica-1:8080/v1/images/search") == 4
+    assert urls.count("http://replica-2:8080/v1/images/search") == 2
+    assert mock_request.call_args.kwargs["params"] == {"limit": "5"}
+
+    stats = load_balancers.stats(pool)
+    assert [t["requests"] for t in stats["targets"]] == [4, 2]
+    assert all(t["outstanding"] == 0 for t in stats["targets"])
+    assert all(t["latency_ewma"] is not None for t in stats["targets"])
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request", side_effect=upstream_response)
+def test_endpoint_pool_overrides_domain_pool(mock_request, middleware, pool):
+    own = UpstreamPool.objects.create(name="images")
+    UpstreamTarget.objects.create(pool=own, url="http://images:9000")
+    ApiEndpoint.objects.update(upstream_pool=own)
+
+    middleware(gateway_request())
+
+    assert mock_request.call_args.kwargs["url"] == "http://images:9000/v1/images/search"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request", side_effect=upstream_response)
+def test_pool_needs_no_queries(mock_request, middleware, pool):
+    """Test that pools and targets are preloaded with the routing table"""
+    middleware(gateway_request())
+
+    with CaptureQueriesContext(connection) as queries:
+        middleware(gateway_request())
+
+    # Only the log entry is written
+    assert len(queries) == 1
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_failed_request_releases_target(mock_request, middleware, pool):
+    mock_request.side_effect = requests.ConnectionError("Connection refused")
+
+    assert middleware(gateway_request()).status_code == 502
+
+    stats = load_balancers.stats(pool)
+    assert [t["outstanding"] for t in stats["targets"]] == [0, 0]
+    # Counted as a response that took the whole timeout, what was left of
+    # the endpoint's 30 seconds when the attempt started
+    assert stats["targets"][0]["latency_ewma"] == pytest.approx(30, abs=0.5)
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.httpx.AsyncClient.send")
+def test_async_requests_spread_across_pool(mock_send, pool):
+    import httpx
+
+    async def send(upstream_request, stream=False):
+        return httpx.Response(200, content=b"[]", request=upstream_request)
+
+    mock_send.side_effect = send
+
+    async def get_response(request):
+        return HttpResponse("Default")
+
+    middleware = ApiGatewayMiddleware(get_response)
+    for _ in range(3):
+        request = AsyncRequestFactory().get("/images")
+        request.META["HTTP_HOST"] = "example.com"
+        async_to_sync(middleware)(request)
+
+    hosts = [call.args[0].url.host for call in mock_send.call_args_list]
+    assert hosts == ["replica-1", "replica-2", "replica-1"]
+
+
+@pytest.mark.django_db
+def test_balancer_stats_api(pool):
+    """Test the per-target counters of the management API"""
+    response = APIClient().get(f"/api/v1/upstream-pools/{pool.id}/balancer_stats/")
+
+    assert response.status_code == 200
+    assert response.json()["strategy"] == "round_robin"
+    assert [t["url"] for t in response.json()["targets"]] == [
+        "http://replica-1:8080",
+        "http://replica-2:8080",
+    ]
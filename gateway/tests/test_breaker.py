@@ -0,0 +1,240 @@
+import time
+import pytest
+import requests
+from unittest.mock import patch, MagicMock
+from django.http import HttpResponse
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory, RequestFactory
+from rest_framework.test import APIClient
+from gateway.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, circuit_breakers
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import ApiEndpoint, ApiLog, Domain, UpstreamPool, UpstreamTarget
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(settings):
+    settings.GATEWAY_BREAKER_FAILURE_RATIO = 0.5
+    settings.GATEWAY_BREAKER_WINDOW = 10
+    settings.GATEWAY_BREAKER_MIN_REQUESTS = 4
+    settings.GATEWAY_BREAKER_OPEN_SECONDS = 5
+    settings.GATEWAY_BREAKER_PROBES = 2
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture
+def domain(db):
+    """Create a test domain with endpoints on two upstream hosts"""
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+    for path, target in [
+        ("/images", "https://slow.example.com/v1/images"),
+        ("/breeds", "https://slow.example.com/v1/breeds"),
+        ("/facts", "https://fast.example.com:8443/facts"),
+    ]:
+        ApiEndpoint.objects.create(
+            domain=domain, path=path, method="GET", target_url=target
+        )
+    return domain
+
+
+def gateway_request(path):
+    request = RequestFactory().get(path)
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+def upstream_response(url):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b'{"ok": true}'
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def fail_slow_host(method, url, **kwargs):
+    """Time out requests to slow.example.com, answer the others"""
+    if "slow.example.com" in url:
+        raise requests.Timeout("Read timed out")
+    return upstream_response(url)
+
+
+def trip(breaker, now=0):
+    for _ in range(4):
+        assert breaker.allow(now)
+        breaker.record(False, now)
+
+
+def test_opens_at_failure_ratio():
+    breaker = CircuitBreaker("example.com")
+    for success in (True, True, False):
+        breaker.allow(0)
+        breaker.record(success, 0)
+    assert breaker.state == CLOSED
+
+    breaker.allow(0)
+    breaker.record(False, 0)
+
+    assert breaker.state == OPEN
+    assert not breaker.allow(1)
+    assert breaker.retry_after(1) == 4
+
+
+def test_needs_min_requests():
+    breaker = CircuitBreaker("example.com")
+    for _ in range(3):
+        breaker.allow(0)
+        breaker.record(False, 0)
+
+    assert breaker.state == CLOSED
+
+
+def test_old_outcomes_leave_the_window():
+    breaker = CircuitBreaker("example.com")
+    for _ in range(3):
+        breaker.record(False, 0)
+
+    # Only one failure is inside the window 15 seconds later
+    breaker.record(False, 15)
+    assert breaker.state == CLOSED
+    assert breaker.stats(15)["failures"] == 1
+
+
+def test_half_open_probes_close_the_breaker():
+    breaker = CircuitBreaker("example.com")
+    trip(breaker)
+
+    assert breaker.allow(5)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow(5)
+    # Only two probes at a time
+    assert not breaker.allow(5)
+
+    breaker.record(True, 6)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 6)
+    assert breaker.state == CLOSED
+    assert breaker.stats(6)["failures"] == 0
+
+
+def test_failed_probe_opens_again():
+    breaker = CircuitBreaker("example.com")
+    trip(breaker)
+
+    assert breaker.allow(5)
+    breaker.record(False, 5)
+
+    assert breaker.state == OPEN
+    assert not breaker.allow(9)
+    assert breaker.stats(9)["times_opened"] == 2
+
+
+def test_abandoned_probe_is_given_back():
+    breaker = CircuitBreaker("example.com")
+    trip(breaker)
+    breaker.allow(5)
+    breaker.allow(5)
+
+    breaker.abandon()
+
+    assert breaker.allow(5)
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request", side_effect=fail_slow_host)
+def test_open_breaker_short_circuits(mock_request, middleware, domain):
+    """Test that requests to a failing host are rejected without calling it"""
+    statuses = [middleware(gateway_request("/images")).status_code for _ in range(4)]
+    assert statuses == [502] * 4
+
+    # Shared by every endpoint on the host
+    response = middleware(gateway_request("/breeds"))
+
+    assert response.status_code == 503
+    assert response["Retry-After"] == "5"
+    assert b"slow.example.com" in response.content
+    assert mock_request.call_count == 4
+    assert ApiLog.objects.filter(response_status=503).count() == 1
+
+    # Other hosts are not affected
+    assert middleware(gateway_request("/facts")).status_code == 200
+
+
+@pytest.mark.django_db
+def test_async_open_breaker_short_circuits(domain):
+    trip(circuit_breakers.get("slow.example.com"), now=time.time())
+
+    async def get_response(request):
+        return HttpResponse("Default response")
+
+    request = AsyncRequestFactory().get("/images")
+    request.META["HTTP_HOST"] = "example.com"
+
+    response = async_to_sync(ApiGatewayMiddleware(get_response))(request)
+
+    assert response.status_code == 503
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_upstream_errors_count_as_failures(mock_request, middleware, domain):
+    error = upstream_response("")
+    error.status_code = 503
+    mock_request.return_value = error
+
+    for _ in range(4):
+        middleware(gateway_request("/images"))
+
+    assert circuit_breakers.find("slow.example.com").state == OPEN
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request", side_effect=fail_slow_host)
+def test_pooled_endpoints_skip_the_breaker(mock_request, middleware, domain):
+    pool = UpstreamPool.objects.create(name="images")
+    UpstreamTarget.objects.create(pool=pool, url="https://slow.example.com")
+    UpstreamTarget.objects.create(pool=pool, url="https://fast.example.com")
+    ApiEndpoint.objects.filter(path="/images").update(upstream_pool=pool)
+
+    statuses = [middleware(gateway_request("/images")).status_code for _ in range(8)]
+
+    # The failing replica doesn't cut off the healthy one
+    assert statuses.count(200) == 4
+    assert circuit_breakers.find("slow.example.com") is None
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request", side_effect=fail_slow_host)
+def test_breaker_can_be_disabled(mock_request, middleware, domain, settings):
+    settings.GATEWAY_BREAKER_ENABLED = False
+
+    statuses = [middleware(gateway_request("/images")).status_code for _ in range(6)]
+
+    assert statuses == [502] * 6
+    assert circuit_breakers.stats() == []
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request", side_effect=fail_slow_host)
+def test_breakers_api(mock_request, middleware, domain):
+    """Test listing, inspecting and resetting breakers via the management API"""
+    for path in ["/facts"] + ["/images"] * 4:
+        middleware(gateway_request(path))
+    client = APIClient()
+
+    listed = client.get("/api/v1/breakers/").json()
+    detail = client.get("/api/v1/breakers/slow.example.com/")
+    reset = client.post("/api/v1/breakers/slow.example.com/reset/")
+
+    assert [(b["host"], b["state"]) for b in listed] == [
+        ("fast.example.com:8443", "closed"),
+        ("slow.example.com", "open"),
+    ]
+    assert detail.json()["failures"] == 4
+    assert reset.json()["state"] == "closed"
+    assert client.get("/api/v1/breakers/unknown.example.com/").status_code == 404
@@ -0,0 +1,416 @@
+import json
+import pytest
+import requests
+from asgiref.sync import async_to_sync
+from unittest.mock import patch, MagicMock
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory
+from rest_framework.test import APIClient
+from gateway.cache import CachedResponse, LocalMemoryBackend
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import Domain, ApiEndpoint, ResponseTransformation, ApiLog
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture
+def domain(db):
+    """Create a test domain"""
+    return Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+
+
+@pytest.fixture
+def api_endpoint(domain):
+    """Create a cached test API endpoint"""
+    return ApiEndpoint.objects.create(
+        domain=domain,
+        path="/images/search",
+        method="GET",
+        target_url="https://example.com/v1/images/search",
+        cache_ttl=60,
+    )
+
+
+def upstream_response(content=b'{"id": "abc"}', status=200, headers=None):
+    """Build the requests.Response the upstream would return"""
+    response = requests.Response()
+    response.status_code = status
+    response._content = content
+    response.headers.update(headers or {"Content-Type": "application/json"})
+    return response
+
+
+def gateway_request(path="/images/search", **headers):
+    request = RequestFactory().get(path, **headers)
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_cache_hit_skips_upstream(mock_request, middleware, api_endpoint):
+    """Test that a second request is answered from the cache"""
+    mock_request.return_value = upstream_response()
+
+    first = middleware._handle_api_gateway_request(gateway_request())
+    second = middleware._handle_api_gateway_request(gateway_request())
+
+    assert mock_request.call_count == 1
+    assert first["X-Cache"] == "MISS"
+    assert second["X-Cache"] == "HIT"
+    assert second.content == b'{"id": "abc"}'
+    assert second["Content-Type"] == "application/json"
+    # Hits are still logged
+    assert ApiLog.objects.count() == 2
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_cache_hit_skips_transformations(mock_request, middleware, api_endpoint):
+    """Test that cached responses are stored after transformation"""
+    ResponseTransformation.objects.create(
+        endpoint=api_endpoint, source_field="id", target_field="image_id"
+    )
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request())
+    with patch.object(middleware, "_apply_response_transformations") as transform:
+        response = middleware._handle_api_gateway_request(gateway_request())
+
+    transform.assert_not_called()
+    assert json.loads(response.content)["image_id"] == "abc"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_entries_expire(mock_request, middleware, api_endpoint):
+    """Test that entries are not served after their TTL"""
+    mock_request.return_value = upstream_response()
+
+    with patch("gateway.cache.time.time", return_value=1000.0):
+        middleware._handle_api_gateway_request(gateway_request())
+    with patch("gateway.cache.time.time", return_value=1061.0):
+        response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert mock_request.call_count == 2
+    assert response["X-Cache"] == "MISS"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_uncached_endpoint(mock_request, middleware, api_endpoint):
+    """Test that endpoints without a TTL are not cached"""
+    api_endpoint.cache_ttl = 0
+    api_endpoint.save()
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request())
+    response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert mock_request.call_count == 2
+    assert not response.has_header("X-Cache")
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_uncacheable_responses(mock_request, middleware, api_endpoint):
+    """Test that errors and no-store responses are not cached"""
+    mock_request.side_effect = [
+        upstream_response(status=500),
+        upstream_response(
+            headers={"Content-Type": "application/json", "Cache-Control": "no-store"}
+        ),
+        upstream_response(),
+    ]
+
+    for _ in range(3):
+        middleware._handle_api_gateway_request(gateway_request())
+
+    assert mock_request.call_count == 3
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_authorized_responses_not_shared(mock_request, middleware, api_endpoint):
+    """Test that a response to one client's credentials isn't served to another"""
+    mock_request.side_effect = [
+        upstream_response(b'{"user": "alice"}'),
+        upstream_response(b'{"user": "bob"}'),
+    ]
+
+    middleware._handle_api_gateway_request(
+        gateway_request(HTTP_AUTHORIZATION="Bearer alice")
+    )
+    response = middleware._handle_api_gateway_request(
+        gateway_request(HTTP_AUTHORIZATION="Bearer bob")
+    )
+
+    assert mock_request.call_count == 2
+    assert response["X-Cache"] == "MISS"
+    assert response.content == b'{"user": "bob"}'
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_cookie_responses_not_shared(mock_request, middleware, api_endpoint):
+    """Test that requests with cookies are treated like authorized ones"""
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request(HTTP_COOKIE="id=alice"))
+    response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert mock_request.call_count == 2
+    assert response["X-Cache"] == "MISS"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_credentials_in_key_are_cached(mock_request, middleware, api_endpoint):
+    """Test that credentials named in the vary headers key the entries"""
+    api_endpoint.cache_vary_headers = "Authorization"
+    api_endpoint.save()
+    mock_request.return_value = upstream_response()
+
+    for token in ("alice", "alice", "bob"):
+        middleware._handle_api_gateway_request(
+            gateway_request(HTTP_AUTHORIZATION=f"Bearer {token}")
+        )
+
+    assert mock_request.call_count == 2
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_public_authorized_response_shared(mock_request, middleware, api_endpoint):
+    """Test that the upstream can mark an authorized response as shared"""
+    mock_request.return_value = upstream_response(
+        headers={"Content-Type": "application/json", "Cache-Control": "public"}
+    )
+
+    middleware._handle_api_gateway_request(
+        gateway_request(HTTP_AUTHORIZATION="Bearer alice")
+    )
+    response = middleware._handle_api_gateway_request(
+        gateway_request(HTTP_AUTHORIZATION="Bearer bob")
+    )
+
+    assert mock_request.call_count == 1
+    assert response["X-Cache"] == "HIT"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_set_cookie_responses_not_stored(mock_request, middleware, api_endpoint):
+    """Test that a cookie set for one client isn't served to others"""
+    mock_request.return_value = upstream_response(
+        headers={"Content-Type": "application/json", "Set-Cookie": "session=secret"}
+    )
+
+    middleware._handle_api_gateway_request(gateway_request())
+    response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert mock_request.call_count == 2
+    assert response["X-Cache"] == "MISS"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_vary_star_not_stored(mock_request, middleware, api_endpoint):
+    """Test that a response varying on everything isn't stored"""
+    mock_request.return_value = upstream_response(
+        headers={"Content-Type": "application/json", "Vary": "*"}
+    )
+
+    middleware._handle_api_gateway_request(gateway_request())
+    middleware._handle_api_gateway_request(gateway_request())
+
+    assert mock_request.call_count == 2
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_upstream_vary_is_honoured(mock_request, middleware, api_endpoint):
+    """Test that entries only answer requests that send their Vary headers alike"""
+    mock_request.side_effect = lambda *args, **kwargs: upstream_response(
+        headers={"Content-Type": "application/json", "Vary": "Accept-Language"}
+    )
+
+    middleware._handle_api_gateway_request(gateway_request(HTTP_ACCEPT_LANGUAGE="en"))
+    german = middleware._handle_api_gateway_request(
+        gateway_request(HTTP_ACCEPT_LANGUAGE="de")
+    )
+    english = middleware._handle_api_gateway_request(
+        gateway_request(HTTP_ACCEPT_LANGUAGE="en")
+    )
+
+    assert german["X-Cache"] == "MISS"
+    # The German response replaced the English one
+    assert english["X-Cache"] == "MISS"
+    assert (
+        middleware._handle_api_gateway_request(
+            gateway_request(HTTP_ACCEPT_LANGUAGE="en")
+        )["X-Cache"]
+        == "HIT"
+    )
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_key_uses_all_query_params_by_default(mock_request, middleware, api_endpoint):
+    """Test that different query strings are cached separately"""
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request("/images/search?limit=1"))
+    middleware._handle_api_gateway_request(gateway_request("/images/search?limit=5"))
+    response = middleware._handle_api_gateway_request(
+        gateway_request("/images/search?limit=5")
+    )
+
+    assert mock_request.call_count == 2
+    assert response["X-Cache"] == "HIT"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_key_uses_selected_query_params(mock_request, middleware, api_endpoint):
+    """Test that only the selected query params are part of the key"""
+    api_endpoint.cache_query_params = "limit"
+    api_endpoint.save()
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(
+        gateway_request("/images/search?limit=1&nonce=a")
+    )
+    response = middleware._handle_api_gateway_request(
+        gateway_request("/images/search?limit=1&nonce=b")
+    )
+
+    assert mock_request.call_count == 1
+    assert response["X-Cache"] == "HIT"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_key_uses_vary_headers(mock_request, middleware, api_endpoint):
+    """Test that the selected headers are part of the key"""
+    api_endpoint.cache_vary_headers = "Accept-Language"
+    api_endpoint.save()
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request(HTTP_ACCEPT_LANGUAGE="en"))
+    middleware._handle_api_gateway_request(gateway_request(HTTP_ACCEPT_LANGUAGE="de"))
+    middleware._handle_api_gateway_request(
+        gateway_request(HTTP_ACCEPT_LANGUAGE="en", HTTP_X_OTHER="1")
+    )
+
+    assert mock_request.call_count == 2
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_rule_change_retires_entries(mock_request, middleware, api_endpoint):
+    """Test that changing a rule stops serving responses cached under the old one"""
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request())
+    api_endpoint.timeout = 10
+    api_endpoint.save()
+    response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert mock_request.call_count == 2
+    assert response["X-Cache"] == "MISS"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_django_cache_backend(mock_request, settings, middleware, api_endpoint):
+    """Test that entries can be kept in the Django cache framework"""
+    settings.GATEWAY_CACHE_BACKEND = "django"
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request())
+    response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert mock_request.call_count == 1
+    assert response["X-Cache"] == "HIT"
+    assert response.content == b'{"id": "abc"}'
+
+
+def test_local_backend_evicts_least_recently_used(settings):
+    """Test that the local backend evicts the least recently used entry"""
+    settings.GATEWAY_CACHE_MAX_ENTRIES = 2
+    backend = LocalMemoryBackend()
+
+    backend.set("a", CachedResponse(200, [], b"a", ttl=60))
+    backend.set("b", CachedResponse(200, [], b"b", ttl=60))
+    backend.get("a")
+    backend.set("c", CachedResponse(200, [], b"c", ttl=60))
+
+    assert backend.get("b") is None
+    assert backend.get("a") is not None
+    assert backend.get("c") is not None
+    assert backend.stats()["evictions"] == 1
+
+
+def test_local_backend_bounded_by_bytes(settings):
+    """Test that the local backend stays under GATEWAY_CACHE_MAX_BYTES"""
+    settings.GATEWAY_CACHE_MAX_BYTES = 250
+    backend = LocalMemoryBackend()
+
+    for key in "abc":
+        backend.set(key, CachedResponse(200, [], b"x" * 100, ttl=60))
+    backend.set("huge", CachedResponse(200, [], b"x" * 300, ttl=60))
+
+    assert backend.get("a") is None
+    assert backend.get("huge") is None
+    assert backend.stats()["bytes"] <= 250
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.httpx.AsyncClient.send")
+def test_async_cache_hit(mock_send, api_endpoint):
+    """Test that the async path serves cache hits too"""
+    import httpx
+
+    async def send(upstream_request, stream=False):
+        return httpx.Response(
+            200,
+            content=b'{"id": "abc"}',
+            headers={"Content-Type": "application/json"},
+            request=upstream_request,
+        )
+
+    mock_send.side_effect = send
+
+    async def get_response(request):
+        return HttpResponse("Default")
+
+    middleware = ApiGatewayMiddleware(get_response)
+
+    def gateway_arequest():
+        request = AsyncRequestFactory().get("/images/search")
+        request.META["HTTP_HOST"] = "example.com"
+        return request
+
+    async_to_sync(middleware._ahandle_api_gateway_request)(gateway_arequest())
+    response = async_to_sync(middleware._ahandle_api_gateway_request)(
+        gateway_arequest()
+    )
+
+    assert mock_send.call_count == 1
+    assert response["X-Cache"] == "HIT"
+
+
+@pytest.mark.django_db
+def test_cache_stats_api():
+    """Test the response cache statistics endpoint of the management API"""
+    response = APIClient().get("/api/v1/endpoints/cache_stats/")
+
+    assert response.status_code == 200
+    assert {"backend", "hits", "misses"} <= set(response.json())
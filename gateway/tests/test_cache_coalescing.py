@@ -0,0 +1,319 @@
+import asyncio
+import threading
+import time
+import pytest
+import requests
+from asgiref.sync import async_to_sync
+from unittest.mock import patch, MagicMock
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory
+from gateway.cache import response_cache
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import Domain, ApiEndpoint
+from gateway.routing import route_table
+from gateway.singleflight import SingleFlight, coalescer
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture
+def api_endpoint(db):
+    """Create a cached test API endpoint with stale windows"""
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+    ApiEndpoint.objects.create(
+        domain=domain,
+        path="/images/search",
+        method="GET",
+        target_url="https://example.com/v1/images/search",
+        cache_ttl=60,
+        cache_stale_while_revalidate=30,
+        cache_stale_if_error=300,
+    )
+    # The instance the gateway works with, as loaded by the routing table
+    return route_table.match("example.com", "GET", "/images/search")
+
+
+def upstream_response(content=b'{"id": "abc"}', status=200):
+    """Build the requests.Response the upstream would return"""
+    response = requests.Response()
+    response.status_code = status
+    response._content = content
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def gateway_request():
+    request = RequestFactory().get("/images/search")
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+def cached_request(middleware, endpoint):
+    """Run a request through the cache without routing or logging"""
+    request = gateway_request()
+    key = response_cache.key(endpoint, request)
+    response, _ = middleware._cached_request(endpoint, request, key, time.time())
+    return response
+
+
+def age_entry(endpoint, seconds):
+    """Move the cached entry for the test request into the past"""
+    entry = response_cache.get(response_cache.key(endpoint, gateway_request()))
+    entry.stored_at -= seconds
+
+
+def wait_for_refresh(endpoint):
+    key = response_cache.key(endpoint, gateway_request())
+    deadline = time.monotonic() + 5
+    while coalescer.in_flight(key) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_stale_served_while_revalidating(mock_request, middleware, api_endpoint):
+    """Test that a stale entry is served while one refresh runs in the background"""
+    mock_request.return_value = upstream_response(b'{"id": "old"}')
+    cached_request(middleware, api_endpoint)
+    age_entry(api_endpoint, 70)
+
+    mock_request.return_value = upstream_response(b'{"id": "new"}')
+    stale = cached_request(middleware, api_endpoint)
+    wait_for_refresh(api_endpoint)
+    fresh = cached_request(middleware, api_endpoint)
+
+    assert stale["X-Cache"] == "STALE"
+    assert stale.content == b'{"id": "old"}'
+    assert fresh["X-Cache"] == "HIT"
+    assert fresh.content == b'{"id": "new"}'
+    assert mock_request.call_count == 2
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_refresh_leaves_the_served_request_alone(
+    mock_request, middleware, api_endpoint
+):
+    """Test that the background refresh doesn't overwrite what gets logged"""
+    mock_request.return_value = upstream_response()
+    cached_request(middleware, api_endpoint)
+    age_entry(api_endpoint, 70)
+
+    request = gateway_request()
+    key = response_cache.key(api_endpoint, request)
+    stale, _ = middleware._cached_request(api_endpoint, request, key, time.time())
+    wait_for_refresh(api_endpoint)
+
+    assert stale["X-Cache"] == "STALE"
+    assert mock_request.call_count == 2
+    assert not hasattr(request, "gateway_deadline")
+    assert not hasattr(request, "gateway_queue_time")
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_refresh_errors_are_logged(mock_request, middleware, api_endpoint, caplog):
+    """Test that a failed background refresh is logged with its traceback"""
+    mock_request.return_value = upstream_response()
+    cached_request(middleware, api_endpoint)
+    age_entry(api_endpoint, 70)
+
+    with patch.object(middleware, "_proxy_request", side_effect=RuntimeError("boom")):
+        stale = cached_request(middleware, api_endpoint)
+        wait_for_refresh(api_endpoint)
+
+    assert stale["X-Cache"] == "STALE"
+    record = next(r for r in caplog.records if r.name == "gateway.middleware")
+    assert record.exc_info[1].args == ("boom",)
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_stale_past_window_fetched_synchronously(
+    mock_request, middleware, api_endpoint
+):
+    """Test that entries past the stale-while-revalidate window are not served"""
+    mock_request.return_value = upstream_response(b'{"id": "old"}')
+    cached_request(middleware, api_endpoint)
+    age_entry(api_endpoint, 95)
+
+    mock_request.return_value = upstream_response(b'{"id": "new"}')
+    response = cached_request(middleware, api_endpoint)
+
+    assert response["X-Cache"] == "MISS"
+    assert response.content == b'{"id": "new"}'
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_stale_served_on_upstream_error(mock_request, middleware, api_endpoint):
+    """Test that a stale entry is served when the upstream fails"""
+    mock_request.return_value = upstream_response(b'{"id": "old"}')
+    cached_request(middleware, api_endpoint)
+    age_entry(api_endpoint, 120)
+
+    mock_request.return_value = upstream_response(b"oops", status=503)
+    on_error_status = cached_request(middleware, api_endpoint)
+    mock_request.side_effect = requests.ConnectionError("Connection refused")
+    on_connection_error = cached_request(middleware, api_endpoint)
+
+    for response in (on_error_status, on_connection_error):
+        assert response.status_code == 200
+        assert response["X-Cache"] == "STALE"
+        assert response.content == b'{"id": "old"}'
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_error_passed_on_past_stale_if_error(mock_request, middleware, api_endpoint):
+    """Test that upstream errors are passed on once the entry is too old"""
+    mock_request.return_value = upstream_response()
+    cached_request(middleware, api_endpoint)
+    age_entry(api_endpoint, 400)
+
+    mock_request.return_value = upstream_response(b"oops", status=503)
+    response = cached_request(middleware, api_endpoint)
+
+    assert response.status_code == 503
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_concurrent_misses_coalesced(mock_request, middleware, api_endpoint):
+    """Test that concurrent identical requests share one upstream call"""
+    release = threading.Event()
+
+    def slow_upstream(*args, **kwargs):
+        release.wait(5)
+        return upstream_response()
+
+    mock_request.side_effect = slow_upstream
+    responses = []
+    threads = [
+        threading.Thread(
+            target=lambda: responses.append(cached_request(middleware, api_endpoint))
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    # Let every thread reach the cache before the upstream answers
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert mock_request.call_count == 1
+    assert sorted(response["X-Cache"] for response in responses) == [
+        "COALESCED",
+        "COALESCED",
+        "COALESCED",
+        "COALESCED",
+        "MISS",
+    ]
+    assert all(response.content == b'{"id": "abc"}' for response in responses)
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_private_response_not_coalesced(mock_request, middleware, api_endpoint):
+    """Test that waiters make their own call when the response isn't cacheable"""
+    release = threading.Event()
+    calls = iter(range(5))
+
+    def slow_private_upstream(*args, **kwargs):
+        call = next(calls)
+        release.wait(5)
+        response = upstream_response(f'{{"call": {call}}}'.encode())
+        response.headers["Cache-Control"] = "private"
+        return response
+
+    mock_request.side_effect = slow_private_upstream
+    responses = []
+    threads = [
+        threading.Thread(
+            target=lambda: responses.append(cached_request(middleware, api_endpoint))
+        )
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert mock_request.call_count == 3
+    assert [response["X-Cache"] for response in responses] == ["MISS"] * 3
+    assert len({response.content for response in responses}) == 3
+
+
+def test_single_flight_waiters_get_none_on_failure():
+    """Test that a failed call doesn't hand a result to waiting callers"""
+    flight = SingleFlight()
+    started = threading.Event()
+    results = []
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("upstream down")
+
+    def lead():
+        with pytest.raises(RuntimeError):
+            flight.do("key", failing)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait(5)
+    results.append(flight.do("key", lambda: "unused"))
+    leader.join(5)
+
+    assert results == [(None, False)]
+    assert not flight.in_flight("key")
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.httpx.AsyncClient.send")
+def test_async_concurrent_misses_coalesced(mock_send, api_endpoint):
+    """Test that the async path coalesces concurrent misses too"""
+    import httpx
+
+    async def send(upstream_request, stream=False):
+        await asyncio.sleep(0.05)
+        return httpx.Response(
+            200,
+            content=b'{"id": "abc"}',
+            headers={"Content-Type": "application/json"},
+            request=upstream_request,
+        )
+
+    mock_send.side_effect = send
+
+    async def get_response(request):
+        return HttpResponse("Default")
+
+    middleware = ApiGatewayMiddleware(get_response)
+
+    async def one_request():
+        request = AsyncRequestFactory().get("/images/search")
+        request.META["HTTP_HOST"] = "example.com"
+        key = response_cache.key(api_endpoint, request)
+        response, _ = await middleware._acached_request(
+            api_endpoint, request, key, time.time()
+        )
+        return response
+
+    async def run():
+        return await asyncio.gather(*(one_request() for _ in range(5)))
+
+    responses = async_to_sync(run)()
+
+    assert mock_send.call_count == 1
+    assert [response["X-Cache"] for response in responses].count("MISS") == 1
@@ -0,0 +1,207 @@
+import pytest
+import requests
+from unittest.mock import patch, MagicMock
+from django.http import HttpResponse
+from django.test import RequestFactory
+from gateway.cache import response_cache
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import Domain, ApiEndpoint
+from gateway.routing import route_table
+
+BREEDS = b'[{"id": "abys", "name": "Abyssinian"}]'
+ETAG = '"breeds-v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture
+def api_endpoint(db):
+    """Create a cached test API endpoint"""
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+    ApiEndpoint.objects.create(
+        domain=domain,
+        path="/breeds",
+        method="GET",
+        target_url="https://example.com/v1/breeds",
+        cache_ttl=60,
+    )
+    # The instance the gateway works with, as loaded by the routing table
+    return route_table.match("example.com", "GET", "/breeds")
+
+
+def upstream_response(content=BREEDS, status=200, **headers):
+    """Build the requests.Response the upstream would return"""
+    response = requests.Response()
+    response.status_code = status
+    response._content = content
+    response.headers["Content-Type"] = "application/json"
+    response.headers.update(headers)
+    return response
+
+
+def gateway_request(**headers):
+    request = RequestFactory().get("/breeds", **headers)
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+def expire_entry(endpoint):
+    """Move the cached entry past its TTL"""
+    entry = response_cache.get(response_cache.key(endpoint, gateway_request()))
+    entry.stored_at -= 120
+
+
+def upstream_headers(mock_request):
+    return mock_request.call_args.kwargs["headers"]
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_stale_entry_revalidated_with_etag(mock_request, middleware, api_endpoint):
+    """Test that a 304 from the upstream refreshes the cached entry"""
+    mock_request.return_value = upstream_response(ETag=ETAG)
+    middleware._handle_api_gateway_request(gateway_request())
+    expire_entry(api_endpoint)
+
+    mock_request.return_value = upstream_response(b"", status=304, ETag=ETAG)
+    revalidated = middleware._handle_api_gateway_request(gateway_request())
+    hit = middleware._handle_api_gateway_request(gateway_request())
+
+    assert upstream_headers(mock_request)["If-None-Match"] == ETAG
+    assert revalidated.status_code == 200
+    assert revalidated.content == BREEDS
+    assert revalidated["X-Cache"] == "REVALIDATED"
+    assert hit["X-Cache"] == "HIT"
+    assert mock_request.call_count == 2
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_stale_entry_revalidated_with_last_modified(
+    mock_request, middleware, api_endpoint
+):
+    """Test that Last-Modified is sent back as If-Modified-Since"""
+    mock_request.return_value = upstream_response(**{"Last-Modified": LAST_MODIFIED})
+    middleware._handle_api_gateway_request(gateway_request())
+    expire_entry(api_endpoint)
+
+    mock_request.return_value = upstream_response(b"", status=304)
+    response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert upstream_headers(mock_request)["If-Modified-Since"] == LAST_MODIFIED
+    assert response.content == BREEDS
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_revalidation_takes_new_validators(mock_request, middleware, api_endpoint):
+    """Test that headers sent with the 304 replace the stored ones"""
+    mock_request.return_value = upstream_response(ETag=ETAG)
+    middleware._handle_api_gateway_request(gateway_request())
+    expire_entry(api_endpoint)
+
+    mock_request.return_value = upstream_response(b"", status=304, ETag='"v2"')
+    response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert response["ETag"] == '"v2"'
+    assert response["Content-Type"] == "application/json"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_changed_resource_replaces_entry(mock_request, middleware, api_endpoint):
+    """Test that a full response to a revalidation replaces the entry"""
+    mock_request.return_value = upstream_response(ETag=ETAG)
+    middleware._handle_api_gateway_request(gateway_request())
+    expire_entry(api_endpoint)
+
+    mock_request.return_value = upstream_response(b"[]", ETag='"v2"')
+    response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert response["X-Cache"] == "MISS"
+    assert response.content == b"[]"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_client_if_none_match_answered_with_304(mock_request, middleware, api_endpoint):
+    """Test that the gateway answers a matching If-None-Match itself"""
+    mock_request.return_value = upstream_response(ETag=ETAG)
+    middleware._handle_api_gateway_request(gateway_request())
+
+    response = middleware._handle_api_gateway_request(
+        gateway_request(HTTP_IF_NONE_MATCH=ETAG)
+    )
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response["ETag"] == ETAG
+    assert response["X-Cache"] == "HIT"
+    assert mock_request.call_count == 1
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_client_if_modified_since_answered_with_304(
+    mock_request, middleware, api_endpoint
+):
+    """Test that the gateway answers If-Modified-Since itself"""
+    mock_request.return_value = upstream_response(**{"Last-Modified": LAST_MODIFIED})
+    middleware._handle_api_gateway_request(gateway_request())
+
+    response = middleware._handle_api_gateway_request(
+        gateway_request(HTTP_IF_MODIFIED_SINCE=LAST_MODIFIED)
+    )
+
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_client_etag_mismatch_gets_body(mock_request, middleware, api_endpoint):
+    """Test that a non-matching If-None-Match gets the full response"""
+    mock_request.return_value = upstream_response(ETag=ETAG)
+    middleware._handle_api_gateway_request(gateway_request())
+
+    response = middleware._handle_api_gateway_request(
+        gateway_request(HTTP_IF_NONE_MATCH='"other"')
+    )
+
+    assert response.status_code == 200
+    assert response.content == BREEDS
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_entries_without_validators_not_kept(mock_request, middleware, api_endpoint):
+    """Test that only entries that can be revalidated outlive their TTL"""
+    mock_request.return_value = upstream_response()
+    middleware._handle_api_gateway_request(gateway_request())
+    key = response_cache.key(api_endpoint, gateway_request())
+    response_cache.get(key).stored_at -= 120
+
+    assert response_cache.get(key) is None
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_client_validators_not_forwarded(mock_request, middleware, api_endpoint):
+    """Test that the client's conditional headers don't reach the upstream"""
+    mock_request.return_value = upstream_response(ETag=ETAG)
+
+    response = middleware._handle_api_gateway_request(
+        gateway_request(HTTP_IF_NONE_MATCH=ETAG)
+    )
+
+    assert "If-None-Match" not in upstream_headers(mock_request)
+    # The response was fetched in full and is cached for everyone else
+    assert response.status_code == 304
+    hit = middleware._handle_api_gateway_request(gateway_request())
+    assert hit.content == BREEDS
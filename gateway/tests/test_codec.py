@@ -0,0 +1,82 @@
+import json
+import pytest
+from gateway import codec
+from gateway.models import ApiLog
+
+PAYLOAD = {"id": "abys", "name": "Abyssinian", "weight": {"metric": "3 - 5"}}
+
+
+@pytest.mark.parametrize("name", ["json", "orjson"])
+def test_round_trip_is_bytes_native(settings, name):
+    """Test that every codec parses bytes and serializes to bytes"""
+    settings.GATEWAY_JSON_CODEC = name
+
+    encoded = codec.dumps(PAYLOAD)
+
+    assert isinstance(encoded, bytes)
+    assert codec.loads(encoded) == PAYLOAD
+    assert codec.loads(encoded.decode()) == PAYLOAD
+    assert codec.dumps_str(PAYLOAD) == encoded.decode()
+
+
+@pytest.mark.parametrize("name", ["json", "orjson"])
+def test_invalid_json_raises_decode_error(settings, name):
+    """Test that callers can catch one exception type for every codec"""
+    settings.GATEWAY_JSON_CODEC = name
+
+    with pytest.raises(codec.JSONDecodeError):
+        codec.loads(b"not json")
+
+
+@pytest.mark.parametrize("name", ["json", "orjson"])
+def test_big_integers_keep_their_precision(settings, name):
+    """Test that integers wider than 64 bits aren't parsed as floats"""
+    settings.GATEWAY_JSON_CODEC = name
+    data = {"id": 123456789012345678901234567890, "min": -9223372036854775809}
+
+    encoded = codec.dumps(data)
+
+    assert codec.loads(encoded) == data
+    assert codec.loads(encoded.decode()) == data
+    assert isinstance(codec.loads(encoded)["id"], int)
+
+
+def test_codec_selection(settings):
+    """Test that GATEWAY_JSON_CODEC picks the backend"""
+    settings.GATEWAY_JSON_CODEC = "json"
+    assert codec.get_codec().name == "json"
+
+    settings.GATEWAY_JSON_CODEC = "auto"
+    assert codec.get_codec().name == ("orjson" if codec.orjson else "json")
+
+    settings.GATEWAY_JSON_CODEC = "yaml"
+    with pytest.raises(ValueError):
+        codec.get_codec()
+
+
+def test_stdlib_fallback_without_orjson(settings, monkeypatch):
+    """Test that the standard library is used when orjson isn't installed"""
+    monkeypatch.setattr(codec, "orjson", None)
+    monkeypatch.setattr(codec, "_codecs", {})
+    settings.GATEWAY_JSON_CODEC = "orjson"
+
+    assert codec.get_codec().name == "json"
+    assert codec.dumps(PAYLOAD) == json.dumps(PAYLOAD).encode()
+
+
+@pytest.mark.skipif(codec.orjson is None, reason="orjson is not installed")
+def test_orjson_falls_back_for_unsupported_values(settings):
+    """Test that values orjson can't serialize still work"""
+    settings.GATEWAY_JSON_CODEC = "orjson"
+
+    assert codec.loads(codec.dumps({"big": 2**70})) == {"big": 2**70}
+
+
+def test_api_log_headers_use_codec():
+    """Test that ApiLog stores headers with the gateway's codec"""
+    log = ApiLog()
+
+    log.set_request_headers({"Accept": "application/json"})
+
+    assert log.get_request_headers() == {"Accept": "application/json"}
+    assert log.request_headers == codec.dumps_str({"Accept": "application/json"})
@@ -0,0 +1,222 @@
+import json
+import time
+import pytest
+import requests
+from asgiref.sync import async_to_sync
+from unittest.mock import patch, MagicMock
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory
+from gateway.breaker import CLOSED, circuit_breakers, upstream_host
+from gateway.deadline import Deadline, DeadlineExceeded
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import ApiEndpoint, ApiLog, Domain
+
+
+def test_timeouts_are_capped_at_the_time_left():
+    deadline = Deadline(expires_at=100)
+
+    assert deadline.timeouts(now=99) == (1, 1)
+    assert deadline.timeouts(connect=0.5, read=5, now=99) == (0.5, 1)
+    assert deadline.header_value(now=99.75) == "250"
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeouts(now=100)
+
+
+def test_client_budget_shortens_the_timeout():
+    endpoint = ApiEndpoint(timeout=30)
+    request = RequestFactory().get("/images", HTTP_X_REQUEST_TIMEOUT_MS="1500")
+
+    deadline = Deadline.for_request(request, endpoint, 100)
+    assert deadline.expires_at == 101.5
+    assert deadline.client
+    # A client can't extend the endpoint's timeout, or send nonsense
+    request = RequestFactory().get("/images", HTTP_X_REQUEST_TIMEOUT_MS="60000")
+    deadline = Deadline.for_request(request, endpoint, 100)
+    assert deadline.expires_at == 130
+    assert not deadline.client
+    request = RequestFactory().get("/images", HTTP_X_REQUEST_TIMEOUT_MS="soon")
+    assert Deadline.for_request(request, endpoint, 100).expires_at == 130
+
+
+def test_timeouts_at_the_deadline_are_deadline_timeouts():
+    timeout = requests.ReadTimeout("Read timed out")
+
+    assert Deadline(100, client=True).timed_out(timeout, now=100)
+    assert Deadline(100).timed_out(timeout, now=100)
+    # The target was slower than its own timeouts
+    assert not Deadline(100).timed_out(timeout, now=99)
+    assert not Deadline(100).timed_out(requests.ConnectionError("Refused"), now=100)
+
+
+@pytest.fixture
+def endpoint(db, upstream_server):
+    domain = Domain.objects.create(name="example.com", base_url="https://example.com")
+    return ApiEndpoint.objects.create(
+        domain=domain,
+        path="/echo",
+        method="GET",
+        target_url=f"{upstream_server}/echo",
+        timeout=2.5,
+    )
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+def gateway_request(**headers):
+    request = RequestFactory().get("/echo", **headers)
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+@pytest.mark.django_db
+def test_remaining_budget_is_forwarded(middleware, endpoint):
+    response = middleware(gateway_request(HTTP_X_REQUEST_TIMEOUT_MS="800"))
+
+    assert response.status_code == 200
+    headers = json.loads(response.content)["headers"]
+    assert 0 < int(headers["X-Request-Timeout-Ms"]) <= 800
+
+
+@pytest.mark.django_db
+def test_endpoint_timeout_is_forwarded(middleware, endpoint):
+    response = middleware(gateway_request())
+
+    headers = json.loads(response.content)["headers"]
+    assert 2000 < int(headers["X-Request-Timeout-Ms"]) <= 2500
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_spent_budget_fails_fast(mock_request, middleware, endpoint):
+    response = middleware(gateway_request(HTTP_X_REQUEST_TIMEOUT_MS="0"))
+
+    assert response.status_code == 504
+    assert json.loads(response.content)["message"] == "Deadline exceeded"
+    assert not mock_request.called
+    assert ApiLog.objects.get().response_status == 504
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_connect_and_read_timeouts(mock_request, middleware, endpoint):
+    ApiEndpoint.objects.update(connect_timeout=0.5, read_timeout=10)
+    mock_request.side_effect = requests.ConnectTimeout("Connect timed out")
+
+    middleware(gateway_request())
+
+    connect, read = mock_request.call_args.kwargs["timeout"]
+    assert connect == 0.5
+    # The read timeout can't outlast the total
+    assert 2 < read <= 2.5
+
+
+@pytest.mark.django_db
+def test_retries_stop_at_the_deadline(middleware, endpoint, upstream_server):
+    ApiEndpoint.objects.update(
+        target_url=f"{upstream_server}/status/503",
+        retry_max_attempts=100,
+        retry_backoff_ms=200,
+    )
+
+    with patch("gateway.retry.random.uniform", side_effect=lambda a, b: b):
+        response = middleware(gateway_request(HTTP_X_REQUEST_TIMEOUT_MS="500"))
+
+    assert response.status_code == 503
+    # 200 ms and 400 ms backoffs don't both fit in 500 ms
+    assert ApiLog.objects.get().retries == 1
+    assert ApiLog.objects.get().execution_time < 0.5
+
+
+@pytest.mark.django_db
+def test_slow_read_is_cut_at_the_deadline(endpoint, upstream_server):
+    ApiEndpoint.objects.update(target_url=f"{upstream_server}/delay/2")
+    middleware = ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+    response = middleware(gateway_request(HTTP_X_REQUEST_TIMEOUT_MS="300"))
+
+    assert response.status_code == 504
+    assert json.loads(response.content)["message"] == "Deadline exceeded"
+    assert ApiLog.objects.get().execution_time < 1
+
+
+@pytest.mark.django_db
+def test_trickling_body_is_cut_at_the_deadline(middleware, endpoint, upstream_server):
+    ApiEndpoint.objects.update(target_url=f"{upstream_server}/trickle/3")
+
+    response = middleware(gateway_request(HTTP_X_REQUEST_TIMEOUT_MS="500"))
+
+    assert response.status_code == 504
+    assert ApiLog.objects.get().execution_time < 1
+
+
+@pytest.mark.django_db
+def test_trickling_stream_is_cut_at_the_deadline(middleware, endpoint, upstream_server):
+    ApiEndpoint.objects.update(
+        target_url=f"{upstream_server}/trickle/3", stream_response=True
+    )
+    started = time.monotonic()
+
+    response = middleware(gateway_request(HTTP_X_REQUEST_TIMEOUT_MS="500"))
+
+    assert response.status_code == 200
+    with pytest.raises(DeadlineExceeded):
+        b"".join(response.streaming_content)
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.django_db
+def test_endpoint_timeout_is_a_deadline_in_both_modes(endpoint, upstream_server):
+    ApiEndpoint.objects.update(target_url=f"{upstream_server}/delay/2", timeout=0.3)
+
+    async def get_response(request):
+        return HttpResponse("Default")
+
+    sync_response = ApiGatewayMiddleware(
+        MagicMock(return_value=HttpResponse("Default"))
+    )(gateway_request())
+    request = AsyncRequestFactory().get("/echo")
+    request.META["HTTP_HOST"] = "example.com"
+    async_response = async_to_sync(ApiGatewayMiddleware(get_response))(request)
+
+    assert sync_response.status_code == 504
+    assert async_response.status_code == 504
+    # Unlike the client's budget, the endpoint's timeout counts against it
+    breaker = circuit_breakers.find(upstream_host(upstream_server))
+    assert breaker.stats()["failures"] == 2
+
+
+@pytest.mark.django_db
+def test_short_client_budgets_dont_trip_the_breaker(
+    middleware, endpoint, upstream_server
+):
+    ApiEndpoint.objects.update(target_url=f"{upstream_server}/delay/0.2")
+
+    for _ in range(10):
+        response = middleware(gateway_request(HTTP_X_REQUEST_TIMEOUT_MS="20"))
+        assert response.status_code == 504
+
+    breaker = circuit_breakers.find(upstream_host(upstream_server))
+    assert breaker.state == CLOSED
+    assert breaker.stats()["failures"] == 0
+    assert middleware(gateway_request()).status_code == 200
+
+
+@pytest.mark.django_db
+def test_async_attempt_is_cancelled_at_the_deadline(endpoint, upstream_server):
+    ApiEndpoint.objects.update(target_url=f"{upstream_server}/delay/2", read_timeout=10)
+
+    async def get_response(request):
+        return HttpResponse("Default")
+
+    request = AsyncRequestFactory().get(
+        "/echo", headers={"X-Request-Timeout-Ms": "300"}
+    )
+    request.META["HTTP_HOST"] = "example.com"
+    response = async_to_sync(ApiGatewayMiddleware(get_response))(request)
+
+    assert response.status_code == 504
+    assert ApiLog.objects.get().execution_time < 1
@@ -0,0 +1,229 @@
+import threading
+import pytest
+import requests
+from unittest.mock import patch, MagicMock
+from django.http import HttpResponse
+from django.test import RequestFactory
+from rest_framework.test import APIClient
+from gateway.balancer import LoadBalancer, load_balancers
+from gateway.health import health_checker
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import ApiEndpoint, Domain, UpstreamPool, UpstreamTarget
+
+
+def targets(*weights):
+    """Unsaved targets, the balancer only reads their url and weight"""
+    return [
+        UpstreamTarget(url=f"http://replica-{i}:8080", weight=weight)
+        for i, weight in enumerate(weights)
+    ]
+
+
+def picks(balancer, count, now):
+    chosen = []
+    for _ in range(count):
+        target = balancer.choose(now=now)
+        balancer.release(target, now=now)
+        chosen.append(target.url[-6])
+    return "".join(chosen)
+
+
+def fail(balancer, target, times, now):
+    for _ in range(times):
+        target.outstanding += 1
+        balancer.release(target, failed=True, now=now)
+
+
+def test_consecutive_failures_eject_target(settings):
+    settings.GATEWAY_HEALTH_MAX_FAILURES = 3
+    settings.GATEWAY_HEALTH_EJECTION_SECONDS = 30
+    balancer = LoadBalancer("round_robin", targets(1, 1))
+    first = balancer.targets[0]
+
+    fail(balancer, first, 2, now=100)
+    assert picks(balancer, 2, now=100) == "01"
+    fail(balancer, first, 3, now=100)
+
+    assert picks(balancer, 4, now=110) == "1111"
+    stats = balancer.stats(now=110)["targets"][0]
+    assert stats["health"] == "ejected"
+    assert stats["ejections"] == 1
+
+
+def test_success_resets_failure_count(settings):
+    settings.GATEWAY_HEALTH_MAX_FAILURES = 3
+    balancer = LoadBalancer("round_robin", targets(1, 1))
+    first = balancer.targets[0]
+
+    fail(balancer, first, 2, now=100)
+    first.outstanding += 1
+    balancer.release(first, now=100)
+    fail(balancer, first, 2, now=100)
+
+    assert balancer.stats(now=100)["targets"][0]["health"] == "healthy"
+
+
+def test_ejected_target_returns_with_slow_start(settings):
+    settings.GATEWAY_HEALTH_MAX_FAILURES = 1
+    settings.GATEWAY_HEALTH_EJECTION_SECONDS = 30
+    settings.GATEWAY_HEALTH_SLOW_START_SECONDS = 20
+    balancer = LoadBalancer("round_robin", targets(1, 1))
+    fail(balancer, balancer.targets[0], 1, now=100)
+
+    # Back after 30 seconds with a tenth of its weight, then half of it
+    assert picks(balancer, 11, now=130).count("0") == 1
+    assert balancer.stats(now=130)["targets"][0]["health"] == "slow_start"
+    assert picks(balancer, 30, now=140).count("0") == 10
+    assert picks(balancer, 10, now=150) == "0101010101"
+    assert balancer.stats(now=150)["targets"][0]["health"] == "healthy"
+
+
+def test_all_targets_ejected_still_get_requests(settings):
+    settings.GATEWAY_HEALTH_MAX_FAILURES = 1
+    balancer = LoadBalancer("least_outstanding", targets(1, 1))
+    for target in balancer.targets:
+        fail(balancer, target, 1, now=100)
+
+    chosen = [balancer.choose(now=101).url[-6] for _ in range(2)]
+    assert sorted(chosen) == ["0", "1"]
+
+
+def test_failed_probes_take_target_out_until_one_passes(settings):
+    settings.GATEWAY_HEALTH_UNHEALTHY_PROBES = 2
+    settings.GATEWAY_HEALTH_SLOW_START_SECONDS = 0
+    balancer = LoadBalancer("round_robin", targets(1, 1))
+    first = balancer.targets[0]
+
+    balancer.record_probe(first, False, 503, now=100)
+    assert picks(balancer, 2, now=100) == "01"
+    balancer.record_probe(first, False, "Connection refused", now=100)
+    assert picks(balancer, 2, now=100) == "11"
+    assert balancer.stats(now=100)["targets"][0]["last_probe"] == "Connection refused"
+
+    balancer.record_probe(first, True, 200, now=200)
+    assert balancer.stats(now=200)["targets"][0]["health"] == "healthy"
+    assert "0" in picks(balancer, 2, now=200)
+
+
+def test_target_added_to_running_pool_slow_starts(settings):
+    settings.GATEWAY_HEALTH_SLOW_START_SECONDS = 30
+    balancer = LoadBalancer("round_robin", targets(1))
+
+    balancer.update("round_robin", targets(1, 1))
+
+    health = [t["health"] for t in balancer.stats()["targets"]]
+    assert health == ["healthy", "slow_start"]
+
+
+@pytest.fixture
+def pool(db):
+    """Create a pool of two replicas and an endpoint on a domain using it"""
+    pool = UpstreamPool.objects.create(name="cat-api")
+    UpstreamTarget.objects.create(pool=pool, url="http://replica-1:8080")
+    UpstreamTarget.objects.create(pool=pool, url="http://replica-2:8080")
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", upstream_pool=pool
+    )
+    ApiEndpoint.objects.create(
+        domain=domain,
+        path="/images",
+        method="GET",
+        target_url="https://api.thecatapi.com/v1/images/search",
+    )
+    return pool
+
+
+def replica_1_is_down(method, url, **kwargs):
+    response = requests.Response()
+    response.status_code = 503 if "replica-1" in url else 200
+    response._content = b"[]"
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request", side_effect=replica_1_is_down)
+def test_failing_replica_is_ejected(mock_request, settings, pool):
+    """Test that 5xx responses take a replica out of rotation"""
+    settings.GATEWAY_HEALTH_MAX_FAILURES = 2
+    settings.GATEWAY_BREAKER_ENABLED = False
+    middleware = ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+    statuses = []
+    for _ in range(8):
+        request = RequestFactory().get("/images")
+        request.META["HTTP_HOST"] = "example.com"
+        statuses.append(middleware(request).status_code)
+
+    assert statuses == [503, 200, 503, 200, 200, 200, 200, 200]
+    health = [t["health"] for t in load_balancers.stats(pool)["targets"]]
+    assert health == ["ejected", "healthy"]
+
+
+@pytest.mark.django_db
+def test_health_check_probes_targets(settings, upstream_server):
+    settings.GATEWAY_HEALTH_UNHEALTHY_PROBES = 1
+    pool = UpstreamPool.objects.create(name="echo", health_check_path="/status/200")
+    UpstreamTarget.objects.create(pool=pool, url=upstream_server)
+    UpstreamTarget.objects.create(pool=pool, url=f"{upstream_server}/status/503")
+    UpstreamTarget.objects.create(pool=pool, url="http://127.0.0.1:1")
+
+    health_checker.check_pool(pool)
+
+    stats = load_balancers.stats(pool)["targets"]
+    assert [t["health"] for t in stats] == ["healthy", "unhealthy", "unhealthy"]
+    assert stats[0]["last_probe"] == 200
+    assert isinstance(stats[2]["last_probe"], str)
+
+
+@pytest.mark.django_db
+@patch.object(health_checker, "check_pool")
+def test_due_checks_follow_interval(mock_check, pool):
+    pool.health_check_path = "/health"
+    pool.health_check_interval = 10
+    pool.save()
+
+    health_checker.run_due_checks(now=1000)
+    health_checker.run_due_checks(now=1005)
+    health_checker.run_due_checks(now=1010)
+
+    assert mock_check.call_count == 2
+    assert mock_check.call_args.args[0].pk == pool.pk
+
+
+@pytest.mark.django_db
+@patch.object(health_checker, "run_due_checks")
+def test_checker_thread_starts_with_first_checked_pool(mock_run, settings, pool):
+    settings.GATEWAY_HEALTH_CHECKS = True
+    checked = threading.Event()
+    mock_run.side_effect = lambda: checked.set()
+
+    health_checker.watch(pool)
+    assert not checked.wait(0.1)
+
+    pool.health_check_path = "/health"
+    health_checker.watch(pool)
+    assert checked.wait(5)
+
+
+@pytest.mark.django_db
+def test_upstream_health_view(settings, pool):
+    settings.GATEWAY_HEALTH_UNHEALTHY_PROBES = 1
+    balancer = load_balancers.get(pool)
+    balancer.record_probe(balancer.targets[1], False, 500)
+
+    response = APIClient().get("/health/upstreams/")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "degraded"
+    assert data["upstream_pools"][0]["name"] == "cat-api"
+    assert data["upstream_pools"][0]["available"] == 1
+    assert [t["health"] for t in data["upstream_pools"][0]["targets"]] == [
+        "healthy",
+        "unhealthy",
+    ]
+
+    dashboard = APIClient().get("/")
+    assert b"Upstream Health" in dashboard.content
+    assert b"1/2 in rotation" in dashboard.content
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from asgiref.sync import async_to_sync
+from unittest.mock import MagicMock
+from django.http import HttpResponse
+from django.test import RequestFactory
+from rest_framework.test import APIClient
+from gateway.hedging import Hedge
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import ApiEndpoint, Domain, UpstreamPool, UpstreamTarget
+
+
+def test_configured_delay():
+    assert Hedge(delay_ms=250).delay() == 0.25
+
+
+def test_delay_is_learned_percentile(settings):
+    settings.GATEWAY_HEDGE_MIN_SAMPLES = 10
+    hedge = Hedge()
+    for latency in range(1, 10):
+        hedge.record(latency)
+    assert hedge.delay() is None
+
+    for latency in range(10, 101):
+        hedge.record(latency)
+    assert hedge.delay() == 95
+
+
+def answers(*delays):
+    """send() that answers the n-th call after delays[n] seconds"""
+    calls = iter(range(len(delays)))
+
+    def send():
+        call = next(calls)
+        time.sleep(delays[call])
+        return call
+
+    return send
+
+
+def test_fast_answer_is_not_hedged():
+    hedge = Hedge(delay_ms=200)
+
+    assert hedge.run(answers(0), MagicMock()) == 0
+    assert hedge.stats()["hedged"] == 0
+
+
+def test_slow_answer_is_hedged():
+    hedge = Hedge(delay_ms=20)
+    lost = threading.Event()
+
+    assert hedge.run(answers(0.3, 0), lambda result: lost.set()) == 1
+
+    stats = hedge.stats()
+    assert (stats["requests"], stats["hedged"], stats["wins"]) == (1, 1, 1)
+    assert stats["hedge_rate"] == stats["win_rate"] == 1.0
+    # The slow attempt is dropped once it answers
+    assert lost.wait(2)
+
+
+def test_failed_attempt_waits_for_the_other():
+    hedge = Hedge(delay_ms=20)
+    calls = iter([0.05, 0.1])
+
+    def send():
+        delay = next(calls)
+        time.sleep(delay)
+        if delay == 0.05:
+            raise ConnectionError("Connection reset")
+        return "hedge"
+
+    assert hedge.run(send, MagicMock()) == "hedge"
+
+
+def test_spent_budget_stops_hedges(settings):
+    settings.GATEWAY_RETRY_BUDGET_RATIO = 0
+    settings.GATEWAY_RETRY_BUDGET_MIN_RETRIES = 0
+    hedge = Hedge(delay_ms=10)
+
+    assert hedge.run(answers(0.05, 0), MagicMock()) == 0
+    assert hedge.stats()["hedged"] == 0
+
+
+def test_async_loser_is_cancelled():
+    hedge = Hedge(delay_ms=20)
+    cancelled = []
+    calls = iter([1, 0])
+
+    async def send():
+        delay = next(calls)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    async def discard(result):
+        pass
+
+    assert async_to_sync(hedge.arun)(send, discard) == 0
+    assert cancelled == [1]
+    assert hedge.stats()["wins"] == 1
+
+
+def test_async_loser_is_awaited():
+    hedge = Hedge(delay_ms=20)
+    stopped = []
+    calls = iter([1, 0])
+
+    async def send():
+        delay = next(calls)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            stopped.append(delay)
+            if delay:
+                raise RuntimeError("Failed while cancelled")
+        return delay
+
+    async def discard(result):
+        pass
+
+    async def run():
+        result = await hedge.arun(send, discard)
+        # The loser has stopped and its error was retrieved, not left for
+        # asyncio to report
+        assert stopped == [0, 1]
+        return result
+
+    assert async_to_sync(run)() == 0
+
+
+@pytest.mark.django_db
+def test_hedge_goes_to_another_target(upstream_server):
+    """Test that a slow replica's request is hedged to the other replica"""
+    pool = UpstreamPool.objects.create(name="echo")
+    UpstreamTarget.objects.create(pool=pool, url=f"{upstream_server}/delay/0.5")
+    UpstreamTarget.objects.create(pool=pool, url=upstream_server)
+    domain = Domain.objects.create(name="example.com", base_url="https://example.com")
+    endpoint = ApiEndpoint.objects.create(
+        domain=domain,
+        path="/echo",
+        method="GET",
+        target_url="http://upstream/echo",
+        upstream_pool=pool,
+        hedge_requests=True,
+        hedge_delay_ms=50,
+    )
+    middleware = ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+    request = RequestFactory().get("/echo")
+    request.META["HTTP_HOST"] = "example.com"
+
+    response = middleware(request)
+
+    assert response.status_code == 200
+    # Answered by the fast replica
+    assert json.loads(response.content)["path"] == "/echo"
+    stats = APIClient().get(f"/api/v1/endpoints/{endpoint.id}/hedge_stats/").json()
+    assert (stats["hedged"], stats["wins"]) == (1, 1)
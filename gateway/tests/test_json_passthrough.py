@@ -0,0 +1,109 @@
+import json
+import pytest
+import requests
+from unittest.mock import patch, MagicMock
+from django.http import HttpResponse
+from django.test import RequestFactory
+from gateway import codec
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import Domain, ApiEndpoint, ResponseTransformation
+
+UPSTREAM_BODY = b'{"data":  {"name": "Tom",  "id": 1}, "extra": [1, 2, 3]}'
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture
+def api_endpoint(db):
+    """Create a test API endpoint"""
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+    return ApiEndpoint.objects.create(
+        domain=domain,
+        path="/test",
+        method="GET",
+        target_url="https://example.com/api/test",
+    )
+
+
+def upstream_response(content, headers=None):
+    """Build the requests.Response the upstream would return"""
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    response.headers.update(headers or {"Content-Type": "application/json"})
+    return response
+
+
+def gateway_request():
+    request = RequestFactory().get("/test")
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_json_forwarded_without_reserializing(mock_request, middleware, api_endpoint):
+    """Test that JSON bodies are passed through byte for byte"""
+    mock_request.return_value = upstream_response(UPSTREAM_BODY)
+
+    with patch("gateway.codec.loads", wraps=codec.loads) as loads:
+        response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert response.content == UPSTREAM_BODY
+    assert response["Content-Type"] == "application/json"
+    # The odd spacing survives because the body is never parsed and dumped
+    assert loads.call_count == 0
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_json_parsed_once_with_transformations(mock_request, middleware, api_endpoint):
+    """Test that a transformed body is parsed exactly once"""
+    ResponseTransformation.objects.create(
+        endpoint=api_endpoint, source_field="data.name", target_field="name"
+    )
+    mock_request.return_value = upstream_response(UPSTREAM_BODY)
+
+    with patch("gateway.codec.loads", wraps=codec.loads) as loads:
+        response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert json.loads(response.content)["name"] == "Tom"
+    upstream_parses = [c for c in loads.mock_calls if c.args[0] == UPSTREAM_BODY]
+    assert len(upstream_parses) == 1
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_binary_body_forwarded_unchanged(mock_request, middleware, api_endpoint):
+    """Test that non-JSON bodies are not decoded to text"""
+    body = bytes(range(256))
+    mock_request.return_value = upstream_response(
+        body, {"Content-Type": "application/octet-stream"}
+    )
+
+    response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert response.content == body
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_content_encoding_dropped_for_decoded_body(
+    mock_request, middleware, api_endpoint
+):
+    """Test that Content-Encoding isn't forwarded for bodies requests decoded"""
+    mock_request.return_value = upstream_response(
+        UPSTREAM_BODY,
+        {"Content-Type": "application/json", "Content-Encoding": "gzip"},
+    )
+
+    response = middleware._handle_api_gateway_request(gateway_request())
+
+    assert response.content == UPSTREAM_BODY
+    assert not response.has_header("Content-Encoding")
@@ -0,0 +1,211 @@
+import json
+import pytest
+import requests
+from unittest.mock import patch, MagicMock
+from django.http import HttpResponse
+from django.test import RequestFactory
+from gateway.log_policy import LogPolicy
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import Domain, ApiEndpoint, ApiLog
+
+UPSTREAM_BODY = b'{"name": "Tom", "id": 1}'
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture
+def domain(db):
+    """Create a test domain"""
+    return Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+
+
+def create_endpoint(domain, **policy):
+    return ApiEndpoint.objects.create(
+        domain=domain,
+        path="/test",
+        method="POST",
+        target_url="https://example.com/api/test",
+        **policy,
+    )
+
+
+def upstream_response(status=200, content=UPSTREAM_BODY):
+    """Build the requests.Response the upstream would return"""
+    response = requests.Response()
+    response.status_code = status
+    response._content = content
+    response.headers.update({"Content-Type": "application/json", "X-Trace": "abc"})
+    return response
+
+
+def gateway_request(body=b'{"query": "cats"}', **headers):
+    request = RequestFactory().post(
+        "/test", data=body, content_type="application/json", **headers
+    )
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_default_policy_logs_everything(mock_request, middleware, domain):
+    """Test that endpoints without a policy log headers and bodies as before"""
+    create_endpoint(domain)
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request())
+
+    log = ApiLog.objects.get()
+    assert json.loads(log.request_body) == {"query": "cats"}
+    assert log.response_body == UPSTREAM_BODY.decode()
+    assert log.get_response_headers()["X-Trace"] == "abc"
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_sample_rate_zero_skips_successes(mock_request, middleware, domain):
+    """Test that sampled out requests are not logged"""
+    create_endpoint(domain, log_sample_rate=0.0)
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request())
+
+    assert ApiLog.objects.count() == 0
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_sampling_keeps_errors(mock_request, middleware, domain):
+    """Test that errors are logged even when sampled out"""
+    create_endpoint(domain, log_sample_rate=0.0)
+    mock_request.return_value = upstream_response(status=500)
+
+    middleware._handle_api_gateway_request(gateway_request())
+
+    assert ApiLog.objects.get().response_status == 500
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_sampled_out_request_is_not_serialized(mock_request, middleware, domain):
+    """Test that nothing is serialized for requests that are dropped"""
+    create_endpoint(domain, log_sample_rate=0.0)
+    mock_request.return_value = upstream_response()
+
+    with (
+        patch.object(LogPolicy, "request_body") as request_body,
+        patch.object(LogPolicy, "headers") as headers,
+    ):
+        middleware._handle_api_gateway_request(gateway_request())
+
+    request_body.assert_not_called()
+    headers.assert_not_called()
+
+
+def test_sample_rate_fraction():
+    """Test that a fractional sample rate keeps roughly that share"""
+    policy = LogPolicy(sample_rate=0.25)
+
+    with patch("gateway.log_policy.random.random", side_effect=[0.1, 0.5, 0.2, 0.9]):
+        kept = [policy.should_log(200) for _ in range(4)]
+
+    assert kept == [True, False, True, False]
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_errors_only(mock_request, middleware, domain):
+    """Test that errors only mode skips successful requests"""
+    create_endpoint(domain, log_errors_only=True)
+    mock_request.side_effect = [upstream_response(), upstream_response(status=404)]
+
+    middleware._handle_api_gateway_request(gateway_request())
+    middleware._handle_api_gateway_request(gateway_request())
+
+    assert list(ApiLog.objects.values_list("response_status", flat=True)) == [404]
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_metadata_only(mock_request, middleware, domain):
+    """Test that metadata only mode stores no headers or bodies"""
+    create_endpoint(domain, log_metadata_only=True)
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request())
+
+    log = ApiLog.objects.get()
+    assert log.request_method == "POST"
+    assert log.response_status == 200
+    assert log.request_headers is None
+    assert log.response_headers is None
+    assert log.request_body is None
+    assert log.response_body is None
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_bodies_truncated(mock_request, settings, middleware, domain):
+    """Test that bodies over log_max_body_bytes are cut with a marker"""
+    settings.GATEWAY_JSON_CODEC = "json"
+    create_endpoint(domain, log_max_body_bytes=10)
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request())
+
+    log = ApiLog.objects.get()
+    assert log.response_body == '{"name": "...[truncated 14 bytes]'
+    assert log.request_body == '{"query": ...[truncated 7 bytes]'
+
+
+def test_truncation_keeps_characters_whole():
+    """Test that a multi-byte character cut in half is dropped"""
+    policy = LogPolicy(max_body_bytes=3)
+
+    assert policy.response_body("aéé".encode()) == "aé...[truncated 2 bytes]"
+    assert policy.response_body("ab") == "ab"
+
+
+def test_binary_request_body_truncated_before_decoding():
+    """Test that raw request bodies are cut and stored as a JSON string"""
+    policy = LogPolicy(max_body_bytes=4)
+
+    assert policy.request_body(b"abcdefgh") == '"abcd"...[truncated 4 bytes]'
+    assert policy.request_body(b"abc") == '"abc"'
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_header_allowlist(mock_request, middleware, domain):
+    """Test that only allowed headers are logged"""
+    create_endpoint(domain, log_header_allowlist="Content-Type, x-trace")
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(gateway_request(HTTP_X_SECRET="s3cret"))
+
+    log = ApiLog.objects.get()
+    assert set(log.get_request_headers()) == {"Content-Type"}
+    assert set(log.get_response_headers()) == {"Content-Type", "X-Trace"}
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_header_denylist(mock_request, middleware, domain):
+    """Test that denied headers are never logged"""
+    create_endpoint(domain, log_header_denylist="authorization,X-Trace")
+    mock_request.return_value = upstream_response()
+
+    middleware._handle_api_gateway_request(
+        gateway_request(HTTP_AUTHORIZATION="Bearer token")
+    )
+
+    log = ApiLog.objects.get()
+    assert "Authorization" not in log.get_request_headers()
+    assert "Content-Type" in log.get_request_headers()
+    assert "X-Trace" not in log.get_response_headers()
@@ -0,0 +1,158 @@
+import threading
+import pytest
+from unittest.mock import patch
+from rest_framework.test import APIClient
+from gateway.log_writer import LogWriter
+from gateway.models import ApiEndpoint, ApiLog, Domain
+
+
+def make_log(index=0):
+    return ApiLog(
+        request_method="GET",
+        request_path=f"/test/{index}",
+        response_status=200,
+        execution_time=0.1,
+    )
+
+
+@pytest.fixture
+def background_logs(settings):
+    """Turn on background writing with small batches"""
+    settings.GATEWAY_LOG_ASYNC = True
+    settings.GATEWAY_LOG_BATCH_SIZE = 5
+    settings.GATEWAY_LOG_FLUSH_INTERVAL_MS = 50
+    settings.GATEWAY_LOG_QUEUE_SIZE = 100
+
+
+@pytest.fixture
+def writer():
+    writer = LogWriter()
+    yield writer
+    writer.close()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_logs_written_in_batches(background_logs, writer):
+    """Test that queued entries are inserted with bulk_create in batches"""
+    with patch.object(
+        ApiLog.objects, "bulk_create", wraps=ApiLog.objects.bulk_create
+    ) as bulk_create:
+        for index in range(12):
+            writer.submit(make_log(index))
+        assert writer.flush(timeout=5)
+
+    assert ApiLog.objects.count() == 12
+    assert all(len(call.args[0]) <= 5 for call in bulk_create.mock_calls)
+    assert writer.stats()["written"] == 12
+    assert writer.stats()["queue_depth"] == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_partial_batch_written_after_interval(background_logs, writer):
+    """Test that a batch smaller than the batch size is still written"""
+    writer.submit(make_log())
+
+    assert writer.flush(timeout=5)
+    assert ApiLog.objects.count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bad_row_only_drops_itself(background_logs, writer):
+    """Test that a row the database rejects doesn't fail the rest of its batch"""
+    domain = Domain.objects.create(name="example.com", base_url="https://example.com")
+    endpoint = ApiEndpoint.objects.create(
+        domain=domain, path="/test", method="GET", target_url="https://example.com"
+    )
+    orphan = make_log()
+    orphan.endpoint = endpoint
+    ApiEndpoint.objects.filter(pk=endpoint.pk).delete()
+
+    for log in [make_log(1), orphan, make_log(2)]:
+        writer.submit(log)
+    assert writer.flush(timeout=5)
+
+    assert ApiLog.objects.count() == 2
+    assert (writer.stats()["written"], writer.stats()["failed"]) == (2, 1)
+
+
+@pytest.mark.django_db
+def test_submit_does_not_write(background_logs, writer):
+    """Test that submitting only queues the entry"""
+    release = threading.Event()
+
+    with patch.object(writer, "_write", side_effect=lambda batch: release.wait(5)):
+        writer.submit(make_log())
+        assert ApiLog.objects.count() == 0
+        release.set()
+        writer.flush(timeout=5)
+
+
+@pytest.mark.django_db
+def test_full_queue_drops_entries(background_logs, settings, writer):
+    """Test that entries are dropped and counted when the queue is full"""
+    settings.GATEWAY_LOG_QUEUE_SIZE = 2
+    settings.GATEWAY_LOG_BATCH_SIZE = 1
+    release = threading.Event()
+
+    with patch.object(writer, "_write", side_effect=lambda batch: release.wait(5)):
+        # The writer holds one entry, the queue takes two more
+        for index in range(6):
+            writer.submit(make_log(index))
+
+        stats = writer.stats()
+        assert stats["dropped"] >= 3
+        assert stats["queue_depth"] <= 2
+        release.set()
+        writer.flush(timeout=5)
+
+
+@pytest.mark.django_db
+def test_block_policy_waits_for_room(background_logs, settings, writer):
+    """Test that the block policy waits for room before dropping"""
+    settings.GATEWAY_LOG_QUEUE_SIZE = 1
+    settings.GATEWAY_LOG_BATCH_SIZE = 1
+    settings.GATEWAY_LOG_QUEUE_FULL = "block"
+    settings.GATEWAY_LOG_BLOCK_TIMEOUT_MS = 500
+    release = threading.Event()
+
+    with patch.object(writer, "_write", side_effect=lambda batch: release.wait(5)):
+        writer.submit(make_log(0))
+        writer.submit(make_log(1))
+
+        # Room appears while the third entry is waiting
+        threading.Timer(0.1, release.set).start()
+        writer.submit(make_log(2))
+
+        assert writer.stats()["dropped"] == 0
+        writer.flush(timeout=5)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_close_writes_queued_entries(background_logs, settings):
+    """Test that shutting down flushes what is still queued"""
+    settings.GATEWAY_LOG_FLUSH_INTERVAL_MS = 60000
+    writer = LogWriter()
+    writer.submit(make_log())
+
+    writer.close()
+
+    assert ApiLog.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_synchronous_mode_saves_immediately():
+    """Test that GATEWAY_LOG_ASYNC = False saves the entry right away"""
+    writer = LogWriter()
+    writer.submit(make_log())
+
+    assert ApiLog.objects.count() == 1
+    assert writer.stats()["queue_depth"] == 0
+
+
+@pytest.mark.django_db
+def test_writer_stats_api():
+    """Test the log writer statistics endpoint of the management API"""
+    response = APIClient().get("/api/v1/logs/writer_stats/")
+
+    assert response.status_code == 200
+    assert {"queue_depth", "dropped", "written"} <= set(response.json())
@@ -90,6 +90,39 @@ def test_should_handle_request_with_no_matching_endpoint(
     assert middleware._should_handle_request(request) is False
 
 
+@pytest.mark.django_db
+@patch("gateway.middleware.resolve")
+def test_unknown_host_or_path_is_rejected_before_resolving(
+    mock_resolve, middleware, request_factory, api_endpoint, django_assert_num_queries
+):
+    """Test that requests no endpoint can match skip the URL resolver and database"""
+    middleware._should_handle_request(request_factory.get("/test"))
+
+    with django_assert_num_queries(0):
+        request = request_factory.get("/wp-login.php")
+        request.META["HTTP_HOST"] = "example.com"
+        assert middleware._should_handle_request(request) is False
+        request = request_factory.get("/test")
+        request.META["HTTP_HOST"] = "unknown.example.com"
+        assert middleware._should_handle_request(request) is False
+    assert not mock_resolve.called
+
+
+@pytest.mark.django_db
+def test_django_views_win_over_endpoints(middleware, request_factory, domain):
+    """Test that an endpoint path that is also a Django view is left to Django"""
+    ApiEndpoint.objects.create(
+        domain=domain,
+        path="/health/upstreams",
+        method="GET",
+        target_url="https://example.com/health",
+    )
+    request = request_factory.get("/health/upstreams/")
+    request.META["HTTP_HOST"] = "example.com"
+
+    assert middleware._should_handle_request(request) is False
+
+
 @pytest.mark.django_db
 def test_normalize_path(middleware):
     """Test path normalization"""
@@ -99,7 +132,7 @@ def test_normalize_path(middleware):
 
 
 @pytest.mark.django_db
-@patch("gateway.middleware.requests.get")
+@patch("gateway.upstream.requests.Session.request")
 def test_handle_api_gateway_request_success(
     mock_get, middleware, request_factory, api_endpoint
 ):
@@ -110,6 +143,7 @@ def test_handle_api_gateway_request_success(
     mock_response.headers = {"Content-Type": "application/json"}
     mock_response.json.return_value = {"data": "test_data"}
     mock_response.text = json.dumps({"data": "test_data"})
+    mock_response.content = mock_response.text.encode()
     mock_get.return_value = mock_response
 
     # Create a request that matches our api_endpoint
@@ -127,11 +161,11 @@ def test_handle_api_gateway_request_success(
     # Verify the external service was called correctly
     mock_get.assert_called_once()
     args, kwargs = mock_get.call_args
-    assert args[0] == "https://example.com/api/test"
+    assert kwargs["url"] == "https://example.com/api/test"
 
 
 @pytest.mark.django_db
-@patch("gateway.middleware.requests.get")
+@patch("gateway.upstream.requests.Session.request")
 def test_handle_api_gateway_request_not_found(
     mock_get, middleware, request_factory, domain
 ):
@@ -154,7 +188,7 @@ def test_handle_api_gateway_request_not_found(
 
 
 @pytest.mark.django_db
-@patch("gateway.middleware.requests.get")
+@patch("gateway.upstream.requests.Session.request")
 def test_handle_api_gateway_request_error(
     mock_get, middleware, request_factory, api_endpoint
 ):
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import tracemalloc
+import pytest
+from asgiref.sync import async_to_sync
+from unittest.mock import MagicMock
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import Domain, ApiEndpoint, ApiLog, RequestTransformation
+
+BINARY_BODY = bytes(range(256)) * 64
+
+
+class GeneratedInput:
+    """wsgi.input that produces its bytes on demand instead of holding them"""
+
+    def __init__(self, size):
+        self.remaining = size
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self.remaining
+        size = min(size, self.remaining)
+        chunk = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+        self.remaining -= size
+        self.digest.update(chunk)
+        return chunk
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture
+def upload_endpoint(db, upstream_server):
+    """Create an endpoint that streams uploads to the echo service"""
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+    return ApiEndpoint.objects.create(
+        domain=domain,
+        path="/upload",
+        method="POST",
+        target_url=f"{upstream_server}/echo",
+        timeout=30,
+        stream_request=True,
+    )
+
+
+def upload_request(request_factory, data, content_type="application/octet-stream"):
+    request = request_factory.post("/upload", data=data, content_type=content_type)
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+@pytest.mark.django_db
+def test_binary_body_forwarded_unchanged(middleware, upload_endpoint):
+    """Test that buffered binary bodies reach the upstream byte for byte"""
+    upload_endpoint.stream_request = False
+    upload_endpoint.save()
+
+    request = upload_request(RequestFactory(), BINARY_BODY)
+    response = middleware._handle_api_gateway_request(request)
+
+    echo = json.loads(response.content)
+    assert echo["body"].encode("latin-1") == BINARY_BODY
+    assert echo["headers"]["Content-Type"] == "application/octet-stream"
+    assert "Transfer-Encoding" not in echo["headers"]
+
+
+@pytest.mark.django_db
+def test_streamed_upload(middleware, upload_endpoint):
+    """Test that the body is sent chunked without reading request.body"""
+    request = upload_request(RequestFactory(), BINARY_BODY)
+    response = middleware._handle_api_gateway_request(request)
+
+    echo = json.loads(response.content)
+    assert echo["headers"]["Transfer-Encoding"] == "chunked"
+    assert echo["body_sha256"] == hashlib.sha256(BINARY_BODY).hexdigest()
+    assert not hasattr(request, "_body")
+
+    log = ApiLog.objects.get()
+    assert log.request_body is None
+
+
+@pytest.mark.django_db
+def test_streamed_upload_memory_is_constant(middleware, upload_endpoint):
+    """Test that a large upload passes through without being held in memory"""
+    size = 64 * 1024 * 1024
+    wsgi_input = GeneratedInput(size)
+    environ = RequestFactory()._base_environ(
+        PATH_INFO="/upload",
+        REQUEST_METHOD="POST",
+        CONTENT_TYPE="application/octet-stream",
+        CONTENT_LENGTH=str(size),
+        HTTP_HOST="example.com",
+    )
+    environ["wsgi.input"] = wsgi_input
+    request = WSGIRequest(environ)
+
+    tracemalloc.start()
+    try:
+        response = middleware._handle_api_gateway_request(request)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    echo = json.loads(response.content)
+    assert echo["body_length"] == size
+    assert echo["body_sha256"] == wsgi_input.digest.hexdigest()
+    assert peak < size / 4
+
+
+@pytest.mark.django_db
+def test_not_streamed_with_request_transformations(middleware, upload_endpoint):
+    """Test that request transformations still see the parsed JSON body"""
+    RequestTransformation.objects.create(
+        endpoint=upload_endpoint, source_field="name", target_field="user.name"
+    )
+
+    request = upload_request(
+        RequestFactory(), json.dumps({"name": "Tom"}), "application/json"
+    )
+    response = middleware._handle_api_gateway_request(request)
+
+    echo = json.loads(response.content)
+    assert json.loads(echo["body"])["user"] == {"name": "Tom"}
+    assert "Transfer-Encoding" not in echo["headers"]
+
+
+@pytest.mark.django_db
+def test_async_streamed_upload(upload_endpoint):
+    """Test that the async path streams the body to httpx"""
+
+    async def get_response(request):
+        return HttpResponse("Default")
+
+    middleware = ApiGatewayMiddleware(get_response)
+    request = upload_request(AsyncRequestFactory(), BINARY_BODY)
+    response = async_to_sync(middleware)(request)
+
+    echo = json.loads(response.content)
+    assert echo["headers"]["Transfer-Encoding"] == "chunked"
+    assert echo["body_sha256"] == hashlib.sha256(BINARY_BODY).hexdigest()
@@ -0,0 +1,195 @@
+import pytest
+import requests
+from asgiref.sync import async_to_sync
+from unittest.mock import patch, MagicMock
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory
+from rest_framework.test import APIClient
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import ApiEndpoint, ApiLog, Domain
+from gateway.retry import RetryBudget, RetryPolicy
+
+
+def test_only_idempotent_methods_retry_by_default():
+    policy = RetryPolicy(max_attempts=3)
+
+    assert policy.attempts_for("GET") == 3
+    assert policy.attempts_for("PUT", b"{}") == 3
+    assert policy.attempts_for("POST", b"{}") == 1
+    assert RetryPolicy(max_attempts=3, non_idempotent=True).attempts_for("POST") == 3
+
+
+def test_streamed_body_is_not_retried():
+    policy = RetryPolicy(max_attempts=3)
+
+    assert policy.attempts_for("PUT", iter([b"chunk"])) == 1
+
+
+def test_retried_statuses_and_errors():
+    policy = RetryPolicy(statuses="502, 503", errors="connect")
+
+    assert policy.retries_status(503)
+    assert not policy.retries_status(500)
+    assert policy.retries_error(requests.ConnectionError())
+    assert not policy.retries_error(requests.ReadTimeout())
+    assert RetryPolicy(errors="timeout").retries_error(requests.ReadTimeout())
+
+
+def test_backoff_is_exponential_with_jitter(settings):
+    settings.GATEWAY_RETRY_BACKOFF_MAX_MS = 300
+    policy = RetryPolicy(backoff_ms=100)
+
+    with patch("gateway.retry.random.uniform", side_effect=lambda a, b: b):
+        assert [policy.delay(retry) for retry in (1, 2, 3)] == [0.1, 0.2, 0.3]
+    assert all(0 <= policy.delay(2) <= 0.2 for _ in range(20))
+
+
+def test_budget_caps_retries(settings):
+    settings.GATEWAY_RETRY_BUDGET_RATIO = 0.5
+    settings.GATEWAY_RETRY_BUDGET_MIN_RETRIES = 1
+    settings.GATEWAY_RETRY_BUDGET_WINDOW = 10
+    budget = RetryBudget()
+    for _ in range(4):
+        budget.record_request(now=100)
+
+    assert [budget.try_retry(now=100) for _ in range(4)] == [True, True, True, False]
+    assert budget.stats(now=100) == {
+        "requests": 4,
+        "retries": 3,
+        "available": 0,
+        "rejected": 1,
+    }
+    # The retries leave the window along with the requests
+    assert budget.try_retry(now=111)
+
+
+@pytest.fixture
+def endpoint(db):
+    domain = Domain.objects.create(name="example.com", base_url="https://example.com")
+    return ApiEndpoint.objects.create(
+        domain=domain,
+        path="/images",
+        method="GET",
+        target_url="https://api.thecatapi.com/v1/images/search",
+        retry_max_attempts=3,
+        retry_backoff_ms=0,
+    )
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+def gateway_request(method="GET"):
+    request = RequestFactory().generic(method, "/images")
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+def upstream_response(status):
+    response = requests.Response()
+    response.status_code = status
+    response._content = b"[]"
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_connection_error_is_retried(mock_request, middleware, endpoint):
+    mock_request.side_effect = [
+        requests.ConnectionError("Connection reset"),
+        upstream_response(200),
+    ]
+
+    response = middleware(gateway_request())
+
+    assert response.status_code == 200
+    assert mock_request.call_count == 2
+    assert ApiLog.objects.get().retries == 1
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_attempts_are_limited(mock_request, middleware, endpoint):
+    mock_request.side_effect = lambda *args, **kwargs: upstream_response(503)
+
+    response = middleware(gateway_request())
+
+    assert response.status_code == 503
+    assert mock_request.call_count == 3
+    assert ApiLog.objects.get().retries == 2
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_post_is_not_retried(mock_request, middleware, endpoint):
+    ApiEndpoint.objects.update(method="POST")
+    mock_request.side_effect = requests.ConnectionError("Connection reset")
+
+    response = middleware(gateway_request("POST"))
+
+    assert response.status_code == 502
+    assert mock_request.call_count == 1
+    assert ApiLog.objects.get().retries == 0
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_spent_budget_stops_retries(mock_request, settings, middleware, endpoint):
+    settings.GATEWAY_RETRY_BUDGET_RATIO = 0
+    settings.GATEWAY_RETRY_BUDGET_MIN_RETRIES = 1
+    mock_request.side_effect = requests.ConnectionError("Connection reset")
+
+    middleware(gateway_request())
+    middleware(gateway_request())
+
+    # One retry for the first request, none left after it
+    assert mock_request.call_count == 3
+    budget = APIClient().get("/api/v1/endpoints/retry_budget/").json()
+    assert budget["retries"] == 1
+    assert budget["rejected"] == 2
+
+
+@pytest.mark.django_db
+def test_streamed_response_of_retried_attempt_is_released(upstream_server, endpoint):
+    ApiEndpoint.objects.filter(pk=endpoint.pk).update(
+        target_url=f"{upstream_server}/status/503", stream_response=True
+    )
+    middleware = ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+    response = middleware(gateway_request())
+
+    assert response.status_code == 503
+    assert b"".join(response.streaming_content)
+    response.close()
+    assert ApiLog.objects.get().retries == 2
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.httpx.AsyncClient.send")
+def test_async_connection_error_is_retried(mock_send, endpoint):
+    import httpx
+
+    responses = iter([httpx.ConnectError("Connection refused"), 200])
+
+    async def send(upstream_request, stream=False):
+        outcome = next(responses)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, content=b"[]", request=upstream_request)
+
+    mock_send.side_effect = send
+
+    async def get_response(request):
+        return HttpResponse("Default")
+
+    request = AsyncRequestFactory().get("/images")
+    request.META["HTTP_HOST"] = "example.com"
+    response = async_to_sync(ApiGatewayMiddleware(get_response))(request)
+
+    assert response.status_code == 200
+    assert mock_send.call_count == 2
+    assert ApiLog.objects.get().retries == 1
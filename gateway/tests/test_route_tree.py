@@ -0,0 +1,147 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from django.http import HttpResponse
+from django.test import RequestFactory
+from rest_framework.test import APIClient
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import ApiEndpoint, Domain, ResponseTransformation
+from gateway.route_tree import PrefixTrie, RouteTree, expand_url, parse_template
+from gateway.routing import route_table
+
+
+@pytest.fixture
+def tree():
+    tree = RouteTree()
+    tree.add("/images/search", "GET", "search")
+    tree.add("/images/{id}", "GET", "image")
+    tree.add("/images/{id}/breeds/{breed}", "GET", "breed")
+    tree.add("/files/{path*}", "GET", "files")
+    tree.add("/", "GET", "root")
+    return tree
+
+
+def test_static_segments_win(tree):
+    assert tree.match("GET", "/images/search") == ("search", {})
+    assert tree.match("GET", "/images/abc123") == ("image", {"id": "abc123"})
+    assert tree.match("GET", "/") == ("root", {})
+
+
+def test_params_are_captured_in_order(tree):
+    assert tree.match("GET", "/images/abc/breeds/beng") == (
+        "breed",
+        {"id": "abc", "breed": "beng"},
+    )
+    assert tree.match("GET", "/images/abc/breeds") == (None, {})
+    assert tree.match("POST", "/images/abc") == (None, {})
+
+
+def test_catch_all_takes_the_rest(tree):
+    assert tree.match("GET", "/files/a/b.txt") == ("files", {"path": "a/b.txt"})
+    assert tree.match("GET", "/files") == ("files", {"path": ""})
+    # Dot segments can't reach out of the target path
+    assert tree.match("GET", "/files/../secret") == (None, {})
+    assert tree.match("GET", "/images/..") == (None, {})
+
+
+def test_backs_off_to_the_method_that_matches():
+    tree = RouteTree()
+    tree.add("/images/search", "GET", "search")
+    tree.add("/images/{id}", "DELETE", "delete")
+
+    assert tree.match("DELETE", "/images/search") == ("delete", {"id": "search"})
+
+
+def test_invalid_templates():
+    with pytest.raises(ValueError):
+        parse_template("/files/{path*}/raw")
+    with pytest.raises(ValueError):
+        parse_template("/{id}/{id}")
+
+
+def test_expand_url():
+    url = "https://api.thecatapi.com/v1/images/{id}"
+
+    assert expand_url(url, {"id": "abc"}) == "https://api.thecatapi.com/v1/images/abc"
+    assert expand_url(url, {"id": "a b?"}).endswith("/images/a%20b%3F")
+    assert expand_url(url, {}) == url
+
+
+def test_prefix_trie_rejects_paths_no_template_starts():
+    prefixes = PrefixTrie()
+    prefixes.add("/images/search")
+    prefixes.add("/images/{id}/breeds")
+    prefixes.add("/files/{path*}")
+
+    assert prefixes.may_match("/images/abc/breeds")
+    assert prefixes.may_match("/files")
+    assert not prefixes.may_match("/wp-login.php")
+    assert not prefixes.may_match("/")
+    # Only the literal beginning is checked, the tree does the rest
+    assert prefixes.may_match("/images/search/more")
+
+
+@pytest.fixture
+def domain(db):
+    return Domain.objects.create(name="example.com", base_url="https://example.com")
+
+
+@pytest.mark.django_db
+def test_lookup_returns_params(domain):
+    endpoint = ApiEndpoint.objects.create(
+        domain=domain,
+        path="/images/{id}",
+        method="GET",
+        target_url="https://api.thecatapi.com/v1/images/{id}",
+    )
+
+    assert route_table.lookup("example.com", "GET", "/images/abc/") == (
+        endpoint,
+        {"id": "abc"},
+    )
+    assert route_table.lookup("localhost", "GET", "/api/images/abc") == (
+        endpoint,
+        {"id": "abc"},
+    )
+
+
+@pytest.mark.django_db
+def test_params_fill_target_url_and_templates(domain, upstream_server):
+    endpoint = ApiEndpoint.objects.create(
+        domain=domain,
+        path="/images/{id}",
+        method="GET",
+        target_url=f"{upstream_server}/v1/images/{{id}}",
+    )
+    ResponseTransformation.objects.create(
+        endpoint=endpoint,
+        source_field="",
+        target_field="image_id",
+        transformation_type="template",
+        transformation_value="${path.id}",
+    )
+    middleware = ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+    request = RequestFactory().get("/images/abc123")
+    request.META["HTTP_HOST"] = "example.com"
+
+    data = json.loads(middleware(request).content)
+
+    assert data["path"] == "/v1/images/abc123"
+    assert data["image_id"] == "abc123"
+
+
+@pytest.mark.django_db
+def test_api_rejects_invalid_template(domain):
+    response = APIClient().post(
+        "/api/v1/endpoints/",
+        {
+            "domain": domain.id,
+            "path": "/files/{path*}/raw",
+            "method": "GET",
+            "target_url": "https://example.com/files/{path}",
+        },
+        format="json",
+    )
+
+    assert response.status_code == 400
+    assert "path" in response.json()
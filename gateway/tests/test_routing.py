@@ -0,0 +1,182 @@
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from gateway.models import (
+    Domain,
+    ApiEndpoint,
+    RequestTransformation,
+    ResponseTransformation,
+    ConfigGeneration,
+)
+from gateway.routing import RouteTable, route_table, normalize_path
+
+
+@pytest.fixture
+def domain(db):
+    """Create a test domain"""
+    return Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+
+
+@pytest.fixture
+def api_endpoint(db, domain):
+    """Create a test API endpoint"""
+    return ApiEndpoint.objects.create(
+        domain=domain,
+        path="/test",
+        method="GET",
+        target_url="https://example.com/api/test",
+        is_active=True,
+    )
+
+
+def test_normalize_path():
+    """Test path normalization"""
+    assert normalize_path("/test/") == "/test"
+    assert normalize_path("/test") == "/test"
+    assert normalize_path("/") == "/"
+
+
+@pytest.mark.django_db
+def test_match_by_host(api_endpoint):
+    """Test that routes are matched on host, method and normalized path"""
+    assert route_table.match("example.com", "GET", "/test") == api_endpoint
+    assert route_table.match("example.com", "GET", "/test/") == api_endpoint
+    assert route_table.match("example.com", "POST", "/test") is None
+    assert route_table.match("other.com", "GET", "/test") is None
+
+
+@pytest.mark.django_db
+def test_match_api_prefix_uses_default_domain(api_endpoint):
+    """Test that /api/ paths on unknown hosts fall back to the default domain"""
+    assert route_table.match("localhost", "GET", "/api/test") == api_endpoint
+    # Known hosts don't fall back
+    assert route_table.match("example.com", "GET", "/api/test") is None
+
+
+@pytest.mark.django_db
+def test_match_is_a_dict_lookup(api_endpoint, django_assert_num_queries):
+    """Test that matching doesn't query the database once the table is built"""
+    route_table.snapshot()
+    with django_assert_num_queries(0):
+        for _ in range(10):
+            assert route_table.match("example.com", "GET", "/test") == api_endpoint
+
+
+@pytest.mark.django_db
+def test_inactive_rows_are_not_routed(api_endpoint, domain):
+    """Test that inactive endpoints and domains are skipped"""
+    api_endpoint.is_active = False
+    api_endpoint.save()
+    assert route_table.match("example.com", "GET", "/test") is None
+
+    api_endpoint.is_active = True
+    api_endpoint.save()
+    domain.is_active = False
+    domain.save()
+    assert route_table.match("example.com", "GET", "/test") is None
+
+
+@pytest.mark.django_db
+def test_table_rebuilt_after_model_changes(api_endpoint):
+    """Test that saving or deleting rules refreshes the table"""
+    assert route_table.match("example.com", "GET", "/test") == api_endpoint
+
+    api_endpoint.path = "/renamed"
+    api_endpoint.save()
+    assert route_table.match("example.com", "GET", "/test") is None
+    assert route_table.match("example.com", "GET", "/renamed") == api_endpoint
+
+    api_endpoint.delete()
+    assert route_table.match("example.com", "GET", "/renamed") is None
+
+
+@pytest.mark.django_db
+def test_table_rebuilt_after_api_update(api_endpoint):
+    """Test that changes through the management API refresh the table"""
+    assert route_table.match("example.com", "GET", "/test") == api_endpoint
+
+    client = APIClient()
+    response = client.patch(
+        f"/api/v1/endpoints/{api_endpoint.id}/", {"path": "/moved"}, format="json"
+    )
+    assert response.status_code == 200
+    assert route_table.match("example.com", "GET", "/moved") is not None
+
+
+@pytest.mark.django_db
+def test_table_rebuilt_after_web_toggle(client, api_endpoint):
+    """Test that toggling a rule in the web interface refreshes the table"""
+    assert route_table.match("example.com", "GET", "/test") == api_endpoint
+
+    client.get(reverse("gateway:toggle_rule", args=[api_endpoint.id]))
+    assert route_table.match("example.com", "GET", "/test") is None
+
+
+@pytest.mark.django_db
+def test_invalidate_during_build_is_not_lost(api_endpoint):
+    """Test that a snapshot built before an invalidation is not published"""
+    table = RouteTable()
+    original_build = table._build
+
+    def build_and_invalidate():
+        snapshot = original_build()
+        table.invalidate()
+        return snapshot
+
+    table._build = build_and_invalidate
+    table.snapshot()
+    assert table._snapshot is None
+
+
+@pytest.mark.django_db
+def test_config_changes_bump_generation(api_endpoint):
+    """Test that saving any configuration model bumps the generation"""
+    generation = ConfigGeneration.current()
+
+    RequestTransformation.objects.create(
+        endpoint=api_endpoint, source_field="a", target_field="b"
+    )
+    assert ConfigGeneration.current() == generation + 1
+
+    ResponseTransformation.objects.create(
+        endpoint=api_endpoint, source_field="a", target_field="b"
+    )
+    assert ConfigGeneration.current() == generation + 2
+
+    api_endpoint.delete()
+    # The transformations cascade, each one bumps the counter
+    assert ConfigGeneration.current() == generation + 5
+
+
+@pytest.mark.django_db
+@override_settings(GATEWAY_CONFIG_CHECK_INTERVAL_MS=0)
+def test_reload_when_another_process_changes_config(api_endpoint):
+    """Test that a generation bump from another worker reloads the table"""
+    table = RouteTable()
+    assert table.match("example.com", "GET", "/test") == api_endpoint
+
+    # Simulate another worker: change the row without touching this table
+    ApiEndpoint.objects.filter(pk=api_endpoint.pk).update(path="/elsewhere")
+    assert table.match("example.com", "GET", "/test") == api_endpoint
+
+    ConfigGeneration.bump()
+    assert table.match("example.com", "GET", "/test") is None
+    assert table.match("example.com", "GET", "/elsewhere") is not None
+
+
+@pytest.mark.django_db
+@override_settings(GATEWAY_CONFIG_CHECK_INTERVAL_MS=60000)
+def test_generation_checked_at_most_once_per_interval(
+    api_endpoint, django_assert_num_queries
+):
+    """Test that the generation counter is not read on every request"""
+    table = RouteTable()
+    table.snapshot()
+    ConfigGeneration.bump()
+
+    with django_assert_num_queries(0):
+        for _ in range(10):
+            assert table.match("example.com", "GET", "/test") == api_endpoint
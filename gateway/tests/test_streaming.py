@@ -0,0 +1,138 @@
+import json
+import pytest
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory
+from unittest.mock import MagicMock
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import Domain, ApiEndpoint, ApiLog, ResponseTransformation
+
+
+async def async_get_response(request):
+    return HttpResponse("Default response")
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture
+def domain(db):
+    """Create a test domain"""
+    return Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+
+
+@pytest.fixture
+def streaming_endpoint(domain, upstream_server):
+    """Create an endpoint that streams a 5 MB binary response"""
+    return ApiEndpoint.objects.create(
+        domain=domain,
+        path="/download",
+        method="GET",
+        target_url=f"{upstream_server}/bytes/{5 * 1024 * 1024}",
+        timeout=5,
+        stream_response=True,
+    )
+
+
+def gateway_request(request_factory, path):
+    request = request_factory.get(path)
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+def expected_body(size):
+    chunk = bytes(range(256)) * 256
+    return (chunk * (size // len(chunk) + 1))[:size]
+
+
+@pytest.mark.django_db
+def test_streamed_response(middleware, streaming_endpoint):
+    """Test that the upstream body is forwarded in bounded chunks"""
+    request = gateway_request(RequestFactory(), "/download")
+    response = middleware._handle_api_gateway_request(request)
+
+    assert response.streaming
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/octet-stream"
+    assert response["Content-Length"] == str(5 * 1024 * 1024)
+
+    chunks = list(response.streaming_content)
+    assert max(len(chunk) for chunk in chunks) <= middleware.STREAM_CHUNK_SIZE
+    assert b"".join(chunks) == expected_body(5 * 1024 * 1024)
+    response.close()
+
+
+@pytest.mark.django_db
+def test_streamed_response_is_logged_without_body(middleware, streaming_endpoint):
+    """Test that streamed responses are logged but their body is not kept"""
+    request = gateway_request(RequestFactory(), "/download")
+    response = middleware._handle_api_gateway_request(request)
+    response.close()
+
+    log = ApiLog.objects.get()
+    assert log.response_status == 200
+    assert log.response_body is None
+
+
+@pytest.mark.django_db
+def test_streamed_with_response_transformations(
+    middleware, streaming_endpoint, upstream_server
+):
+    """Test that object bodies are transformed as a whole when streamed"""
+    streaming_endpoint.target_url = f"{upstream_server}/echo"
+    streaming_endpoint.save()
+    ResponseTransformation.objects.create(
+        endpoint=streaming_endpoint, source_field="path", target_field="upstream"
+    )
+
+    request = gateway_request(RequestFactory(), "/download")
+    response = middleware._handle_api_gateway_request(request)
+
+    assert response.streaming
+    assert not response.has_header("Content-Length")
+    content = b"".join(response.streaming_content)
+    assert json.loads(content)["upstream"] == "/echo"
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "accept_encoding, forwarded", [(None, "identity"), ("br, gzip", "br, gzip")]
+)
+def test_streamed_accept_encoding_is_the_clients(
+    middleware, streaming_endpoint, upstream_server, accept_encoding, forwarded
+):
+    """Test that an undecoded body is only encoded as the client accepts"""
+    streaming_endpoint.target_url = f"{upstream_server}/echo"
+    streaming_endpoint.save()
+
+    request = gateway_request(RequestFactory(), "/download")
+    if accept_encoding:
+        request.META["HTTP_ACCEPT_ENCODING"] = accept_encoding
+    response = middleware._handle_api_gateway_request(request)
+
+    content = b"".join(response.streaming_content)
+    assert json.loads(content)["headers"]["Accept-Encoding"] == forwarded
+
+
+@pytest.mark.django_db
+def test_async_streamed_response(streaming_endpoint):
+    """Test that the async path streams the body with an async iterator"""
+    middleware = ApiGatewayMiddleware(async_get_response)
+    request = gateway_request(AsyncRequestFactory(), "/download")
+
+    async def fetch():
+        response = await middleware(request)
+        assert response.is_async
+        chunks = [chunk async for chunk in response.streaming_content]
+        return response, chunks
+
+    response, chunks = async_to_sync(fetch)()
+
+    assert response.status_code == 200
+    assert max(len(chunk) for chunk in chunks) <= middleware.STREAM_CHUNK_SIZE
+    assert b"".join(chunks) == expected_body(5 * 1024 * 1024)
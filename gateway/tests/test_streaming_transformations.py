@@ -0,0 +1,199 @@
+import copy
+import json
+import pytest
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory
+from unittest.mock import MagicMock, patch
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import ApiEndpoint, Domain, ResponseTransformation
+from gateway.streaming import ArrayTransformer, can_stream
+from gateway.transformations import TransformationPlan
+
+
+def rule(source="", target="", kind="direct", value=None):
+    """An unsaved transformation, plans only read its fields"""
+    return ResponseTransformation(
+        source_field=source,
+        target_field=target,
+        transformation_type=kind,
+        transformation_value=value,
+    )
+
+
+BODY = [
+    {"id": 1, "breeds": [{"name": "Abyssinian"}], "tags": {"a": 1}},
+    {"id": 2, "breeds": [], "url": "https://cdn.example.com/2.jpg"},
+    {},
+    "not an object",
+    {"id": 5.5, "breeds": [{"name": "Bengal"}, {"name": "Birman"}]},
+]
+
+STREAMABLE_RULES = [
+    rule("*.breeds.0.name", "*.breed"),
+    rule("*.breeds.*.name", "*.breed_names"),
+    rule("", "*.source", "constant", "thecatapi"),
+    rule("", "*.label", "template", "cat ${id}"),
+    rule("0.id", "first"),
+    rule("name", "ignored"),
+]
+
+
+def transform_in_chunks(plan, content, size):
+    transformer = ArrayTransformer(plan)
+    output = [
+        transformer.feed(content[start : start + size])
+        for start in range(0, len(content), size)
+    ]
+    output.append(transformer.close())
+    return b"".join(output)
+
+
+def test_streamable_plans():
+    """Test that only plans that work element by element are streamable"""
+    assert TransformationPlan(STREAMABLE_RULES).streamable
+    assert TransformationPlan([]).streamable
+    # Collects values across the whole list
+    assert not TransformationPlan([rule("*.id", "ids")]).streamable
+    # Writes outside the element the source matched
+    assert not TransformationPlan([rule("*.id", "0.ids.*")]).streamable
+
+
+def test_untransformed_responses_stream_without_ijson():
+    with patch("gateway.streaming.ijson", None):
+        assert can_stream(TransformationPlan([]))
+        assert not can_stream(TransformationPlan(STREAMABLE_RULES))
+
+
+@pytest.mark.parametrize("size", [1, 7, 64 * 1024])
+def test_array_matches_buffered_transformation(size):
+    """Test that streaming gives the same body as transforming it whole"""
+    plan = TransformationPlan(STREAMABLE_RULES)
+    content = json.dumps(BODY, indent=2).encode()
+
+    result = transform_in_chunks(plan, content, size)
+
+    assert json.loads(result) == plan.apply_to_response(copy.deepcopy(BODY))
+
+
+def test_empty_array():
+    plan = TransformationPlan(STREAMABLE_RULES)
+    assert json.loads(transform_in_chunks(plan, b" [ ] ", 1)) == []
+
+
+def test_object_is_buffered_and_transformed():
+    """Test that bodies that aren't arrays are transformed as a whole"""
+    plan = TransformationPlan([rule("id", "cat_id")])
+
+    result = transform_in_chunks(plan, b'\n{"id": 3}', 2)
+
+    assert json.loads(result) == {"id": 3, "cat_id": 3}
+
+
+def test_invalid_json_is_passed_on():
+    plan = TransformationPlan([rule("id", "cat_id")])
+    assert transform_in_chunks(plan, b"not json", 3) == b"not json"
+
+
+def test_elements_are_released_as_they_are_sent():
+    """Test that parsed elements aren't kept once they are encoded"""
+    plan = TransformationPlan([rule("*.id", "*.cat_id")])
+    transformer = ArrayTransformer(plan)
+
+    output = transformer.feed(b'[{"id": 1}, {"id": 2}, ')
+
+    assert output == b'[{"id":1,"cat_id":1},{"id":2,"cat_id":2}'
+    assert not transformer._elements
+
+
+@pytest.fixture
+def middleware():
+    """Create a middleware instance with a mock get_response function"""
+    return ApiGatewayMiddleware(MagicMock(return_value=HttpResponse("Default")))
+
+
+@pytest.fixture
+def array_endpoint(db, upstream_server):
+    """Create a streaming endpoint for a 5000 element array with a wildcard rule"""
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+    endpoint = ApiEndpoint.objects.create(
+        domain=domain,
+        path="/images",
+        method="GET",
+        target_url=f"{upstream_server}/array/5000",
+        timeout=5,
+        stream_response=True,
+    )
+    ResponseTransformation.objects.create(
+        endpoint=endpoint, source_field="*.breeds.0.name", target_field="*.breed"
+    )
+    return endpoint
+
+
+def gateway_request(request_factory, path):
+    request = request_factory.get(path)
+    request.META["HTTP_HOST"] = "example.com"
+    return request
+
+
+def buffered_body(middleware, endpoint):
+    """The body the endpoint answers with when it isn't streamed"""
+    endpoint.stream_response = False
+    endpoint.save()
+    response = middleware(gateway_request(RequestFactory(), "/images"))
+    assert not response.streaming
+    return json.loads(response.content)
+
+
+@pytest.mark.django_db
+def test_array_response_is_transformed_while_streamed(middleware, array_endpoint):
+    """Test that a transformed array response is streamed element by element"""
+    response = middleware(gateway_request(RequestFactory(), "/images"))
+
+    assert response.streaming
+    assert not response.has_header("Content-Length")
+    chunks = list(response.streaming_content)
+    response.close()
+
+    assert len(chunks) > 1
+    body = json.loads(b"".join(chunks))
+    assert len(body) == 5000
+    assert body[4999]["breed"] == "Bengal"
+    assert body == buffered_body(middleware, array_endpoint)
+
+
+@pytest.mark.django_db
+def test_not_streamed_when_plan_needs_whole_array(middleware, array_endpoint):
+    """Test that rules that collect across elements buffer the response"""
+    ResponseTransformation.objects.create(
+        endpoint=array_endpoint, source_field="*.id", target_field="ids"
+    )
+
+    response = middleware(gateway_request(RequestFactory(), "/images"))
+
+    assert not response.streaming
+    assert json.loads(response.content)[0]["breed"] == "Bengal"
+
+
+@pytest.mark.django_db
+def test_async_array_response_is_transformed_while_streamed(array_endpoint):
+    """Test that the async path transforms the stream with an async iterator"""
+
+    async def get_response(request):
+        return HttpResponse("Default response")
+
+    middleware = ApiGatewayMiddleware(get_response)
+    request = gateway_request(AsyncRequestFactory(), "/images")
+
+    async def fetch():
+        response = await middleware(request)
+        assert response.is_async
+        return [chunk async for chunk in response.streaming_content]
+
+    chunks = async_to_sync(fetch)()
+
+    body = json.loads(b"".join(chunks))
+    assert len(chunks) > 1
+    assert [item["breed"] for item in body[:2]] == ["Bengal", "Bengal"]
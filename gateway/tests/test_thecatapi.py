@@ -64,7 +64,7 @@ def cat_api_endpoint_with_apikey(db, cat_api_domain):
 
 
 @pytest.mark.django_db
-@patch("gateway.middleware.requests.get")
+@patch("gateway.upstream.requests.Session.request")
 def test_cat_api_request_success(
     mock_get, middleware, request_factory, cat_api_endpoint
 ):
@@ -91,6 +91,7 @@ def test_cat_api_request_success(
             }
         ]
     )
+    mock_response.content = mock_response.text.encode()
     mock_get.return_value = mock_response
 
     # Create a request that matches our cat_api_endpoint
@@ -115,12 +116,12 @@ def test_cat_api_request_success(
     # Verify the external service was called correctly
     mock_get.assert_called_once()
     args, kwargs = mock_get.call_args
-    assert args[0] == "https://api.thecatapi.com/v1/images/search"
+    assert kwargs["url"] == "https://api.thecatapi.com/v1/images/search"
     assert "api_key" not in kwargs.get("params", {})
 
 
 @pytest.mark.django_db
-@patch("gateway.middleware.requests.get")
+@patch("gateway.upstream.requests.Session.request")
 def test_cat_api_request_with_apikey_in_url(
     mock_get, middleware, request_factory, cat_api_endpoint_with_apikey
 ):
@@ -147,6 +148,7 @@ def test_cat_api_request_with_apikey_in_url(
             }
         ]
     )
+    mock_response.content = mock_response.text.encode()
     mock_get.return_value = mock_response
 
     # Create a request that matches our cat_api_endpoint_with_apikey
@@ -172,13 +174,13 @@ def test_cat_api_request_with_apikey_in_url(
     mock_get.assert_called_once()
     args, kwargs = mock_get.call_args
     assert (
-        args[0]
+        kwargs["url"]
         == "https://api.thecatapi.com/v1/images/search?api_key=ce4e6963-68ed-4df6-9d5a-40fee969ff84"
     )
 
 
 @pytest.mark.django_db
-@patch("gateway.middleware.requests.get")
+@patch("gateway.upstream.requests.Session.request")
 def test_cat_api_request_with_query_params(
     mock_get, middleware, request_factory, cat_api_endpoint
 ):
@@ -205,6 +207,7 @@ def test_cat_api_request_with_query_params(
             }
         ]
     )
+    mock_response.content = mock_response.text.encode()
     mock_get.return_value = mock_response
 
     # Create a request with additional query parameters
@@ -221,13 +224,13 @@ def test_cat_api_request_with_query_params(
     # Verify the external service was called with the correct query parameters
     mock_get.assert_called_once()
     args, kwargs = mock_get.call_args
-    assert args[0] == "https://api.thecatapi.com/v1/images/search"
+    assert kwargs["url"] == "https://api.thecatapi.com/v1/images/search"
     assert kwargs.get("params", {}).get("limit") == "1"
     assert kwargs.get("params", {}).get("size") == "small"
 
 
 @pytest.mark.django_db
-@patch("gateway.middleware.requests.get")
+@patch("gateway.upstream.requests.Session.request")
 def test_cat_api_request_with_apikey_header(
     mock_get, middleware, request_factory, cat_api_endpoint
 ):
@@ -254,6 +257,7 @@ def test_cat_api_request_with_apikey_header(
             }
         ]
     )
+    mock_response.content = mock_response.text.encode()
     mock_get.return_value = mock_response
 
     # Create a request with API key in the header
@@ -271,7 +275,7 @@ def test_cat_api_request_with_apikey_header(
     # Verify the external service was called with the API key in the header
     mock_get.assert_called_once()
     args, kwargs = mock_get.call_args
-    assert args[0] == "https://api.thecatapi.com/v1/images/search"
+    assert kwargs["url"] == "https://api.thecatapi.com/v1/images/search"
     assert (
         kwargs.get("headers", {}).get("X-Api-Key")
         == "ce4e6963-68ed-4df6-9d5a-40fee969ff84"
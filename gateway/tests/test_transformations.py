@@ -0,0 +1,294 @@
+import json
+import pytest
+import requests
+from unittest.mock import patch, MagicMock
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from gateway.middleware import ApiGatewayMiddleware
+from gateway.models import (
+    Domain,
+    ApiEndpoint,
+    RequestTransformation,
+    ResponseTransformation,
+)
+from gateway.routing import route_table
+from gateway.transformations import FieldPath, Template, TransformationPlan
+
+
+def rule(source="", target="", kind="direct", value=None):
+    """An unsaved transformation, plans only read its fields"""
+    return ResponseTransformation(
+        source_field=source,
+        target_field=target,
+        transformation_type=kind,
+        transformation_value=value,
+    )
+
+
+def test_field_path_is_split_once():
+    """Test that parts and list indexes are computed when compiling"""
+    path = FieldPath("data.items.0.name")
+
+    assert path.parts == (
+        ("data", None),
+        ("items", None),
+        ("0", 0),
+        ("name", None),
+    )
+    assert path.get({"data": {"items": [{"name": "Tom"}]}}) == "Tom"
+    assert path.get({"data": {"items": []}}) is None
+
+
+def test_field_path_set_creates_dictionaries():
+    """Test that setting a value creates missing dictionaries"""
+    data = {"a": 1}
+
+    FieldPath("b.c").set(data, 2)
+    FieldPath("a.x").set(data, 3)
+
+    assert data == {"a": 1, "b": {"c": 2}}
+
+
+def test_template_segments():
+    """Test that templates are parsed into literals and fields once"""
+    template = Template("Hello ${user.name}, you are ${missing}!")
+
+    assert len(template.segments) == 5
+    assert (
+        template.render({"user": {"name": "Tom"}}) == "Hello Tom, you are ${missing}!"
+    )
+
+
+def test_direct_template_and_constant_steps():
+    """Test the three transformation types on a dict body"""
+    plan = TransformationPlan(
+        [
+            rule("data.name", "name"),
+            rule(target="greeting", kind="template", value="Hi ${data.name}"),
+            rule(target="source", kind="constant", value="gateway"),
+            rule(target="skipped", kind="template", value=""),
+        ]
+    )
+    body = {"data": {"name": "Tom"}}
+
+    result = plan.apply_to_response(body)
+
+    assert result == {
+        "data": {"name": "Tom"},
+        "name": "Tom",
+        "greeting": "Hi Tom",
+        "source": "gateway",
+    }
+    # The original top level is not modified
+    assert body == {"data": {"name": "Tom"}}
+
+
+def test_list_bodies():
+    """Test that dotted fields with an index address list items"""
+    plan = TransformationPlan(
+        [rule("0.breeds.0.name", "breed_name"), rule("name.first", "ignored")]
+    )
+    body = [{"breeds": [{"name": "Abyssinian"}]}, {"id": 2}]
+
+    result = plan.apply_to_response(body)
+
+    assert result[0]["breed_name"] == "Abyssinian"
+    assert "ignored" not in result[0]
+
+
+def test_empty_plan_is_falsy():
+    assert not TransformationPlan([])
+    assert len(TransformationPlan([rule("a", "b")])) == 1
+
+
+@pytest.mark.django_db
+def test_route_table_compiles_plans():
+    """Test that endpoints in the routing table carry their compiled plans"""
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+    endpoint = ApiEndpoint.objects.create(
+        domain=domain,
+        path="/test",
+        method="POST",
+        target_url="https://example.com/api/test",
+    )
+    RequestTransformation.objects.create(
+        endpoint=endpoint, source_field="q", target_field="query"
+    )
+    ResponseTransformation.objects.create(
+        endpoint=endpoint, source_field="a", target_field="b", is_active=False
+    )
+
+    loaded = route_table.match("example.com", "POST", "/test")
+
+    assert len(loaded.request_plan) == 1
+    assert not loaded.response_plan
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_transformations_need_no_queries(mock_request, settings):
+    """Test that a transformed request runs without touching the database"""
+    settings.GATEWAY_CONFIG_CHECK_INTERVAL_MS = 60000
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+    endpoint = ApiEndpoint.objects.create(
+        domain=domain,
+        path="/test",
+        method="POST",
+        target_url="https://example.com/api/test",
+        log_sample_rate=0.0,
+    )
+    RequestTransformation.objects.create(
+        endpoint=endpoint, source_field="q", target_field="query"
+    )
+    ResponseTransformation.objects.create(
+        endpoint=endpoint,
+        target_field="message",
+        transformation_type="template",
+        transformation_value="Found ${id}",
+    )
+    upstream = requests.Response()
+    upstream.status_code = 200
+    upstream._content = b'{"id": 7}'
+    upstream.headers["Content-Type"] = "application/json"
+    mock_request.return_value = upstream
+    middleware = ApiGatewayMiddleware(MagicMock(return_value=HttpResponse()))
+    route_table.snapshot()
+
+    request = RequestFactory().post(
+        "/test", data={"q": "cats"}, content_type="application/json"
+    )
+    request.META["HTTP_HOST"] = "example.com"
+    with CaptureQueriesContext(connection) as queries:
+        response = middleware._handle_api_gateway_request(request)
+
+    assert len(queries) == 0
+    assert json.loads(response.content) == {"id": 7, "message": "Found 7"}
+    sent = json.loads(mock_request.call_args.kwargs["data"])
+    assert sent == {"q": "cats", "query": "cats"}
+
+
+def test_bracket_paths():
+    """Test that items[*] and items[0] are the same as items.* and items.0"""
+    assert FieldPath("items[*].id").parts == FieldPath("items.*.id").parts
+    assert FieldPath("items[0].id").get({"items": [{"id": 3}]}) == 3
+    assert FieldPath("items[*].id").wildcards == 1
+
+
+def test_wildcard_matches_in_document_order():
+    """Test that a wildcard path is walked over every element"""
+    body = [
+        {"breeds": [{"name": "Bengal"}, {"name": "Siamese"}]},
+        {"breeds": []},
+        {"breeds": [{"name": "Manx"}, {"id": "x"}]},
+    ]
+
+    matches = FieldPath("*.breeds.*.name").matches(body)
+
+    assert matches == [
+        ((0, 0), "Bengal"),
+        ((0, 1), "Siamese"),
+        ((2, 0), "Manx"),
+    ]
+
+
+def test_wildcard_mapping_across_list():
+    """Test that one rule maps a field of every element of a list body"""
+    plan = TransformationPlan([rule("*.breeds.*.name", "*.breeds.*.breed_name")])
+    body = [{"breeds": [{"name": "Bengal"}, {"name": "Manx"}]}, {"breeds": []}]
+
+    result = plan.apply_to_response(body)
+
+    assert [b["breed_name"] for b in result[0]["breeds"]] == ["Bengal", "Manx"]
+    assert result[1] == {"breeds": []}
+
+
+def test_wildcard_collects_into_list():
+    """Test that a target with fewer wildcards collects the matched values"""
+    plan = TransformationPlan(
+        [
+            rule("items[*].id", "ids"),
+            rule("items[*].tags[*]", "items[*].tag_list"),
+        ]
+    )
+    body = {"items": [{"id": 1, "tags": ["a", "b"]}, {"id": 2, "tags": ["c"]}]}
+
+    result = plan.apply_to_response(body)
+
+    assert result["ids"] == [1, 2]
+    assert result["items"][0]["tag_list"] == ["a", "b"]
+    assert result["items"][1]["tag_list"] == ["c"]
+
+
+def test_wildcard_over_dict_values():
+    """Test that a wildcard also matches every value of a dict"""
+    plan = TransformationPlan([rule("sizes.*.w", "sizes.*.width")])
+
+    result = plan.apply_to_response({"sizes": {"small": {"w": 10}, "big": {"w": 90}}})
+
+    assert result["sizes"]["small"]["width"] == 10
+    assert result["sizes"]["big"]["width"] == 90
+
+
+def test_wildcard_constant_and_template():
+    """Test that constant and template rules fill every matched element"""
+    plan = TransformationPlan(
+        [
+            rule(target="*.source", kind="constant", value="thecatapi"),
+            rule(target="*.label", kind="template", value="Cat ${id} (${width}px)"),
+        ]
+    )
+
+    result = plan.apply_to_request([{"id": "a", "width": 500}, {"id": "b"}])
+
+    assert result == [
+        {"id": "a", "width": 500, "source": "thecatapi", "label": "Cat a (500px)"},
+        {"id": "b", "source": "thecatapi", "label": "Cat b (${width}px)"},
+    ]
+
+
+def test_wildcard_target_without_source_bindings_is_ignored():
+    """Test that a target wildcard nothing in the source binds does nothing"""
+    plan = TransformationPlan([rule("name", "*.name")])
+    body = [{"id": 1}]
+
+    assert plan.apply_to_response(body) == [{"id": 1}]
+
+
+@pytest.mark.django_db
+@patch("gateway.upstream.requests.Session.request")
+def test_wildcard_response_transformation(mock_request):
+    """Test a wildcard rule end to end through the middleware"""
+    domain = Domain.objects.create(
+        name="example.com", base_url="https://example.com", is_active=True
+    )
+    endpoint = ApiEndpoint.objects.create(
+        domain=domain,
+        path="/images/search",
+        method="GET",
+        target_url="https://example.com/v1/images/search",
+    )
+    ResponseTransformation.objects.create(
+        endpoint=endpoint, source_field="*.breeds.0.name", target_field="*.breed"
+    )
+    upstream = requests.Response()
+    upstream.status_code = 200
+    upstream._content = json.dumps(
+        [{"id": "a", "breeds": [{"name": "Bengal"}]}, {"id": "b", "breeds": []}]
+    ).encode()
+    upstream.headers["Content-Type"] = "application/json"
+    mock_request.return_value = upstream
+    middleware = ApiGatewayMiddleware(MagicMock(return_value=HttpResponse()))
+
+    request = RequestFactory().get("/images/search")
+    request.META["HTTP_HOST"] = "example.com"
+    response = middleware._handle_api_gateway_request(request)
+
+    body = json.loads(response.content)
+    assert body[0]["breed"] == "Bengal"
+    assert "breed" not in body[1]
@@ -0,0 +1,89 @@
+import pytest
+from rest_framework.test import APIClient
+from gateway.models import Domain
+from gateway.upstream import SessionPool
+
+
+@pytest.fixture
+def domain(db):
+    """Create a test domain"""
+    return Domain.objects.create(
+        name="example.com",
+        base_url="https://example.com",
+        is_active=True,
+        pool_maxsize=4,
+        pool_block=True,
+    )
+
+
+@pytest.mark.django_db
+def test_session_reused_per_domain(domain):
+    """Test that each domain gets one persistent session"""
+    pool = SessionPool()
+    other = Domain.objects.create(name="other.com", base_url="https://other.com")
+
+    session = pool.get(domain)
+    assert pool.get(domain) is session
+    assert pool.get(other) is not session
+    assert pool.get(None) is pool.get(None)
+
+
+@pytest.mark.django_db
+def test_adapter_sized_from_domain(domain):
+    """Test that the adapter pool settings come from the domain"""
+    pool = SessionPool()
+    adapter = pool.get(domain).get_adapter("https://example.com")
+
+    assert adapter._pool_maxsize == 4
+    assert adapter._pool_block is True
+
+
+@pytest.mark.django_db
+def test_session_replaced_when_pool_settings_change(domain):
+    """Test that changing the pool settings creates a new session"""
+    pool = SessionPool()
+    session = pool.get(domain)
+
+    domain.pool_maxsize = 8
+    domain.save()
+
+    new_session = pool.get(domain)
+    assert new_session is not session
+    assert new_session.get_adapter("https://example.com")._pool_maxsize == 8
+
+
+@pytest.mark.django_db
+def test_connections_are_reused(domain, upstream_server):
+    """Test that consecutive requests reuse one keep-alive connection"""
+    pool = SessionPool()
+    session = pool.get(domain)
+
+    for _ in range(3):
+        response = session.get(upstream_server, timeout=5)
+        assert response.status_code == 200
+
+    stats = pool.stats(domain)
+    assert stats == {"requests": 3, "hits": 2, "misses": 1}
+
+
+@pytest.mark.django_db
+def test_upstream_cookies_not_shared(domain, upstream_server):
+    """Test that cookies set by the upstream are not sent on later requests"""
+    pool = SessionPool()
+    session = pool.get(domain)
+
+    session.get(upstream_server, timeout=5)
+    response = session.get(upstream_server, timeout=5)
+
+    assert "Cookie" not in response.json()["headers"]
+    assert len(session.cookies) == 0
+
+
+@pytest.mark.django_db
+def test_pool_stats_api(domain):
+    """Test the pool statistics endpoint of the management API"""
+    client = APIClient()
+    response = client.get(f"/api/v1/domains/{domain.id}/pool_stats/")
+
+    assert response.status_code == 200
+    assert set(response.json()) == {"requests", "hits", "misses"}
@@ -0,0 +1,542 @@
+import copy
+import re
+
+# Placeholders in template transformations, e.g. "${user.name}"
+PLACEHOLDER = re.compile(r"\${(.*?)}")
+# Placeholders of params captured by the endpoint's path template, "${path.id}"
+PATH_PARAM = "path."
+# Bracket steps in a field path, e.g. "items[*]" or "items[0]"
+BRACKET = re.compile(r"\[(\*|\d+)\]")
+# Path part that matches every element of a list or value of a dict
+WILDCARD = "*"
+
+
+def split_path(path):
+    """Split a field path into parts, "items[*].id" becomes items, *, id"""
+    if not path:
+        return []
+    return BRACKET.sub(r".\1", path).split(".")
+
+
+def walk(values, parts):
+    """
+    Follow path parts from every value at once, like FieldPath.matches()
+    without tracking what each wildcard was bound to.
+    """
+    for key, index in parts:
+        matched = []
+        if key == WILDCARD:
+            for current in values:
+                if type(current) is list:
+                    matched.extend(current)
+                elif type(current) is dict:
+                    matched.extend(current.values())
+        else:
+            for current in values:
+                if type(current) is dict:
+                    if key in current:
+                        matched.append(current[key])
+                elif (
+                    type(current) is list and index is not None and index < len(current)
+                ):
+                    matched.append(current[index])
+        values = matched
+    return values
+
+
+def map_elements(elements, source_parts, target_parts):
+    """Copy a field to another field within each element, in one pass"""
+    parents, (last_key, last_index) = target_parts[:-1], target_parts[-1]
+
+    for element in elements:
+        # Read the source value
+        value = element
+        for key, index in source_parts:
+            if type(value) is dict:
+                value = value.get(key)
+            elif type(value) is list and index is not None and index < len(value):
+                value = value[index]
+            else:
+                value = None
+            if value is None:
+                break
+        if value is None or not element:
+            continue
+
+        # Navigate to the parent of the target, creating missing dictionaries
+        current = element
+        for key, index in parents:
+            if type(current) is dict:
+                child = current.get(key)
+                if child is None and key not in current:
+                    child = current[key] = {}
+                current = child
+            elif type(current) is list and index is not None and index < len(current):
+                current = current[index]
+            else:
+                break
+        else:
+            if type(current) is dict:
+                current[last_key] = value
+            elif (
+                type(current) is list
+                and last_index is not None
+                and last_index < len(current)
+            ):
+                current[last_index] = value
+
+
+class FieldPath:
+    """
+    A dotted field path such as "data.items.0.name", split once.
+
+    Each part keeps its list index precomputed, so walking the path on a
+    request doesn't split or parse anything.
+
+    A "*" part (also written "[*]") matches every element of a list or value
+    of a dict. Wildcard paths are walked with matches(), one path step at a
+    time over all candidates, and written with set() given the list indexes
+    or dict keys each wildcard was bound to.
+    """
+
+    __slots__ = ("path", "parts", "wildcards")
+
+    def __init__(self, path):
+        self.path = path
+        self.parts = tuple(
+            (part, int(part) if part.isdigit() else None) for part in split_path(path)
+        )
+        self.wildcards = sum(1 for key, _ in self.parts if key == WILDCARD)
+
+    def get(self, obj):
+        """Get a value from a nested object, None if the path doesn't exist"""
+        if not self.parts or not obj:
+            return None
+
+        current = obj
+        for key, index in self.parts:
+            if isinstance(current, dict) and key in current:
+                current = current[key]
+            elif (
+                isinstance(current, list) and index is not None and index < len(current)
+            ):
+                current = current[index]
+            else:
+                return None
+        return current
+
+    def matches(self, obj, parts=None):
+        """
+        Return a (bindings, value) pair for every value the path matches.
+
+        bindings holds the list index or dict key each wildcard stood for, in
+        order. Values are returned in document order.
+        """
+        frontier = [((), obj)]
+        for key, index in self.parts if parts is None else parts:
+            matched = []
+            if key == WILDCARD:
+                for bindings, current in frontier:
+                    if isinstance(current, list):
+                        matched.extend(
+                            (bindings + (i,), value) for i, value in enumerate(current)
+                        )
+                    elif isinstance(current, dict):
+                        matched.extend(
+                            (bindings + (k,), value) for k, value in current.items()
+                        )
+            else:
+                for bindings, current in frontier:
+                    if isinstance(current, dict) and key in current:
+                        matched.append((bindings, current[key]))
+                    elif (
+                        isinstance(current, list)
+                        and index is not None
+                        and index < len(current)
+                    ):
+                        matched.append((bindings, current[index]))
+            frontier = matched
+        return frontier
+
+    def containers(self, obj):
+        """
+        Return (bindings, element) pairs for the elements the last wildcard
+        of the path matches, the objects a relative value is computed from.
+        """
+        last = max(i for i, (key, _) in enumerate(self.parts) if key == WILDCARD)
+        return self.matches(obj, self.parts[: last + 1])
+
+    def set(self, obj, value, bindings=()):
+        """Set a value in a nested object, creating missing dictionaries"""
+        if not self.parts or not obj:
+            return
+
+        bindings = iter(bindings)
+        current = obj
+        # Navigate to the parent of the field to set
+        for key, index in self.parts[:-1]:
+            if key == WILDCARD:
+                # Follow the element the wildcard was bound to
+                key = index = next(bindings, None)
+                if isinstance(current, dict) and key in current:
+                    current = current[key]
+                elif (
+                    isinstance(current, list)
+                    and isinstance(index, int)
+                    and index < len(current)
+                ):
+                    current = current[index]
+                else:
+                    return
+            elif isinstance(current, dict):
+                if key not in current:
+                    # Create missing dictionaries along the path
+                    current[key] = {}
+                current = current[key]
+            elif (
+                isinstance(current, list) and index is not None and index < len(current)
+            ):
+                current = current[index]
+            else:
+                # Can't navigate further
+                return
+
+        # Set the value on the parent
+        key, index = self.parts[-1]
+        if key == WILDCARD:
+            key = index = next(bindings, None)
+            if not isinstance(index, int):
+                index = None
+        if isinstance(current, dict):
+            current[key] = value
+        elif isinstance(current, list) and index is not None and index < len(current):
+            current[index] = value
+
+
+class Template:
+    """
+    A template transformation value, split into literal text and fields.
+
+    Placeholders whose field is missing are left in the output as written.
+    "${path.<name>}" placeholders take the param the endpoint's path
+    template captured once the template is bound, and otherwise read the
+    field like any other.
+    """
+
+    __slots__ = ("segments", "params")
+
+    def __init__(self, template):
+        segments = []
+        position = 0
+        for match in PLACEHOLDER.finditer(template):
+            if match.start() > position:
+                segments.append(template[position : match.start()])
+            field = match.group(1)
+            param = field[len(PATH_PARAM) :] if field.startswith(PATH_PARAM) else None
+            segments.append((FieldPath(field), match.group(0), param))
+            position = match.end()
+        if position < len(template):
+            segments.append(template[position:])
+        self.segments = tuple(segments)
+        # Names of the path params the placeholders may take
+        self.params = frozenset(
+            segment[2] for segment in segments if not isinstance(segment, str)
+        ) - {None}
+
+    def bind(self, params):
+        """Return the template with the placeholders of params filled in"""
+        segments = []
+        for segment in self.segments:
+            if not isinstance(segment, str) and segment[2] in params:
+                segment = str(params[segment[2]])
+            segments.append(segment)
+        bound = copy.copy(self)
+        bound.segments = tuple(segments)
+        bound.params = frozenset()
+        return bound
+
+    def render(self, obj):
+        pieces = []
+        for segment in self.segments:
+            if isinstance(segment, str):
+                pieces.append(segment)
+            else:
+                field, placeholder, _ = segment
+                value = field.get(obj)
+                pieces.append(placeholder if value is None else str(value))
+        return "".join(pieces)
+
+
+class TransformationStep:
+    """One compiled RequestTransformation or ResponseTransformation"""
+
+    __slots__ = (
+        "kind",
+        "source",
+        "target",
+        "template",
+        "value",
+        "list_item",
+        "wildcard",
+        "element_paths",
+        "per_element",
+    )
+
+    def __init__(self, transformation):
+        self.kind = transformation.transformation_type
+        self.source = FieldPath(transformation.source_field)
+        self.target = FieldPath(transformation.target_field)
+        self.value = transformation.transformation_value
+        # Empty templates are skipped
+        self.template = (
+            Template(self.value) if self.kind == "template" and self.value else None
+        )
+
+        # A dotted source field addresses items of a list body, e.g.
+        # "0.name" reads "name" from the first item. Non-numeric dotted
+        # fields don't apply to list bodies at all.
+        self.list_item = None
+        source_field = transformation.source_field or ""
+        # Rules with a wildcard in either path are applied to every match
+        self.wildcard = bool(self.source.wildcards or self.target.wildcards)
+        self.element_paths = self._element_paths()
+        self.per_element = self._per_element()
+        if "." in source_field:
+            head, rest = source_field.split(".", 1)
+            index = int(head) if head.isdigit() else None
+            self.list_item = (index, FieldPath(rest))
+
+    def bind(self, params):
+        """Return the step with the path params in its template filled in"""
+        if self.template is None or not self.template.params & params.keys():
+            return self
+        bound = copy.copy(self)
+        bound.template = self.template.bind(params)
+        return bound
+
+    def _element_paths(self):
+        """
+        Split a direct wildcard rule whose paths share everything up to the
+        last wildcard, e.g. "*.breeds.0.name" -> "*.breed", into the shared
+        prefix and the paths within each element.
+
+        Such rules copy a field within each matched element, which is done
+        without tracking wildcard bindings. Returns None for other rules.
+        """
+        source, target = self.source.parts, self.target.parts
+        if self.kind != "direct" or not self.source.wildcards:
+            return None
+        if self.source.wildcards != self.target.wildcards:
+            return None
+
+        last = max(i for i, (key, _) in enumerate(source) if key == WILDCARD)
+        prefix = source[: last + 1]
+        if target[: last + 1] != prefix:
+            return None
+        source_rest, target_rest = source[last + 1 :], target[last + 1 :]
+        if not source_rest or not target_rest:
+            return None
+        return prefix, source_rest, target_rest
+
+    def _per_element(self):
+        """
+        Whether a wildcard rule only touches the element of a top-level list
+        its first wildcard matched, e.g. "*.breeds.0.name" -> "*.breed" or
+        a constant for "*.source". Such rules can be applied to the elements
+        of a list one at a time.
+        """
+        if not self.wildcard or self.target.parts[:1] != ((WILDCARD, None),):
+            return False
+        return self.kind != "direct" or self.source.parts[:1] == ((WILDCARD, None),)
+
+    def apply(self, body, transformed_body):
+        """Apply the step to a parsed body"""
+        if self.kind == "direct":
+            # Direct field mapping
+            source_value = self.source.get(body)
+            if source_value is not None:
+                self.target.set(transformed_body, source_value)
+
+        elif self.kind == "template":
+            # Template-based transformation
+            if self.template is not None:
+                self.target.set(transformed_body, self.template.render(body))
+
+        elif self.kind == "constant":
+            # Set a constant value
+            self.target.set(transformed_body, self.value)
+
+    def apply_wildcard(self, body, transformed_body):
+        """
+        Apply a rule with wildcard paths to every element it matches.
+
+        Each source wildcard binds a list index or dict key, and the target's
+        wildcards take the same bindings in order. If the target has fewer
+        wildcards than the source, the values that share the target's
+        bindings are collected into a list, e.g. "items[*].id" -> "ids".
+        Constant and template rules set the target on every element its
+        wildcards match, templates take their fields from that element.
+        """
+        source, target = self.source, self.target
+
+        if self.element_paths is not None:
+            # Elements below the top level are shared with transformed_body
+            prefix, source_rest, target_rest = self.element_paths
+            map_elements(walk([body], prefix), source_rest, target_rest)
+
+        elif self.kind == "direct":
+            if target.wildcards > source.wildcards:
+                # Nothing in the source binds the extra wildcards
+                return
+            matches = [
+                (bindings, value)
+                for bindings, value in source.matches(body)
+                if value is not None
+            ]
+            if target.wildcards == source.wildcards:
+                for bindings, value in matches:
+                    target.set(transformed_body, value, bindings)
+            else:
+                groups = {}
+                for bindings, value in matches:
+                    groups.setdefault(bindings[: target.wildcards], []).append(value)
+                for bindings, values in groups.items():
+                    target.set(transformed_body, values, bindings)
+
+        elif not target.wildcards:
+            # Only the source has wildcards, which these rules don't read
+            self.apply(body, transformed_body)
+
+        elif self.kind == "template":
+            if self.template is not None:
+                for bindings, element in target.containers(transformed_body):
+                    target.set(
+                        transformed_body, self.template.render(element), bindings
+                    )
+
+        elif self.kind == "constant":
+            for bindings, _ in target.containers(transformed_body):
+                target.set(transformed_body, self.value, bindings)
+
+    def apply_to_item(self, item):
+        """Apply a dotted source field step to the list item it addresses"""
+        _, source = self.list_item
+        if isinstance(item, dict):
+            source_value = source.get(item)
+            if source_value is not None:
+                self.target.set(item, source_value)
+
+    def apply_to_list(self, body, transformed_body):
+        """Apply the step to a list body, only dotted source fields do anything"""
+        index, source = self.list_item
+        if index is None or index >= len(body):
+            return
+
+        item = body[index]
+        if not isinstance(item, dict):
+            return
+        source_value = source.get(item)
+        if (
+            source_value is not None
+            and isinstance(transformed_body, list)
+            and index < len(transformed_body)
+        ):
+            if not isinstance(transformed_body[index], dict):
+                transformed_body[index] = {}
+            self.target.set(transformed_body[index], source_value)
+
+
+class TransformationPlan:
+    """
+    The active transformations of one endpoint, compiled once.
+
+    Field paths are pre-split and templates pre-parsed, so applying the plan
+    is only the walk over the data. Plans are built with the routing table
+    and never change; a rule change builds new ones.
+    """
+
+    __slots__ = ("steps", "element_steps")
+
+    def __init__(self, transformations):
+        self.steps = tuple(TransformationStep(t) for t in transformations)
+        self.element_steps = self._element_steps()
+
+    def _element_steps(self):
+        """
+        Return the steps that act on a top-level list response element by
+        element, or None if one of them needs the whole list. Steps that
+        only apply to objects do nothing to a list and are left out.
+        """
+        element_steps = []
+        for step in self.steps:
+            if step.wildcard:
+                if not step.per_element:
+                    return None
+                element_steps.append(step)
+            elif step.list_item is not None:
+                element_steps.append(step)
+        return tuple(element_steps)
+
+    def bind(self, params):
+        """
+        Return the plan for a request whose path template captured params,
+        the plan itself when none of its templates use them
+        """
+        if not params:
+            return self
+        steps = tuple(step.bind(params) for step in self.steps)
+        if all(bound is step for bound, step in zip(steps, self.steps)):
+            return self
+        bound = copy.copy(self)
+        bound.steps = steps
+        bound.element_steps = bound._element_steps()
+        return bound
+
+    @property
+    def streamable(self):
+        """Whether list responses can be transformed one element at a time"""
+        return self.element_steps is not None
+
+    def __bool__(self):
+        return bool(self.steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def apply_to_request(self, body):
+        """Transform a parsed request body"""
+        # Create a copy of the body to transform
+        transformed_body = body.copy() if isinstance(body, dict) else body
+        for step in self.steps:
+            if step.wildcard:
+                step.apply_wildcard(body, transformed_body)
+            else:
+                step.apply(body, transformed_body)
+        return transformed_body
+
+    def apply_to_response(self, body):
+        """Transform a parsed response body"""
+        # Create a copy of the body to transform
+        transformed_body = body.copy() if isinstance(body, dict) else body
+        for step in self.steps:
+            if step.wildcard:
+                step.apply_wildcard(body, transformed_body)
+            elif isinstance(body, list) and step.list_item is not None:
+                step.apply_to_list(body, transformed_body)
+            elif isinstance(body, dict):
+                step.apply(body, transformed_body)
+        return transformed_body
+
+    def apply_to_element(self, index, element):
+        """
+        Transform one element of a top-level list response, with the same
+        result apply_to_response() has on it. Only for streamable plans.
+        """
+        # Wildcard steps see the element as the only one of a list
+        wrapper = [element]
+        for step in self.element_steps:
+            if step.wildcard:
+                step.apply_wildcard(wrapper, wrapper)
+            elif step.list_item[0] == index:
+                step.apply_to_item(wrapper[0])
+        return wrapper[0]
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+def pool_config(domain):
+    """Return the (pool_maxsize, pool_block) settings for a domain"""
+    if domain is None:
+        return (DEFAULT_POOLSIZE, False)
+    return (domain.pool_maxsize, domain.pool_block)
+
+
+def no_cookies_policy():
+    """
+    Cookie policy for clients shared by every user of the gateway.
+
+    Cookies set by one upstream response must never be stored and sent along
+    with the next client's request.
+    """
+    return DefaultCookiePolicy(allowed_domains=[])
+
+
+class SessionPool:
+    """
+    One persistent requests.Session per Domain.
+
+    Reusing the session keeps TCP and TLS connections to the upstream alive
+    between proxied requests. The connection pool of each session is sized
+    from the domain's pool_maxsize and pool_block settings, and the session is
+    replaced when those settings change.
+    """
+
+    # Number of distinct upstream hosts each session keeps a pool for
+    POOL_CONNECTIONS = 10
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Maps a domain id to a (pool config, session) pair
+        self._sessions = {}
+
+    def get(self, domain=None):
+        """Return the session to use for requests to the given domain"""
+        key = domain.pk if domain is not None else None
+        config = pool_config(domain)
+
+        entry = self._sessions.get(key)
+        if entry is not None and entry[0] == config:
+            return entry[1]
+
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None and entry[0] == config:
+                return entry[1]
+
+            session = self._create_session(*config)
+            self._sessions[key] = (config, session)
+
+        if entry is not None:
+            # Pool settings changed, connections in use are closed on release
+            entry[1].close()
+        return session
+
+    def _create_session(self, pool_maxsize, pool_block):
+        session = requests.Session()
+        session.cookies.set_policy(no_cookies_policy())
+
+        adapter = HTTPAdapter(
+            pool_connections=self.POOL_CONNECTIONS,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def stats(self, domain=None):
+        """
+        Return connection reuse counters for the session of a domain.
+
+        A hit is a request that was sent over an existing keep-alive connection,
+        a miss is a request that had to open a new one.
+        """
+        key = domain.pk if domain is not None else None
+        entry = self._sessions.get(key)
+        requests_count = 0
+        connections = 0
+
+        if entry is not None:
+            adapter = entry[1].get_adapter("https://")
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is not None:
+                    requests_count += pool.num_requests
+                    connections += pool.num_connections
+
+        return {
+            "requests": requests_count,
+            "hits": max(requests_count - connections, 0),
+            "misses": connections,
+        }
+
+    def clear(self):
+        """Close every session"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for _, session in sessions:
+            session.close()
+
+
+class AsyncClientPool:
+    """
+    One httpx.AsyncClient per Domain, the async counterpart of SessionPool.
+
+    Clients hold connections that belong to the event loop they were created
+    on, so a client is only reused within the same loop.
+    """
+
+    def __init__(self):
+        # Maps a domain id to a (pool config, loop, client) tuple
+        self._clients = {}
+
+    def get(self, domain=None):
+        """Return the client to use for requests to the given domain"""
+        key = domain.pk if domain is not None else None
+        config = pool_config(domain)
+        loop = asyncio.get_running_loop()
+
+        entry = self._clients.get(key)
+        if entry is not None and entry[0] == config and entry[1] is loop:
+            return entry[2]
+
+        client = self._create_client(*config)
+        self._clients[key] = (config, loop, client)
+
+        if entry is not None and entry[1] is loop:
+            # Pool settings changed, close the old client in the background
+            loop.create_task(entry[2].aclose())
+        return client
+
+    def _create_client(self, pool_maxsize, pool_block):
+        limits = httpx.Limits(
+            max_connections=pool_maxsize if pool_block else None,
+            max_keepalive_connections=pool_maxsize,
+        )
+        # Follow redirects like requests does on the sync path
+        client = httpx.AsyncClient(limits=limits, follow_redirects=True)
+        client.cookies.jar.set_policy(no_cookies_policy())
+        return client
+
+
+session_pool = SessionPool()
+async_client_pool = AsyncClientPool()
@@ -10,6 +10,9 @@ router.register(r"endpoints", views.ApiEndpointViewSet)
 router.register(r"request-transformations", views.RequestTransformationViewSet)
 router.register(r"response-transformations", views.ResponseTransformationViewSet)
 router.register(r"logs", views.ApiLogViewSet)
+router.register(r"upstream-pools", views.UpstreamPoolViewSet)
+router.register(r"upstream-targets", views.UpstreamTargetViewSet)
+router.register(r"breakers", views.CircuitBreakerViewSet, basename="breaker")
 
 app_name = "gateway"
 
@@ -26,6 +29,7 @@ urlpatterns = [
     path("api/v1/", include(router.urls)),
     # Health check endpoint
     path("health/", health_check, name="health_check"),
+    path("health/upstreams/", views.upstream_health, name="upstream_health"),
     # Web interface
     path("", views.dashboard, name="dashboard"),
     path("rules/", views.rules_list, name="rules"),
@@ -16,6 +16,8 @@ from .models import (
     RequestTransformation,
     ResponseTransformation,
     ApiLog,
+    UpstreamPool,
+    UpstreamTarget,
 )
 from .serializers import (
     DomainSerializer,
@@ -23,7 +25,18 @@ from .serializers import (
     RequestTransformationSerializer,
     ResponseTransformationSerializer,
     ApiLogSerializer,
+    UpstreamPoolSerializer,
+    UpstreamTargetSerializer,
 )
+from .admission import admission_control
+from .balancer import load_balancers
+from .breaker import circuit_breakers
+from .cache import response_cache
+from .health import pool_health
+from .hedging import hedges
+from .log_writer import log_writer
+from .retry import retry_budget
+from .upstream import session_pool
 
 
 class DomainViewSet(viewsets.ModelViewSet):
@@ -45,6 +58,18 @@ class DomainViewSet(viewsets.ModelViewSet):
         serializer = ApiEndpointSerializer(endpoints, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=["get"])
+    def pool_stats(self, request, pk=None):
+        """Get upstream connection pool counters for a domain"""
+        domain = self.get_object()
+        return Response(session_pool.stats(domain))
+
+    @action(detail=True, methods=["get"])
+    def concurrency_stats(self, request, pk=None):
+        """Get the in-flight, queue and rejection counters of a domain's limit"""
+        domain = self.get_object()
+        return Response(admission_control.stats("domain", domain))
+
 
 class ApiEndpointViewSet(viewsets.ModelViewSet):
     """
@@ -83,6 +108,28 @@ class ApiEndpointViewSet(viewsets.ModelViewSet):
         serializer = ApiLogSerializer(logs, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=["get"])
+    def concurrency_stats(self, request, pk=None):
+        """Get the in-flight, queue and rejection counters of an endpoint's limit"""
+        endpoint = self.get_object()
+        return Response(admission_control.stats("endpoint", endpoint))
+
+    @action(detail=True, methods=["get"])
+    def hedge_stats(self, request, pk=None):
+        """Get how often an endpoint's requests were hedged and the hedge won"""
+        endpoint = self.get_object()
+        return Response(hedges.stats(endpoint))
+
+    @action(detail=False, methods=["get"])
+    def cache_stats(self, request):
+        """Get the hit and miss counters of the response cache"""
+        return Response(response_cache.stats())
+
+    @action(detail=False, methods=["get"])
+    def retry_budget(self, request):
+        """Get the requests and retries counted against the retry budget"""
+        return Response(retry_budget.stats())
+
 
 class RequestTransformationViewSet(viewsets.ModelViewSet):
     """
@@ -132,6 +179,71 @@ class ResponseTransformationViewSet(viewsets.ModelViewSet):
     ]
 
 
+class UpstreamPoolViewSet(viewsets.ModelViewSet):
+    """
+    API endpoint for managing upstream pools.
+    """
+
+    queryset = UpstreamPool.objects.all().order_by("name")
+    serializer_class = UpstreamPoolSerializer
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    search_fields = ["name", "description"]
+    ordering_fields = ["name", "created_at", "updated_at"]
+
+    @action(detail=True, methods=["get"])
+    def balancer_stats(self, request, pk=None):
+        """Get the requests in flight and latency of every target of a pool"""
+        pool = self.get_object()
+        return Response(load_balancers.stats(pool))
+
+
+class UpstreamTargetViewSet(viewsets.ModelViewSet):
+    """
+    API endpoint for managing the targets of upstream pools.
+    """
+
+    queryset = UpstreamTarget.objects.all().order_by("pool__name", "id")
+    serializer_class = UpstreamTargetSerializer
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    search_fields = ["pool__name", "url"]
+    ordering_fields = ["pool__name", "weight", "created_at", "updated_at"]
+
+
+class CircuitBreakerViewSet(viewsets.ViewSet):
+    """
+    API endpoint for the circuit breakers of the upstream hosts.
+    """
+
+    # Hosts contain dots and a port
+    lookup_value_regex = "[^/]+"
+
+    def list(self, request):
+        """Get the state of every upstream host's circuit breaker"""
+        return Response(circuit_breakers.stats())
+
+    def retrieve(self, request, pk=None):
+        """Get the state of one upstream host's circuit breaker"""
+        breaker = circuit_breakers.find(pk)
+        if breaker is None:
+            return Response(
+                {"detail": "No circuit breaker for this host."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(breaker.stats())
+
+    @action(detail=True, methods=["post"])
+    def reset(self, request, pk=None):
+        """Close a circuit breaker, e.g. after the upstream was fixed"""
+        breaker = circuit_breakers.find(pk)
+        if breaker is None:
+            return Response(
+                {"detail": "No circuit breaker for this host."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        breaker.reset()
+        return Response(breaker.stats())
+
+
 class ApiLogViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for viewing API logs.
@@ -149,6 +261,11 @@ class ApiLogViewSet(viewsets.ReadOnlyModelViewSet):
     ]
     ordering_fields = ["created_at", "execution_time", "response_status"]
 
+    @action(detail=False, methods=["get"])
+    def writer_stats(self, request):
+        """Get the queue depth and counters of the background log writer"""
+        return Response(log_writer.stats())
+
 
 # Web Interface Views
 def dashboard(request):
@@ -170,11 +287,25 @@ def dashboard(request):
         "logs_count": logs_count,
         "recent_endpoints": recent_endpoints,
         "recent_logs": recent_logs,
+        "upstream_pools": pool_health(),
     }
 
     return render(request, "gateway/dashboard.html", context)
 
 
+def upstream_health(request):
+    """
+    Health of the targets of every upstream pool, as seen by this worker.
+
+    The status is "degraded" when a target is out of rotation.
+    """
+    pools = pool_health()
+    degraded = any(pool["available"] < len(pool["targets"]) for pool in pools)
+    return JsonResponse(
+        {"status": "degraded" if degraded else "ok", "upstream_pools": pools}
+    )
+
+
 def rules_list(request):
     endpoints = ApiEndpoint.objects.all().order_by("-updated_at")
 
@@ -217,7 +348,7 @@ def create_rule(request):
             method=method,
             path=path,
             target_url=target_url,
-            timeout=int(timeout),
+            timeout=float(timeout),
             is_active=is_active,
         )
 
@@ -289,7 +420,7 @@ def edit_rule(request, endpoint_id):
         endpoint.method = method
         endpoint.path = path
         endpoint.target_url = target_url
-        endpoint.timeout = int(timeout)
+        endpoint.timeout = float(timeout)
         endpoint.is_active = is_active
         endpoint.save()
 